@@ -1,6 +1,7 @@
-import googlemaps
-import os
-from langchain_community.utilities import GoogleSerperAPIWrapper
+import asyncio
+from .clients import get_gmaps_client, get_serper_client
+from .geo_cache import get_geo_cache
+from .facility_index import get_facility_index
 
 class SearchTools:
     """MCP風格的地圖與搜尋工具，使用 Google Maps API 與 Google Search API 本地查詢地點與網頁資訊"""
@@ -10,13 +11,11 @@ class SearchTools:
         """
         使用 Google Maps API 查詢地點附近的醫療設施。
         輸入應為地名，例如「台北醫院」、「新竹診所」。
+        若有載入本地設施資料（MEDICAL_FACILITIES_PATH），優先由本地空間索引回答。
         """
         try:
-            gmaps_key = os.getenv("GOOGLE_MAPS_API_KEY")
-            if not gmaps_key:
-                return "❌ 未設定 GOOGLE_MAPS_API_KEY"
-
-            gmaps = googlemaps.Client(key=gmaps_key)
+            # 共用的 client 與連線池，不再每次重新建立
+            gmaps = get_gmaps_client()
 
             # 預設搜尋類別
             search_type = 'hospital'
@@ -33,21 +32,50 @@ class SearchTools:
                 keyword = keyword.replace(word, '')
             keyword = keyword.strip()
 
-            # 地理編碼
-            geocode = gmaps.geocode(keyword, language='zh-TW')
-            if not geocode:
-                return f"❌ 找不到「{keyword}」這個地點"
+            geo_cache = get_geo_cache()
+
+            # 地理編碼（先查快取）
+            latlng = geo_cache.get_latlng(keyword)
+            if latlng is None:
+                if gmaps is None:
+                    return "❌ 未設定 GOOGLE_MAPS_API_KEY"
+                geocode = gmaps.geocode(keyword, language='zh-TW')
+                if not geocode:
+                    return f"❌ 找不到「{keyword}」這個地點"
 
-            loc = geocode[0]['geometry']['location']
-            latlng = (loc['lat'], loc['lng'])
+                loc = geocode[0]['geometry']['location']
+                latlng = (loc['lat'], loc['lng'])
+                geo_cache.set_latlng(keyword, latlng)
 
-            # 查詢附近地點
-            results = gmaps.places_nearby(
-                location=latlng,
-                radius=3000,
-                type=search_type,
-                language='zh-TW'
-            ).get('results', [])
+            # 第一層：本地設施空間索引
+            results = None
+            facility_index = get_facility_index()
+            if facility_index is not None:
+                nearby = facility_index.within_radius(latlng, search_type, 3000)
+                if nearby:
+                    results = [
+                        {"name": f["name"], "vicinity": f["address"], **({"rating": f["rating"]} if f["rating"] is not None else {})}
+                        for f in nearby
+                    ]
+
+            # 第二層：Google Places（鄰近座標共用同一個 geohash 快取）
+            if results is None:
+                results = geo_cache.get_places(latlng, search_type, 3000)
+            if results is None:
+                if gmaps is None:
+                    return "❌ 未設定 GOOGLE_MAPS_API_KEY"
+                results = gmaps.places_nearby(
+                    location=latlng,
+                    radius=3000,
+                    type=search_type,
+                    language='zh-TW'
+                ).get('results', [])
+                # 只保留回覆需要的欄位，減少快取大小
+                results = [
+                    {key: place[key] for key in ('name', 'vicinity', 'rating', 'geometry', 'place_id') if key in place}
+                    for place in results
+                ]
+                geo_cache.set_places(latlng, search_type, 3000, results)
 
             if not results:
                 return f"❗在「{keyword}」附近找不到相關醫療設施"
@@ -71,8 +99,27 @@ class SearchTools:
         使用 Google Search 查詢網頁資訊，回傳摘要結果。
         """
         try:
-            G_serper = GoogleSerperAPIWrapper(gl='tw', hl='zh-tw', type='search', k=10)
+            G_serper = get_serper_client()
             result = G_serper.run(input)
             return f"🔍 Google 搜尋結果如下：\n\n{result}"
         except Exception as e:
-            return f"❌ Google 搜尋錯誤：{str(e)}"
\ No newline at end of file
+            return f"❌ Google 搜尋錯誤：{str(e)}"
+
+    @staticmethod
+    async def aGoogle_Map(input: str) -> str:
+        """
+        Google_Map 的非同步版本。googlemaps 沒有非同步 client，改在執行緒中執行，避免阻塞事件迴圈。
+        """
+        return await asyncio.to_thread(SearchTools.Google_Map, input)
+
+    @staticmethod
+    async def aGoogle_Search(input: str) -> str:
+        """
+        Google_Search 的非同步版本，透過目前 event loop 共用的 aiohttp session 查詢。
+        """
+        try:
+            G_serper = get_serper_client()
+            result = await G_serper.arun(input)
+            return f"🔍 Google 搜尋結果如下：\n\n{result}"
+        except Exception as e:
+            return f"❌ Google 搜尋錯誤：{str(e)}"
@@ -1,37 +1,59 @@
 """準備棄用, 之後會用langgrpah替代"""
-from .llm import llm_GPT, llm_gemini
-from .graph import graph
+import asyncio
+import logging
+import os
+import time
+_import_started = time.perf_counter()
+from .components import lazy_component, check_import_budget
+from .llm import get_llm_gemini, get_embeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.schema import StrOutputParser
 from langchain_core.tools import Tool
-from langchain_community.chat_message_histories import Neo4jChatMessageHistory
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain import hub
 from langchain_core.prompts import PromptTemplate
-from .research import graph_rag
+from langchain_core.messages import HumanMessage, AIMessage
+from .research import NO_ANSWER, graph_rag, agraph_rag
 from .SearchTool import SearchTools
+from .response_cache import create_response_cache, is_cacheable
+from .history_compressor import CompressedChatMessageHistory, PromptTokenCounter
+from .neo4j_history import BatchedNeo4jChatMessageHistory
+from .neo4j_pool import NEO4J_DATABASE, get_driver
+
+logger = logging.getLogger(__name__)
+
+# 從 Neo4j 讀取的最近對話輪數；超出 HISTORY_TOKEN_BUDGET 的部分會被壓縮成摘要
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "20"))
 
 tools = [
     Tool.from_function(
         name="Medical Graph rag",
         description="you MUST use this tool when user ask medical question",
         func=graph_rag,
+        coroutine=agraph_rag,
     ),
     Tool.from_function(
         name="Google Search",
         description="use this tool when other tool can't find the answer. If you use this tool, you're allowed to use your pre-trained knowledge to combine the answer",
         func=SearchTools.Google_Search,
+        coroutine=SearchTools.aGoogle_Search,
     ),
     Tool.from_function(
         name="Google Map Search",
         description="Use this tool to search for nearby hospitals or clinics using Google Maps.",
-        func=SearchTools.Google_Map
+        func=SearchTools.Google_Map,
+        coroutine=SearchTools.aGoogle_Map,
     ),
 ]
 
 def get_memory(session_id):
-    return Neo4jChatMessageHistory(session_id=session_id, graph=graph, window=20)
+    base = BatchedNeo4jChatMessageHistory(session_id, get_driver(), database=NEO4J_DATABASE, window=HISTORY_WINDOW)
+    return CompressedChatMessageHistory(base, session_id)
+
+
+def _agent_config(session_id):
+    """每個請求使用新的 token 計數器，記錄各次 LLM 呼叫的 prompt 大小"""
+    return {"configurable": {"session_id": session_id}, "callbacks": [PromptTokenCounter(session_id)]}
 
 agent_prompt = PromptTemplate.from_template("""
 You are a medical expert providing information about medical knowledge.
@@ -89,25 +111,50 @@ Previous conversation history:
 New input: {input}
 {agent_scratchpad}
 """)
-agent = create_react_agent(llm_gemini, tools, agent_prompt)
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True
+
+@lazy_component("chat_agent")
+def get_chat_agent():
+    """建立 ReAct Agent 與對話記憶包裝（第一次使用時才建立 LLM client）"""
+    agent = create_react_agent(get_llm_gemini(), tools, agent_prompt)
+    agent_executor = AgentExecutor(
+        agent=agent,
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True
+        )
+
+    return RunnableWithMessageHistory(
+        agent_executor,
+        get_memory,
+        input_messages_key="input",
+        history_messages_key="chat_history",
     )
 
-chat_agent = RunnableWithMessageHistory(
-    agent_executor,
-    get_memory,
-    input_messages_key="input",
-    history_messages_key="chat_history",
+# 語意回應快取：相近的常見問題直接回傳，不再執行 Agent
+@lazy_component("response_cache")
+def get_response_cache():
+    return create_response_cache(get_embeddings())
+
+
+# 失敗或沒有答案的輸出不寫入語意快取，避免相近問題在 TTL 內都拿到同樣的失敗回應
+_NO_ANSWER_MARKERS = (
+    NO_ANSWER,
+    "I do not know the answer",
+    "Agent stopped due to",  # AgentExecutor 超過迭代或時間上限
+    "（未取得 AI 回應）",
+    "AI 回應失敗",
 )
 
-# 修改 ai_agent.py 中的 generate_response 函數結尾部分
 
-def generate_response(user_input, session_id="default", location_info=None):
-    # 準備輸入資料
+def _should_store(response, result):
+    if not isinstance(response, dict):
+        return False
+    output = (result.get("output") or "").strip()
+    return bool(output) and not any(marker in output for marker in _NO_ANSWER_MARKERS)
+
+
+def _build_input_text(user_input, location_info=None):
+    """準備輸入資料（附加位置信息）"""
     input_text = user_input.strip()
     if location_info and "位置信息" not in input_text:
         input_text += (
@@ -116,23 +163,11 @@ def generate_response(user_input, session_id="default", location_info=None):
             f"\n- 地址：{location_info.get('address', '未知')}"
             f"\n- 座標：{location_info.get('coordinates', '未知')}"
         )
+    return input_text
 
-    input_data = {"input": input_text}
 
-    # 呼叫 Agent
-    try:
-        response = chat_agent.invoke(
-            input_data,
-            {"configurable": {"session_id": session_id}},
-        )
-    except Exception as e:
-        return {
-            "output": f"AI 回應失敗：{str(e)}",
-            "location": location_info,
-            "data": {}
-        }
-
-    # 統一解析輸出格式
+def _format_response(response, location_info=None):
+    """統一解析 Agent 輸出格式"""
     if isinstance(response, dict):
         # 獲取輸出文本
         output_text = response.get("output", "（未取得 AI 回應）")
@@ -165,4 +200,180 @@ def generate_response(user_input, session_id="default", location_info=None):
             "is_markdown": True,  # 明確標記為Markdown
             "location": location_info,
             "data": {}
-        }
\ No newline at end of file
+        }
+
+
+def generate_response(user_input, session_id="default", location_info=None):
+    # 準備輸入資料
+    input_text = _build_input_text(user_input, location_info)
+    input_data = {"input": input_text}
+
+    # 查詢語意快取（排除地點與會話相關問題）
+    cacheable = is_cacheable(input_text, location_info)
+    if cacheable:
+        try:
+            cached = get_response_cache().lookup(input_text)
+        except Exception as e:
+            cached = None
+            logger.warning(f"語意快取查詢失敗：{e}")
+        if cached is not None:
+            # 仍寫入對話記憶，讓後續追問能看到這一輪
+            get_memory(session_id).add_messages([
+                HumanMessage(content=input_text),
+                AIMessage(content=cached["output"]),
+            ])
+            return dict(cached, location=location_info)
+
+    # 呼叫 Agent
+    try:
+        response = get_chat_agent().invoke(
+            input_data,
+            _agent_config(session_id),
+        )
+    except Exception as e:
+        return {
+            "output": f"AI 回應失敗：{str(e)}",
+            "location": location_info,
+            "data": {}
+        }
+
+    result = _format_response(response, location_info)
+    if cacheable and _should_store(response, result):
+        try:
+            get_response_cache().store(input_text, result)
+        except Exception as e:
+            logger.warning(f"語意快取寫入失敗：{e}")
+    return result
+
+
+async def _alookup_cache(input_text, session_id, location_info):
+    """非同步查詢語意快取；命中時同時寫入對話記憶（embedding 為同步 HTTP 呼叫，移到執行緒中）"""
+    try:
+        cached = await asyncio.to_thread(get_response_cache().lookup, input_text)
+    except Exception as e:
+        logger.warning(f"語意快取查詢失敗：{e}")
+        return None
+    if cached is not None:
+        # get_memory 第一次呼叫時會同步連線 Neo4j，不在 event loop 中執行
+        memory = await asyncio.to_thread(get_memory, session_id)
+        await memory.aadd_messages([
+            HumanMessage(content=input_text),
+            AIMessage(content=cached["output"]),
+        ])
+        return dict(cached, location=location_info)
+    return None
+
+
+async def _astore_cache(input_text, result):
+    try:
+        await asyncio.to_thread(get_response_cache().store, input_text, result)
+    except Exception as e:
+        logger.warning(f"語意快取寫入失敗：{e}")
+
+
+async def agenerate_response(user_input, session_id="default", location_info=None):
+    """generate_response 的非同步版本，供 ASGI 的 async view 使用，等待 LLM/工具時不佔用 worker"""
+    input_text = _build_input_text(user_input, location_info)
+    input_data = {"input": input_text}
+
+    # 查詢語意快取（排除地點與會話相關問題）
+    cacheable = is_cacheable(input_text, location_info)
+    if cacheable:
+        cached = await _alookup_cache(input_text, session_id, location_info)
+        if cached is not None:
+            return cached
+
+    # 呼叫 Agent
+    try:
+        response = await get_chat_agent().ainvoke(
+            input_data,
+            _agent_config(session_id),
+        )
+    except Exception as e:
+        return {
+            "output": f"AI 回應失敗：{str(e)}",
+            "location": location_info,
+            "data": {}
+        }
+
+    result = _format_response(response, location_info)
+    if cacheable and _should_store(response, result):
+        await _astore_cache(input_text, result)
+    return result
+
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+TOOL_STATUS = {
+    "Medical Graph rag": "正在查詢醫療知識圖譜…",
+    "Google Search": "正在搜尋網路資料…",
+    "Google Map Search": "正在搜尋附近的醫療設施…",
+}
+
+
+async def astream_response(user_input, session_id="default", location_info=None):
+    """
+    串流版本的回應產生器，依序產出事件：
+    - {"type": "status", "tool": ..., "message": ...}：Agent 開始使用工具
+    - {"type": "token", "content": ...}：Final Answer 的文字片段
+    - {"type": "done", "output": ..., "location": ..., "data": ...}：完整回應（與 generate_response 相同格式）
+    - {"type": "error", "output": ...}：發生錯誤
+    """
+    input_text = _build_input_text(user_input, location_info)
+    input_data = {"input": input_text}
+
+    cacheable = is_cacheable(input_text, location_info)
+    if cacheable:
+        cached = await _alookup_cache(input_text, session_id, location_info)
+        if cached is not None:
+            yield {"type": "token", "content": cached["output"]}
+            yield dict(cached, type="done")
+            return
+
+    # ReAct 的 LLM 輸出包含 Thought/Action，只轉送 "Final Answer:" 之後的文字
+    llm_buffer = ""
+    answer_started = False
+    response = None
+    try:
+        async for event in get_chat_agent().astream_events(
+            input_data,
+            _agent_config(session_id),
+            version="v2",
+        ):
+            kind = event["event"]
+            if kind == "on_chat_model_start":
+                llm_buffer = ""
+                answer_started = False
+            elif kind == "on_chat_model_stream":
+                delta = event["data"]["chunk"].content
+                if not isinstance(delta, str) or not delta:
+                    continue
+                if answer_started:
+                    yield {"type": "token", "content": delta}
+                    continue
+                llm_buffer += delta
+                marker_pos = llm_buffer.find(FINAL_ANSWER_MARKER)
+                if marker_pos != -1:
+                    answer_started = True
+                    head = llm_buffer[marker_pos + len(FINAL_ANSWER_MARKER):].lstrip()
+                    if head:
+                        yield {"type": "token", "content": head}
+            elif kind == "on_tool_start":
+                yield {
+                    "type": "status",
+                    "tool": event["name"],
+                    "message": TOOL_STATUS.get(event["name"], f"正在使用工具：{event['name']}…"),
+                }
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                response = event["data"].get("output")
+    except Exception as e:
+        yield {"type": "error", "output": f"AI 回應失敗：{str(e)}", "location": location_info, "data": {}}
+        return
+
+    result = _format_response(response if response is not None else {}, location_info)
+    if cacheable and _should_store(response, result):
+        await _astore_cache(input_text, result)
+    yield dict(result, type="done")
+
+
+check_import_budget(__name__, _import_started)
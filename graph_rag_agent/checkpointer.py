@@ -0,0 +1,151 @@
+"""LangGraph 對話狀態的持久化 checkpointer：SQLite 儲存、閒置 thread 過期淘汰、舊 checkpoint 壓縮"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from .components import lazy_component
+
+logger = logging.getLogger(__name__)
+
+# 設為 ":memory:" 可只保存在行程內（測試用）
+CHECKPOINT_PATH = os.getenv(
+    "LANGGRAPH_CHECKPOINT_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "checkpoints.sqlite3"),
+)
+THREAD_TTL = int(os.getenv("LANGGRAPH_THREAD_TTL", str(7 * 24 * 3600)))  # 閒置超過此秒數的 thread 會被刪除
+CHECKPOINTS_PER_THREAD = int(os.getenv("LANGGRAPH_CHECKPOINTS_PER_THREAD", "3"))  # 每個 thread 保留的最新 checkpoint 數
+MAINTENANCE_INTERVAL = int(os.getenv("LANGGRAPH_MAINTENANCE_INTERVAL", "600"))  # 兩次維護之間的最短秒數
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver 加上容量控制：
+    - thread_activity 表記錄每個 thread 最後寫入時間，閒置超過 ttl 的 thread 整個刪除
+    - 每個 thread 只保留最新 keep_checkpoints 個 checkpoint 及其 writes
+    維護工作在寫入時依 maintenance_interval 節流執行，也可直接呼叫 maintain()。
+    SqliteSaver 只有同步介面，非同步方法以 asyncio.to_thread 轉接。
+    """
+
+    def __init__(self, conn, *, ttl=THREAD_TTL, keep_checkpoints=CHECKPOINTS_PER_THREAD,
+                 maintenance_interval=MAINTENANCE_INTERVAL, serde=None):
+        super().__init__(conn, serde=serde)
+        self.ttl = ttl
+        self.keep_checkpoints = keep_checkpoints
+        self.maintenance_interval = maintenance_interval
+        self._last_maintenance = time.monotonic()
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_last_seen_idx ON thread_activity (last_seen);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (str(config["configurable"]["thread_id"]), time.time()),
+            )
+        if time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+            self.maintain()
+        return next_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def evict_idle_threads(self) -> int:
+        """刪除閒置超過 ttl 的 thread，回傳刪除數量"""
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE last_seen < ?", (time.time() - self.ttl,))
+            thread_ids = [row[0] for row in cur.fetchall()]
+        for thread_id in thread_ids:
+            self.delete_thread(thread_id)
+        return len(thread_ids)
+
+    def compact(self) -> int:
+        """每個 thread 只保留最新的 checkpoint（checkpoint_id 為時間排序的 uuid6），回傳刪除數量"""
+        with self.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS rank
+                        FROM checkpoints
+                    ) WHERE rank > ?
+                )
+                """,
+                (self.keep_checkpoints,),
+            )
+            deleted = cur.rowcount
+            # 清除已不存在的 checkpoint 所留下的 writes
+            cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+        return deleted
+
+    def maintain(self) -> dict:
+        """執行過期淘汰與壓縮；釋放的頁面會被後續寫入重複使用，檔案大小維持穩定"""
+        self._last_maintenance = time.monotonic()
+        try:
+            report = {"evicted_threads": self.evict_idle_threads(), "compacted_checkpoints": self.compact()}
+        except sqlite3.Error:
+            logger.exception("checkpoint 維護失敗")
+            return {}
+        logger.info(f"checkpoint 維護完成：{report}")
+        return report
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+@lazy_component("checkpointer")
+def get_checkpointer() -> BoundedSqliteSaver:
+    """行程內共用的 checkpointer；多個 worker 透過同一個 SQLite 檔案（WAL 模式）共享對話狀態"""
+    if CHECKPOINT_PATH != ":memory:":
+        os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    conn = sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False, timeout=30)
+    saver = BoundedSqliteSaver(conn)
+    saver.maintain()
+    return saver
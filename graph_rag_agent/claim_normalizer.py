@@ -0,0 +1,233 @@
+"""
+事實查核前的聲明正規化與近似重複偵測：
+使用者以不同寫法（空白、標點、全形/半形、簡體/繁體）送出的同一則謠言，
+先對應到同一個 claim id，作為 Cofacts / Google Fact Check 查詢的快取與去重鍵，讓下游快取命中。
+送往遠端 API 的一律是使用者自己的文字；只有正規化後完全相同時才沿用先前的寫法。
+
+- normalize_claim：NFKC、轉小寫、去除空白與標點，安裝 opencc 時簡轉繁
+- minhash：字元 n-gram 的 MinHash 簽章
+- ClaimRegistry：以 LSH 分段（band）找出候選，n-gram Jaccard 相似度達門檻、
+  且否定詞一致時才視為同一則聲明
+"""
+import hashlib
+import logging
+import os
+import random
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# 謠言多為一兩句話，bigram 比 trigram 更能容忍插入或替換一兩個字
+NGRAM_SIZE = int(os.getenv("CLAIM_NGRAM_SIZE", "2"))
+NUM_PERM = 64
+# 16 段各 4 列：Jaccard 0.6 的兩則聲明成為候選的機率約 88%，0.3 以下約 12%
+LSH_BANDS = int(os.getenv("CLAIM_LSH_BANDS", "16"))
+# 例：「常吃可長壽」/「常吃可以長壽」約 0.77，「吃香蕉」/「吃芭樂可以預防中風」約 0.45
+MIN_JACCARD = float(os.getenv("CLAIM_MIN_JACCARD", "0.6"))
+# 太短的聲明 n-gram 太少，相似度不穩定，只做完全比對
+MIN_NEAR_DUPLICATE_LENGTH = int(os.getenv("CLAIM_MIN_LENGTH", "8"))
+REGISTRY_SIZE = int(os.getenv("CLAIM_REGISTRY_SIZE", "50000"))
+# 「疫苗不會導致自閉症」與「疫苗會導致自閉症」的 bigram Jaccard 約 0.67，只差在否定詞
+NEGATION_CHARS = frozenset("不沒没非無无未")
+MAX_ALIASES = 32  # 每個 claim 最多記住幾種寫法供完全比對，避免熱門謠言的變體無限累積
+CONVERT_TO_TRADITIONAL = os.getenv("CLAIM_CONVERT_TO_TRADITIONAL", "true").lower() == "true"
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def _to_traditional(text: str) -> str:
+    """以 opencc 簡轉繁；未安裝 opencc 時原樣回傳"""
+    global _converter
+    if not CONVERT_TO_TRADITIONAL:
+        return text
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                try:
+                    from opencc import OpenCC
+                    _converter = OpenCC("s2t")
+                except Exception as e:
+                    logger.warning(f"無法載入 opencc，不進行簡繁轉換：{e}")
+                    _converter = False
+    if _converter is False:
+        return text
+    return _converter.convert(text)
+
+
+def normalize_claim(text: str) -> str:
+    """比對用的正規化文字（不送往遠端 API）"""
+    text = _to_traditional(unicodedata.normalize("NFKC", text or "")).lower()
+    # 去除所有空白、標點（P*）與符號（S*），例如「！」「~」「⋯」、emoji
+    return "".join(ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in "PS")
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)  # 固定種子：同一份設定下簽章可重現
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def ngrams(normalized: str, n: int = NGRAM_SIZE) -> frozenset:
+    """字元 n-gram 集合（輸入為 normalize_claim 的結果）"""
+    if len(normalized) <= n:
+        return frozenset([normalized])
+    return frozenset(normalized[i:i + n] for i in range(len(normalized) - n + 1))
+
+
+def minhash(grams) -> tuple:
+    """n-gram 集合的 MinHash 簽章（NUM_PERM 個值）"""
+    values = [_hash64(gram) for gram in grams]
+    return tuple(min((a * x + b) % _PRIME for x in values) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a, b) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def negations(normalized: str) -> frozenset:
+    """聲明中出現的否定字"""
+    return NEGATION_CHARS.intersection(normalized)
+
+
+def _bands(signature, bands: int = LSH_BANDS):
+    rows = len(signature) // bands
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(bands)]
+
+
+@dataclass(frozen=True)
+class ClaimMatch:
+    claim_id: str  # 快取與去重用的鍵；空白聲明為空字串
+    text: str  # 送往遠端 API 的文字：使用者的原文，正規化後與既有 claim 完全相同時為該 claim 的寫法
+    similarity: float  # 與 canonical claim 的 n-gram Jaccard 相似度，1.0 表示正規化後完全相同
+
+    @property
+    def key(self):
+        return self.claim_id or self.text
+
+
+class ClaimRegistry:
+    """記錄已見過的 canonical claim（LRU，最多 maxsize 筆），將新聲明對應到既有的 claim id"""
+
+    def __init__(self, maxsize=REGISTRY_SIZE, min_jaccard=MIN_JACCARD, bands=LSH_BANDS):
+        self.maxsize = maxsize
+        self.min_jaccard = min_jaccard
+        self.bands = bands
+        self._claims = OrderedDict()  # claim id -> (原始文字, n-gram 集合, MinHash 簽章, 否定字)
+        self._exact = {}  # 正規化文字 -> claim id
+        self._aliases = {}  # claim id -> 對應到此 claim 的正規化文字，淘汰時一併移除
+        self._buckets = {}  # (band, 值) -> set(claim id)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _find_near(self, grams, signature, negation):
+        """LSH 候選中否定字相同、Jaccard 最高且達門檻者"""
+        candidates = set()
+        for key in _bands(signature, self.bands):
+            candidates.update(self._buckets.get(key, ()))
+        best_id, best_similarity = None, self.min_jaccard
+        # 依 claim id 排序，同分時的結果不受 set 迭代順序影響
+        for claim_id in sorted(candidates):
+            _, claim_grams, _, claim_negation = self._claims[claim_id]
+            if claim_negation != negation:
+                continue
+            similarity = jaccard(grams, claim_grams)
+            if similarity >= best_similarity:
+                best_id, best_similarity = claim_id, similarity
+        return best_id, best_similarity
+
+    def _add(self, text, normalized, grams, signature):
+        claim_id = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+        self._claims[claim_id] = (text, grams, signature, negations(normalized))
+        self._exact[normalized] = claim_id
+        self._aliases[claim_id] = [normalized]
+        if len(normalized) >= MIN_NEAR_DUPLICATE_LENGTH:
+            for key in _bands(signature, self.bands):
+                self._buckets.setdefault(key, set()).add(claim_id)
+        while len(self._claims) > self.maxsize:
+            self._evict()
+        return claim_id
+
+    def _evict(self):
+        claim_id, (_, _, signature, _) = self._claims.popitem(last=False)
+        for normalized in self._aliases.pop(claim_id):
+            self._exact.pop(normalized, None)
+        for key in _bands(signature, self.bands):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(claim_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def match(self, text: str) -> ClaimMatch:
+        normalized = normalize_claim(text)
+        if not normalized:
+            return ClaimMatch("", text, 1.0)
+        with self._lock:
+            claim_id = self._exact.get(normalized)
+            if claim_id is not None:
+                self._claims.move_to_end(claim_id)
+                self.exact_hits += 1
+                return ClaimMatch(claim_id, self._claims[claim_id][0], 1.0)
+
+            grams = ngrams(normalized)
+            signature = minhash(grams)
+            if len(normalized) >= MIN_NEAR_DUPLICATE_LENGTH:
+                claim_id, similarity = self._find_near(grams, signature, negations(normalized))
+                if claim_id is not None:
+                    self._claims.move_to_end(claim_id)
+                    # 之後相同寫法直接走完全比對
+                    if len(self._aliases[claim_id]) < MAX_ALIASES:
+                        self._exact[normalized] = claim_id
+                        self._aliases[claim_id].append(normalized)
+                    self.near_hits += 1
+                    # 近似重複只共用快取鍵，查詢仍送出使用者自己的文字
+                    return ClaimMatch(claim_id, text, similarity)
+
+            self.misses += 1
+            return ClaimMatch(self._add(text, normalized, grams, signature), text, 1.0)
+
+    def stats(self):
+        with self._lock:
+            total = self.exact_hits + self.near_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "dedup_rate": (self.exact_hits + self.near_hits) / total if total else 0.0,
+                "claims": len(self._claims),
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_claim_registry() -> ClaimRegistry:
+    """取得行程內共用的 ClaimRegistry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClaimRegistry()
+        return _registry
+
+
+def match_claim(text: str) -> ClaimMatch:
+    """以共用的 ClaimRegistry 取得 text 的 claim id 與送往遠端 API 的文字"""
+    return get_claim_registry().match(text)
+
+
+def unique_claims(claims):
+    """依 claim id 去重，保留每個 claim 第一次出現的 ClaimMatch（維持原本順序）"""
+    first = {}
+    for claim in claims:
+        first.setdefault(claim.key, claim)
+    return list(first.values())
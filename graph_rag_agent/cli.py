@@ -0,0 +1,33 @@
+"""多代理流程的互動式命令列：python -m graph_rag_agent.cli [--thread-id ID]"""
+import argparse
+import asyncio
+import uuid
+
+from .multi_agent import ainvoke
+
+
+async def repl(thread_id: str) -> None:
+    print(f"對話 thread_id：{thread_id}（輸入 exit 離開）")
+    while True:
+        try:
+            question = input("輸入你的問題: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if not question:
+            continue
+        if question.lower() in ("exit", "quit"):
+            break
+        result = await ainvoke(question, thread_id)
+        for m in result["messages"]:
+            m.pretty_print()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="GraphRAG + 事實查核多代理對話")
+    parser.add_argument("--thread-id", default=None, help="沿用既有對話的 thread_id（預設建立新對話）")
+    args = parser.parse_args(argv)
+    asyncio.run(repl(args.thread_id or str(uuid.uuid4())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""工具用外部 API client 的共用註冊表：每個行程只建立一次，並共用具連線池的 HTTP session"""
+import asyncio
+import os
+import threading
+import weakref
+
+import aiohttp
+import googlemaps
+import requests
+from langchain_community.utilities import GoogleSerperAPIWrapper
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 連線池與逾時設定（可由環境變數調整）
+HTTP_POOL_CONNECTIONS = int(os.getenv("TOOL_HTTP_POOL_CONNECTIONS", "10"))  # 不同主機的連線池數量
+HTTP_POOL_MAXSIZE = int(os.getenv("TOOL_HTTP_POOL_MAXSIZE", "32"))  # 每個主機保留的 keep-alive 連線數
+HTTP_MAX_RETRIES = int(os.getenv("TOOL_HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("TOOL_HTTP_BACKOFF_FACTOR", "0.3"))
+
+GOOGLE_MAPS_TIMEOUT = float(os.getenv("GOOGLE_MAPS_TIMEOUT", "5"))
+GOOGLE_MAPS_RETRY_TIMEOUT = float(os.getenv("GOOGLE_MAPS_RETRY_TIMEOUT", "10"))
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "10"))
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _create_http_session(retries=True):
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+    ) if retries else 0
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """共用的 requests.Session（keep-alive 連線池 + 重試）"""
+    return _get_or_create("http_session", _create_http_session)
+
+
+def get_gmaps_http_session() -> requests.Session:
+    """
+    googlemaps.Client 專用的 session（連線池，不重試）：
+    googlemaps 已在 retry_timeout 內自行重試 5xx 與 OVER_QUERY_LIMIT，
+    若再由 urllib3 重試，每次失敗會被放大成多次請求
+    """
+    return _get_or_create("gmaps_http_session", lambda: _create_http_session(retries=False))
+
+
+# aiohttp.ClientSession 綁定建立時的 event loop，因此每個 loop 各保留一個
+_aiohttp_sessions = weakref.WeakKeyDictionary()
+_aiohttp_lock = threading.Lock()
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """目前 event loop 共用的 aiohttp.ClientSession（keep-alive 連線池）"""
+    loop = asyncio.get_running_loop()
+    with _aiohttp_lock:
+        session = _aiohttp_sessions.get(loop)
+        if session is None or session.closed:
+            session = _aiohttp_sessions[loop] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_POOL_MAXSIZE),
+                timeout=aiohttp.ClientTimeout(total=SERPER_TIMEOUT),
+            )
+        return session
+
+
+async def aclose_aiohttp_session():
+    """關閉目前 event loop 的 aiohttp session（應用程式關閉時呼叫）"""
+    with _aiohttp_lock:
+        session = _aiohttp_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def get_gmaps_client():
+    """共用的 googlemaps.Client；未設定 GOOGLE_MAPS_API_KEY 時回傳 None"""
+    gmaps_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    if not gmaps_key:
+        return None
+    return _get_or_create("gmaps", lambda: googlemaps.Client(
+        key=gmaps_key,
+        timeout=GOOGLE_MAPS_TIMEOUT,
+        retry_timeout=GOOGLE_MAPS_RETRY_TIMEOUT,
+        requests_session=get_gmaps_http_session(),
+    ))
+
+
+class PooledGoogleSerperAPIWrapper(GoogleSerperAPIWrapper):
+    """改用共用 session 發送請求的 GoogleSerperAPIWrapper（原版每次呼叫 requests.post 都重新建立連線）"""
+
+    def _google_serper_api_results(self, search_term: str, search_type: str = "search", **kwargs) -> dict:
+        headers = {
+            "X-API-KEY": self.serper_api_key or "",
+            "Content-Type": "application/json",
+        }
+        params = {
+            "q": search_term,
+            **{key: value for key, value in kwargs.items() if value is not None},
+        }
+        response = get_http_session().post(
+            f"https://google.serper.dev/{search_type}", headers=headers, params=params, timeout=SERPER_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _async_google_serper_search_results(self, search_term: str, search_type: str = "search",
+                                                  **kwargs) -> dict:
+        # 原版未設定 aiosession 時每次呼叫都建立新的 aiohttp.ClientSession
+        headers = {
+            "X-API-KEY": self.serper_api_key or "",
+            "Content-Type": "application/json",
+        }
+        params = {
+            "q": search_term,
+            **{key: value for key, value in kwargs.items() if value is not None},
+        }
+        async with get_aiohttp_session().post(
+            f"https://google.serper.dev/{search_type}", params=params, headers=headers, raise_for_status=True
+        ) as response:
+            return await response.json()
+
+
+def get_serper_client() -> GoogleSerperAPIWrapper:
+    """共用的 Google Serper 搜尋 client"""
+    return _get_or_create(
+        "serper", lambda: PooledGoogleSerperAPIWrapper(gl='tw', hl='zh-tw', type='search', k=10)
+    )
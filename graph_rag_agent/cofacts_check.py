@@ -1,56 +1,120 @@
-import requests
-import json
+import asyncio
+import os
+
+try:
+    from .claim_normalizer import match_claim, unique_claims
+    from .cofacts_client import apost_graphql, post_graphql
+except ImportError:
+    from claim_normalizer import match_claim, unique_claims
+    from cofacts_client import apost_graphql, post_graphql
+
+# 一次 GraphQL 請求最多合併幾個關鍵字（每個關鍵字一個 alias）
+BATCH_SIZE = int(os.getenv("COFACTS_BATCH_SIZE", "10"))
+RESULTS_PER_KEYWORD = 3
+
+ARTICLE_FIELDS = """
+    fragment ArticleFields on ArticleConnection {
+      edges {
+        node {
+          id
+          text
+          articleReplies {
+            reply {
+              text
+              type
+            }
+            createdAt
+          }
+          aiReplies {
+            status
+            text
+          }
+        }
+      }
+    }
+"""
 
-url = "https://api.cofacts.tw/graphql"
 
 def make_graphql_request(query, variables=None):
-    payload = {"query": query}
-    if variables:
-        payload["variables"] = variables
-
-    headers = {"Content-Type": "application/json"} #告訴server我們發送的是JSON格式的資料
-
-    
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
-    try:
-        response.raise_for_status()
-    except requests.exceptions.HTTPError:
-        print("API 回傳錯誤：", response.text) 
-        raise
-    result = response.json()
-    return result
-  
+    return post_graphql(query, variables)
+
+
 #查詢function
 def search_cofacts(keyword):
 
     query = """
     query ListArticles($keyword: String!, $first: Int) {
       ListArticles(filter: {moreLikeThis: {like: $keyword}}, first: $first) {
-        edges {
-          node {
-            id
-            text
-            articleReplies {
-              reply {
-                text
-                type
-              }
-              createdAt
-            }
-            aiReplies {
-              status
-              text
-            }
-          }
-        }
+        ...ArticleFields
       }
     }
-    """
-    variables = {"keyword": keyword, "first": 3}
+    """ + ARTICLE_FIELDS
+    variables = {"keyword": match_claim(keyword).text, "first": RESULTS_PER_KEYWORD}
     result = make_graphql_request(query, variables)
     return result
 
-  
+
+def _batch_query(size):
+    """以 alias（a0, a1, ...）把 size 個 ListArticles 查詢合併成一個請求"""
+    params = ", ".join(f"$k{i}: String!" for i in range(size))
+    fields = "\n".join(
+        f"      a{i}: ListArticles(filter: {{moreLikeThis: {{like: $k{i}}}}}, first: $first) {{ ...ArticleFields }}"
+        for i in range(size)
+    )
+    return f"""
+    query BatchListArticles({params}, $first: Int) {{
+{fields}
+    }}
+    """ + ARTICLE_FIELDS
+
+
+def _batches(claims):
+    """同一個 claim id 只保留第一次出現者（ClaimMatch），切成每批 BATCH_SIZE 個"""
+    unique = unique_claims(claims)
+    return [unique[i:i + BATCH_SIZE] for i in range(0, len(unique), BATCH_SIZE)]
+
+
+def _batch_request(batch):
+    variables = {f"k{i}": claim.text for i, claim in enumerate(batch)}
+    variables["first"] = RESULTS_PER_KEYWORD
+    return _batch_query(len(batch)), variables
+
+
+def _split_results(batch, result):
+    """將合併查詢的結果拆回與 search_cofacts 相同的格式"""
+    data = result.get("data") or {}
+    empty = {"edges": []}
+    return {
+        claim.key: {"data": {"ListArticles": data.get(f"a{i}") or empty}}
+        for i, claim in enumerate(batch)
+    }
+
+
+def search_cofacts_many(keywords):
+    """一次查詢多個關鍵字，回傳與 keywords 順序相同的結果列表"""
+    claims = [match_claim(keyword) for keyword in keywords]
+    results = {}
+    for batch in _batches(claims):
+        results.update(_split_results(batch, make_graphql_request(*_batch_request(batch))))
+    return [results[claim.key] for claim in claims]
+
+
+async def asearch_cofacts(keyword):
+    return (await asearch_cofacts_many([keyword]))[0]
+
+
+async def asearch_cofacts_many(keywords):
+    """非同步版本：各批次同時送出"""
+    claims = [match_claim(keyword) for keyword in keywords]
+    batches = _batches(claims)
+    responses = await asyncio.gather(*(apost_graphql(*_batch_request(batch)) for batch in batches))
+    results = {}
+    for batch, result in zip(batches, responses):
+        results.update(_split_results(batch, result))
+    return [results[claim.key] for claim in claims]
+
+
 # 測試
 if __name__ == "__main__":
-  print(search_cofacts("新冠肺炎疫苗"))  
\ No newline at end of file
+    print(search_cofacts("新冠肺炎疫苗"))
+    print(search_cofacts_many(["新冠肺炎疫苗", "台灣加入聯合國"]))
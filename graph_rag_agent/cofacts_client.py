@@ -0,0 +1,140 @@
+"""
+Cofacts GraphQL 的 HTTP client：
+- 同步與非同步各共用一個具連線池（keep-alive）的 httpx client
+- 設定連線 / 讀取逾時
+- 遇到連線錯誤、429 與 5xx 時以指數退避重試
+"""
+import asyncio
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+
+try:
+    from .components import lazy_component
+except ImportError:
+    from components import lazy_component
+
+logger = logging.getLogger(__name__)
+
+COFACTS_URL = os.getenv("COFACTS_GRAPHQL_URL", "https://api.cofacts.tw/graphql")
+CONNECT_TIMEOUT = float(os.getenv("COFACTS_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("COFACTS_READ_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("COFACTS_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("COFACTS_MAX_KEEPALIVE", "10"))
+MAX_RETRIES = int(os.getenv("COFACTS_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("COFACTS_BACKOFF_FACTOR", "0.3"))
+BACKOFF_MAX = float(os.getenv("COFACTS_BACKOFF_MAX", "5"))
+
+RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+
+HEADERS = {"Content-Type": "application/json"}  # 告訴 server 我們發送的是 JSON 格式的資料
+
+
+def _client_options():
+    return {
+        "headers": HEADERS,
+        "timeout": httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        "limits": httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE),
+    }
+
+
+def _backoff(attempt, response=None):
+    """第 attempt 次重試前的等待秒數；429 有 Retry-After 時優先採用"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    delay = BACKOFF_FACTOR * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), BACKOFF_MAX)
+
+
+def _payload(query, variables):
+    payload = {"query": query}
+    if variables:
+        payload["variables"] = variables
+    return payload
+
+
+def _result(response):
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError:
+        logger.error(f"Cofacts API 回傳錯誤：{response.text}")
+        raise
+    result = response.json()
+    if result.get("errors"):
+        logger.warning(f"Cofacts GraphQL 錯誤：{result['errors']}")
+    return result
+
+
+@lazy_component("cofacts_http_client")
+def get_client() -> httpx.Client:
+    client = httpx.Client(**_client_options())
+    atexit.register(client.close)
+    return client
+
+
+def post_graphql(query, variables=None):
+    """同步送出 GraphQL 查詢，回傳解析後的 JSON"""
+    client = get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = client.post(COFACTS_URL, json=_payload(query, variables))
+        except httpx.TransportError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning(f"Cofacts 連線失敗（{e!r}），{delay:.2f}s 後重試")
+        else:
+            if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                return _result(response)
+            delay = _backoff(attempt, response)
+            logger.warning(f"Cofacts 回傳 {response.status_code}，{delay:.2f}s 後重試")
+        time.sleep(delay)
+
+
+# httpx.AsyncClient 綁定建立時的 event loop，因此每個 loop 各保留一個
+_async_clients = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = httpx.AsyncClient(**_client_options())
+        return client
+
+
+async def apost_graphql(query, variables=None):
+    """非同步版本的 post_graphql"""
+    client = get_async_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.post(COFACTS_URL, json=_payload(query, variables))
+        except httpx.TransportError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            logger.warning(f"Cofacts 連線失敗（{e!r}），{delay:.2f}s 後重試")
+        else:
+            if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                return _result(response)
+            delay = _backoff(attempt, response)
+            logger.warning(f"Cofacts 回傳 {response.status_code}，{delay:.2f}s 後重試")
+        await asyncio.sleep(delay)
+
+
+async def aclose():
+    """關閉目前 event loop 的 async client（應用程式關閉時呼叫）"""
+    with _async_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
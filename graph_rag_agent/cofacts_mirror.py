@@ -0,0 +1,329 @@
+"""
+Cofacts 本地鏡像：匯入 Cofacts 公開資料（articles / replies / article_replies CSV，可為 .csv.zip），
+批次計算文章向量並建立 IVF 向量索引（numpy .npy 檔，以 mmap 讀取），
+讓謠言比對在本地對全部資料做查詢，不必每次呼叫遠端 GraphQL。
+
+python -m graph_rag_agent.cofacts_mirror ingest <dump 目錄>
+python -m graph_rag_agent.cofacts_mirror build-index [--nlist N]
+python -m graph_rag_agent.cofacts_mirror search "文字"
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from .similarity_service import MODEL_NAME, get_model, get_similarity_service
+except ImportError:
+    from similarity_service import MODEL_NAME, get_model, get_similarity_service
+
+logger = logging.getLogger(__name__)
+
+MIRROR_DIR = os.getenv(
+    "COFACTS_MIRROR_DIR",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "cofacts"),
+)
+EMBED_BATCH_SIZE = int(os.getenv("COFACTS_EMBED_BATCH_SIZE", "256"))
+NPROBE = int(os.getenv("COFACTS_NPROBE", "8"))  # 查詢時搜尋的 cluster 數，越大越準但越慢
+REPLIES_PER_ARTICLE = 3
+
+csv.field_size_limit(sys.maxsize)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    idx INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS replies (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    text TEXT,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS article_replies (
+    article_id TEXT NOT NULL,
+    reply_id TEXT NOT NULL,
+    created_at TEXT,
+    PRIMARY KEY (article_id, reply_id)
+);
+"""
+
+
+def _read_csv(dump_dir, name):
+    """讀取 <name>.csv 或 <name>.csv.zip，逐列回傳 dict"""
+    path = Path(dump_dir) / f"{name}.csv"
+    if path.exists():
+        with open(path, encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+        return
+    zip_path = Path(dump_dir) / f"{name}.csv.zip"
+    with zipfile.ZipFile(zip_path) as archive:
+        member = next(n for n in archive.namelist() if n.endswith(".csv"))
+        with archive.open(member) as raw:
+            yield from csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8", newline=""))
+
+
+def _batched(rows, size=5000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _connect(mirror_dir):
+    os.makedirs(mirror_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(mirror_dir, "cofacts.sqlite3"), check_same_thread=False)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def ingest(dump_dir, mirror_dir=MIRROR_DIR):
+    """匯入 Cofacts 資料；只保留一般狀態的文章與回應關聯。可重複執行（新資料會加在後面）"""
+    conn = _connect(mirror_dir)
+    counts = {}
+    with conn:
+        total = 0
+        for batch in _batched(_read_csv(dump_dir, "articles")):
+            rows = [
+                (row["id"], row["text"], row.get("createdAt"))
+                for row in batch
+                if row.get("text") and row.get("status", "NORMAL") == "NORMAL"
+            ]
+            conn.executemany("INSERT OR IGNORE INTO articles (id, text, created_at) VALUES (?, ?, ?)", rows)
+            total += len(rows)
+        counts["articles"] = total
+
+        total = 0
+        for batch in _batched(_read_csv(dump_dir, "replies")):
+            rows = [(row["id"], row.get("type"), row.get("text"), row.get("createdAt")) for row in batch]
+            conn.executemany("INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?)", rows)
+            total += len(rows)
+        counts["replies"] = total
+
+        total = 0
+        for batch in _batched(_read_csv(dump_dir, "article_replies")):
+            rows = [
+                (row["articleId"], row["replyId"], row.get("createdAt"))
+                for row in batch
+                if row.get("status", "NORMAL") == "NORMAL"
+            ]
+            conn.executemany("INSERT OR REPLACE INTO article_replies VALUES (?, ?, ?)", rows)
+            total += len(rows)
+        counts["article_replies"] = total
+    conn.close()
+    logger.info(f"Cofacts 資料匯入完成：{counts}")
+    return counts
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _kmeans(vectors, nlist, iterations=10, sample_size=50000, seed=0):
+    """以抽樣資料做 spherical k-means，回傳正規化後的中心點"""
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def build_index(mirror_dir=MIRROR_DIR, nlist=None):
+    """
+    批次計算所有文章的向量並建立 IVF 索引：
+    - centroids.npy：各 cluster 中心
+    - vectors.npy：依 cluster 排序的文章向量（同一個 cluster 的向量連續存放）
+    - ids.npy：vectors.npy 每一列對應的 articles.idx
+    - offsets.npy：cluster c 的向量位於 vectors[offsets[c]:offsets[c + 1]]
+    """
+    started = time.perf_counter()
+    conn = _connect(mirror_dir)
+    rows = conn.execute("SELECT idx, text FROM articles ORDER BY idx").fetchall()
+    conn.close()
+    if not rows:
+        raise ValueError("鏡像中沒有文章，請先執行 ingest")
+
+    model = get_model()
+    article_idx = np.array([idx for idx, _ in rows], dtype=np.int64)
+    vectors = None
+    for start in range(0, len(rows), EMBED_BATCH_SIZE):
+        encoded = _normalize(np.asarray(
+            model.encode([text for _, text in rows[start:start + EMBED_BATCH_SIZE]]), dtype=np.float32
+        ))
+        if vectors is None:
+            vectors = np.empty((len(rows), encoded.shape[1]), dtype=np.float32)
+        vectors[start:start + len(encoded)] = encoded
+        logger.info(f"已計算 {start + len(encoded)}/{len(rows)} 篇文章向量")
+
+    nlist = nlist or max(1, min(len(rows), int(math.sqrt(len(rows)))))
+    centroids = _kmeans(vectors, nlist)
+    assignment = np.argmax(vectors @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+
+    # 先寫入暫存檔再替換，避免查詢讀到一半的索引
+    files = {
+        "centroids": centroids,
+        "vectors": vectors[order],
+        "ids": article_idx[order],
+        "offsets": offsets,
+    }
+    for name, array in files.items():
+        tmp_path = os.path.join(mirror_dir, f"{name}.tmp.npy")
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(mirror_dir, f"{name}.npy"))
+    with open(os.path.join(mirror_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"model": MODEL_NAME, "articles": len(rows), "nlist": nlist}, f)
+    elapsed = time.perf_counter() - started
+    logger.info(f"IVF 索引建立完成：{len(rows)} 篇文章、{nlist} 個 cluster，耗時 {elapsed:.1f}s")
+    return {"articles": len(rows), "nlist": nlist, "seconds": elapsed}
+
+
+class CofactsMirror:
+    """讀取本地鏡像並以 IVF 索引查詢最相似的文章"""
+
+    def __init__(self, mirror_dir=MIRROR_DIR, nprobe=NPROBE):
+        self.mirror_dir = mirror_dir
+        self.nprobe = nprobe
+        self.centroids = np.load(os.path.join(mirror_dir, "centroids.npy"))
+        self.vectors = np.load(os.path.join(mirror_dir, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(mirror_dir, "ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(mirror_dir, "offsets.npy"))
+        self._conn = sqlite3.connect(os.path.join(mirror_dir, "cofacts.sqlite3"), check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search_vector(self, query_vector, k=3):
+        """回傳 [(articles.idx, score), ...]，依相似度由高到低"""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / (np.linalg.norm(query_vector) or 1.0)
+        nprobe = min(self.nprobe, len(self.centroids))
+        clusters = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([
+            np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters
+        ]) if nprobe else np.empty(0, dtype=np.int64)
+        if not len(candidates):
+            return []
+        scores = self.vectors[candidates] @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[candidates[i]]), float(scores[i])) for i in top]
+
+    def _load_nodes(self, indices):
+        """組成與 Cofacts GraphQL ListArticles 相同結構的 node，回傳 {articles.idx: node}"""
+        with self._lock:
+            nodes = {}
+            for idx in indices:
+                row = self._conn.execute("SELECT id, text FROM articles WHERE idx = ?", (idx,)).fetchone()
+                if row is None:
+                    continue
+                replies = self._conn.execute(
+                    "SELECT r.text, r.type, ar.created_at FROM article_replies ar "
+                    "JOIN replies r ON r.id = ar.reply_id WHERE ar.article_id = ? "
+                    "ORDER BY ar.created_at DESC LIMIT ?",
+                    (row[0], REPLIES_PER_ARTICLE),
+                ).fetchall()
+                nodes[idx] = {
+                    "id": row[0],
+                    "text": row[1],
+                    "articleReplies": [
+                        {"reply": {"text": text, "type": reply_type}, "createdAt": created_at}
+                        for text, reply_type, created_at in replies
+                    ],
+                    "aiReplies": [],
+                }
+            return nodes
+
+    def search(self, text, k=3):
+        """以文字查詢，回傳 [(node, score), ...]"""
+        # 與其他同時進來的查詢合併 encode
+        query_vector = get_similarity_service().encode_query(text)
+        hits = self.search_vector(query_vector, k)
+        nodes = self._load_nodes([idx for idx, _ in hits])
+        return [(nodes[idx], score) for idx, score in hits if idx in nodes]
+
+    def search_many(self, texts, k=3):
+        """批次版本：查詢一次 encode，文章內容一次讀取"""
+        if not texts:
+            return []
+        hits_per_query = [self.search_vector(v, k) for v in get_similarity_service().encode_queries(texts)]
+        nodes = self._load_nodes([idx for hits in hits_per_query for idx, _ in hits])
+        return [[(nodes[idx], score) for idx, score in hits if idx in nodes] for hits in hits_per_query]
+
+
+_mirror = None
+_mirror_loaded = False
+_mirror_lock = threading.Lock()
+
+
+def get_cofacts_mirror():
+    """已建立索引時回傳 CofactsMirror，否則回傳 None（改用遠端 API）"""
+    global _mirror, _mirror_loaded
+    with _mirror_lock:
+        if not _mirror_loaded:
+            _mirror_loaded = True
+            if os.path.exists(os.path.join(MIRROR_DIR, "offsets.npy")):
+                try:
+                    _mirror = CofactsMirror()
+                    logger.info(f"已載入 Cofacts 本地鏡像：{len(_mirror)} 篇文章")
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    logger.warning(f"無法載入 Cofacts 本地鏡像 {MIRROR_DIR}：{e}")
+        return _mirror
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cofacts 本地鏡像與向量索引")
+    parser.add_argument("--dir", default=MIRROR_DIR, help="鏡像資料目錄")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="匯入 Cofacts CSV 資料")
+    ingest_parser.add_argument("dump_dir")
+    index_parser = commands.add_parser("build-index", help="計算文章向量並建立 IVF 索引")
+    index_parser.add_argument("--nlist", type=int, default=None, help="cluster 數（預設為文章數的平方根）")
+    search_parser = commands.add_parser("search", help="查詢最相似的文章")
+    search_parser.add_argument("text")
+    search_parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "ingest":
+        print(ingest(args.dump_dir, args.dir))
+    elif args.command == "build-index":
+        print(build_index(args.dir, args.nlist))
+    else:
+        mirror = CofactsMirror(args.dir)
+        started = time.perf_counter()
+        results = mirror.search(args.text, args.k)
+        print(f"查詢耗時 {(time.perf_counter() - started) * 1000:.1f}ms")
+        for node, score in results:
+            print(f"{score:.4f}  {node['text'][:80]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""延遲初始化的元件容器：Neo4j、檢索器、LLM 等重量級物件在第一次使用（或 warm_up）時才建立"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 單一元件建立時間超過此秒數時記錄警告
+COMPONENT_BUDGET = float(os.getenv("COMPONENT_BUDGET_SECONDS", "5"))
+# 模組 import 時間超過此秒數時記錄警告
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET_SECONDS", "1"))
+
+_registry = {}
+
+
+class LazyComponent:
+    """呼叫時回傳元件實例，第一次呼叫才執行 factory（執行緒安全）"""
+
+    def __init__(self, name, factory, budget=None):
+        self.name = name
+        self.factory = factory
+        self.budget = COMPONENT_BUDGET if budget is None else budget
+        self.build_seconds = None
+        self._instance = None
+        self._built = False
+        self._lock = threading.Lock()
+        self.__doc__ = factory.__doc__
+
+    def __call__(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    started = time.perf_counter()
+                    self._instance = self.factory()
+                    self.build_seconds = time.perf_counter() - started
+                    self._built = True
+                    if self.build_seconds > self.budget:
+                        logger.warning(f"元件 {self.name} 建立耗時 {self.build_seconds:.2f}s，超過預算 {self.budget:.2f}s")
+                    else:
+                        logger.info(f"元件 {self.name} 建立完成（{self.build_seconds:.2f}s）")
+        return self._instance
+
+    @property
+    def built(self):
+        return self._built
+
+    def reset(self):
+        """丟棄已建立的實例，下次使用時重新建立"""
+        with self._lock:
+            self._instance = None
+            self._built = False
+            self.build_seconds = None
+
+
+def lazy_component(name, budget=None):
+    """將 factory 函式註冊為延遲初始化元件"""
+    def decorator(factory):
+        component = LazyComponent(name, factory, budget)
+        _registry[name] = component
+        return component
+    return decorator
+
+
+def warm_up(names=None):
+    """預先建立元件（例如在 worker 啟動後），回傳啟動時間報告"""
+    for name in names or list(_registry):
+        try:
+            _registry[name]()
+        except Exception:
+            logger.exception(f"元件 {name} 預熱失敗")
+    return startup_report()
+
+
+def startup_report():
+    """各元件的建立狀態與耗時（秒）"""
+    return {
+        name: {"built": component.built, "seconds": component.build_seconds, "budget": component.budget}
+        for name, component in _registry.items()
+    }
+
+
+def check_import_budget(module_name, started):
+    """由模組在 import 結尾呼叫，import 時間超過預算時記錄警告"""
+    elapsed = time.perf_counter() - started
+    if elapsed > IMPORT_BUDGET:
+        logger.warning(f"模組 {module_name} import 耗時 {elapsed:.2f}s，超過預算 {IMPORT_BUDGET:.2f}s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    # python -m graph_rag_agent.components：建立所有元件並輸出啟動時間報告
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    from . import ai_agent  # noqa: F401  註冊所有元件
+    print(f"import graph_rag_agent.ai_agent：{time.perf_counter() - started:.2f}s")
+    for name, item in warm_up().items():
+        print(f"{name:<20} {item['seconds'] or 0:.2f}s")
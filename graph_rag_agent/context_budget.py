@@ -0,0 +1,141 @@
+"""
+RAG context 組裝：檢索結果送進 RagTemplate 之前先
+去除重複的文字片段與關係、依與問題的相似度排序，再裝入固定的 token 預算。
+"""
+import logging
+import math
+import os
+from collections import Counter
+
+try:
+    from .embedding_cache import normalize_text
+    from .retrieval_query import TEXT_HEADER, KG_RELS_SEPARATOR, ITEM_SEPARATOR
+    from .tokenizer import count_tokens, truncate_tokens
+except ImportError:
+    from embedding_cache import normalize_text
+    from retrieval_query import TEXT_HEADER, KG_RELS_SEPARATOR, ITEM_SEPARATOR
+    from tokenizer import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+# 相似度相同時，文字片段的權重略高於單一關係（片段包含較完整的敘述）
+CHUNK_WEIGHT = float(os.getenv("RAG_CONTEXT_CHUNK_WEIGHT", "1.2"))
+
+
+def _bigrams(text):
+    """字元 bigram（中文不需斷詞即可比較）"""
+    text = normalize_text(text).replace(" ", "")
+    if len(text) < 2:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def similarity(question_grams, text) -> float:
+    """字元 bigram 的餘弦相似度"""
+    grams = _bigrams(text)
+    if not grams or not question_grams:
+        return 0.0
+    dot = sum(count * grams[gram] for gram, count in question_grams.items())
+    norm = math.sqrt(sum(c * c for c in question_grams.values())) * math.sqrt(sum(c * c for c in grams.values()))
+    return dot / norm if norm else 0.0
+
+
+def parse_context(info: str):
+    """將檢索結果字串拆成文字片段與關係列表"""
+    if info.startswith(TEXT_HEADER):
+        info = info[len(TEXT_HEADER):]
+    text_part, _, rel_part = info.partition(KG_RELS_SEPARATOR)
+    chunks = [c for c in text_part.split(ITEM_SEPARATOR) if c.strip()]
+    rels = [r for r in rel_part.split(ITEM_SEPARATOR) if r.strip()]
+    return chunks, rels
+
+
+def _dedupe(items):
+    """去除正規化後相同的項目，以及完全包含在其他項目中的項目；保留原本順序"""
+    normalized = []
+    seen = set()
+    for item in items:
+        key = normalize_text(item)
+        if key in seen:
+            continue
+        seen.add(key)
+        normalized.append((item, key))
+    kept = [
+        item for item, key in normalized
+        if not any(key != other and key in other for _, other in normalized)
+    ]
+    return kept, len(items) - len(kept)
+
+
+def pack_context(question: str, infos, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    組裝 context：回傳 (context 字串, 報告)。
+    所有候選項依 相似度 x 權重 排序（同分時保留檢索順序），依序放入直到預算用完；
+    至少保留一個文字片段，超出預算時依 token 截斷。
+    每個項目都計入一個分隔字串的 token 數，輸出不會超過 token_budget；
+    預算連標題都放不下時回傳空字串。
+    """
+    chunks, rels = [], []
+    for info in infos:
+        parsed_chunks, parsed_rels = parse_context(info or "")
+        chunks.extend(parsed_chunks)
+        rels.extend(parsed_rels)
+    chunks, chunk_duplicates = _dedupe(chunks)
+    rels, rel_duplicates = _dedupe(rels)
+
+    question_grams = _bigrams(question)
+    candidates = [
+        (similarity(question_grams, text) * CHUNK_WEIGHT, -i, "chunk", text) for i, text in enumerate(chunks)
+    ] + [
+        (similarity(question_grams, text), -i, "rel", text) for i, text in enumerate(rels)
+    ]
+    candidates.sort(reverse=True)
+
+    used = count_tokens(TEXT_HEADER + KG_RELS_SEPARATOR)
+    separator_tokens = count_tokens(ITEM_SEPARATOR)
+    kept = {"chunk": [], "rel": []}
+    dropped = {"chunk": 0, "rel": 0}
+    dropped_tokens = 0
+    for _, order, kind, text in candidates:
+        tokens = count_tokens(text) + separator_tokens
+        if used + tokens <= token_budget:
+            kept[kind].append((-order, text))
+            used += tokens
+        else:
+            dropped[kind] += 1
+            dropped_tokens += tokens
+
+    remaining = token_budget - used - separator_tokens
+    if not kept["chunk"] and chunks and remaining > 0:
+        # 預算連一個片段都放不下時，截斷最相關的片段
+        best = max(c for c in candidates if c[2] == "chunk")
+        text = truncate_tokens(best[3], remaining)
+        if text:
+            kept["chunk"].append((-best[1], text))
+            used += count_tokens(text) + separator_tokens
+            dropped["chunk"] -= 1
+            dropped_tokens -= count_tokens(text) + separator_tokens
+
+    # 輸出時恢復檢索順序，讓相鄰片段的敘述保持連貫
+    if used <= token_budget:
+        context = (
+            TEXT_HEADER + ITEM_SEPARATOR.join(text for _, text in sorted(kept["chunk"]))
+            + KG_RELS_SEPARATOR + ITEM_SEPARATOR.join(text for _, text in sorted(kept["rel"]))
+        )
+    else:
+        # 標題本身就超過預算，此時不會保留任何項目
+        context, used = "", 0
+
+    report = {
+        "tokens": used,
+        "budget": token_budget,
+        "chunks_kept": len(kept["chunk"]),
+        "chunks_dropped": dropped["chunk"],
+        "rels_kept": len(kept["rel"]),
+        "rels_dropped": dropped["rel"],
+        "duplicates_removed": chunk_duplicates + rel_duplicates,
+        "dropped_tokens": dropped_tokens,
+    }
+    logger.info(f"RAG context：{report}")
+    return context, report
@@ -0,0 +1,209 @@
+"""查詢向量快取：以 (模型, 正規化文字) 的雜湊為鍵，記憶體 LRU + SQLite 持久化"""
+import atexit
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+
+from cachetools import LRUCache
+from neo4j_graphrag.embeddings.base import Embedder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "embeddings.sqlite3"),
+)
+# 命中時的 last_used 更新先累積在記憶體，達到筆數或間隔後以一次交易寫入，讀取不必每次取得寫入鎖
+TOUCH_BATCH_SIZE = int(os.getenv("EMBEDDING_CACHE_TOUCH_BATCH", "256"))
+TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "30"))
+
+
+def normalize_text(text: str) -> str:
+    """統一全形/半形、去除頭尾空白並壓縮連續空白，讓相同問題得到相同的鍵"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    內容定址的向量快取。
+    - 第一層：記憶體 LRU（cachetools.LRUCache）
+    - 第二層：SQLite 檔案，超過 max_disk_entries 時依最後使用時間淘汰
+      （記憶體與磁碟命中都會更新最後使用時間，批次寫回）
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, memory_size=2048, max_disk_entries=200_000):
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory = LRUCache(maxsize=memory_size)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes_since_evict = 0
+        self._touched = {}  # key -> 最後使用時間，尚未寫回磁碟
+        self._last_touch_flush = time.monotonic()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        atexit.register(self.flush_touches)
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str):
+        """取得快取向量，未命中回傳 None"""
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is None:
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._memory[key] = vector
+            if vector is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._touch(key)
+            return vector
+
+    def _touch(self, key) -> None:
+        """記錄命中時間（需持有 self._lock），累積足夠後批次寫回"""
+        self._touched[key] = time.time()
+        if (len(self._touched) >= TOUCH_BATCH_SIZE
+                or time.monotonic() - self._last_touch_flush >= TOUCH_INTERVAL):
+            self._flush_touches()
+            self._conn.commit()
+
+    def _flush_touches(self) -> None:
+        """將累積的 last_used 更新寫入目前的交易（需持有 self._lock，由呼叫端 commit）"""
+        self._last_touch_flush = time.monotonic()
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def flush_touches(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+
+    def put(self, model: str, text: str, vector) -> None:
+        """寫入向量（同時寫入記憶體與磁碟）"""
+        key = self.make_key(model, text)
+        vector = [float(v) for v in vector]
+        with self._lock:
+            self._memory[key] = vector
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                (key, model, array("f", vector).tobytes(), time.time()),
+            )
+            self._touched.pop(key, None)
+            if self._touched and time.monotonic() - self._last_touch_flush >= TOUCH_INTERVAL:
+                self._flush_touches()  # 與這次寫入合併成同一個交易
+            self._conn.commit()
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 100:
+                self._evict()
+
+    def _evict(self) -> None:
+        """磁碟層超過上限時，刪除最久未使用的項目"""
+        self._writes_since_evict = 0
+        # 淘汰前先寫回最後使用時間，避免剛命中的項目被刪除
+        self._flush_touches()
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._conn.commit()
+            logger.info(f"向量快取淘汰 {overflow} 筆舊資料")
+
+    def stats(self) -> dict:
+        """回傳命中率等統計資訊"""
+        with self._lock:
+            total = self._hits + self._misses
+            (disk_entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """取得行程內共用的向量快取"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+class CachedEmbedder(Embedder):
+    """包裝 neo4j_graphrag 的 Embedder，重複的查詢不再呼叫 embedding API"""
+
+    def __init__(self, embedder: Embedder, model: str, cache: EmbeddingCache = None):
+        super().__init__()
+        self.embedder = embedder
+        self.model = model
+        self.cache = cache or get_embedding_cache()
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = self.embedder.embed_query(text)
+            self.cache.put(self.model, text, vector)
+        return vector
+
+
+def cached_encode(model, model_name: str, sentences, cache: EmbeddingCache = None):
+    """
+    SentenceTransformer.encode 的快取版本。
+    只對未命中的句子做一次批次 forward pass，回傳順序與輸入相同的 numpy 陣列。
+    """
+    import numpy as np
+
+    cache = cache or get_embedding_cache()
+    vectors = [cache.get(model_name, sentence) for sentence in sentences]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = model.encode([sentences[i] for i in missing])
+        for i, vector in zip(missing, encoded):
+            cache.put(model_name, sentences[i], vector)
+            vectors[i] = vector
+    return np.asarray(vectors, dtype=np.float32)
@@ -0,0 +1,180 @@
+"""本地醫療設施空間索引：以經緯度網格分桶，提供半徑與 k 近鄰查詢，作為 Google Places 之前的第一層"""
+import csv
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = 111320.0
+
+# 匯入時可接受的欄位名稱
+_FIELD_ALIASES = {
+    "name": ("name", "名稱", "機構名稱"),
+    "address": ("address", "vicinity", "地址"),
+    "lat": ("lat", "latitude", "緯度"),
+    "lng": ("lng", "lon", "longitude", "經度"),
+    "type": ("type", "category", "類別"),
+    "rating": ("rating", "評分"),
+}
+_TYPE_ALIASES = {
+    "醫院": "hospital",
+    "診所": "doctor",
+    "clinic": "doctor",
+    "藥局": "pharmacy",
+}
+
+
+def _pick(row, field):
+    for alias in _FIELD_ALIASES[field]:
+        value = row.get(alias)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def load_facilities(path):
+    """由 CSV 或 JSON（物件陣列）匯入設施資料，略過缺少座標的資料"""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    facilities = []
+    for row in rows:
+        try:
+            lat = float(_pick(row, "lat"))
+            lng = float(_pick(row, "lng"))
+        except (TypeError, ValueError):
+            continue
+        facility_type = (_pick(row, "type") or "hospital").strip()
+        rating = _pick(row, "rating")
+        facilities.append({
+            "name": _pick(row, "name") or "無名稱",
+            "address": _pick(row, "address") or "無地址",
+            "lat": lat,
+            "lng": lng,
+            "type": _TYPE_ALIASES.get(facility_type, facility_type),
+            "rating": float(rating) if rating not in (None, "") else None,
+        })
+    return facilities
+
+
+class FacilityIndex:
+    """
+    依類別分開的經緯度網格索引。
+    每個格子邊長 cell_deg 度，查詢時由中心格向外一圈一圈擴展，
+    候選點再以 numpy 向量化計算 haversine 距離。
+    """
+
+    def __init__(self, facilities, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self.facilities = facilities
+        self._lat = np.radians(np.array([f["lat"] for f in facilities], dtype=np.float64))
+        self._lng = np.radians(np.array([f["lng"] for f in facilities], dtype=np.float64))
+        self._grid = {}  # type -> {(row, col): [index, ...]}
+        for i, facility in enumerate(facilities):
+            cells = self._grid.setdefault(facility["type"], {})
+            cells.setdefault(self._cell(facility["lat"], facility["lng"]), []).append(i)
+        self._grid = {
+            facility_type: {cell: np.array(indices) for cell, indices in cells.items()}
+            for facility_type, cells in self._grid.items()
+        }
+
+    def __len__(self):
+        return len(self.facilities)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _ring_width_m(self, lat):
+        """一圈格子保證涵蓋的最短距離（經度方向會隨緯度縮短）"""
+        return self.cell_deg * METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+
+    def _ring(self, cells, center, r):
+        row, col = center
+        if r == 0:
+            keys = [center]
+        else:
+            keys = [(row + dr, col + dc) for dr in range(-r, r + 1) for dc in (-r, r)]
+            keys += [(row + dr, col + dc) for dr in (-r, r) for dc in range(-r + 1, r)]
+        return [cells[key] for key in keys if key in cells]
+
+    def _distances(self, indices, lat, lng):
+        lat1, lng1 = math.radians(lat), math.radians(lng)
+        dlat = self._lat[indices] - lat1
+        dlng = self._lng[indices] - lng1
+        a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(self._lat[indices]) * np.sin(dlng / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+    def _results(self, indices, distances):
+        order = np.argsort(distances)
+        return [dict(self.facilities[indices[i]], distance=float(distances[i])) for i in order]
+
+    def within_radius(self, latlng, facility_type, radius_m):
+        """回傳半徑內的設施（依距離排序，附 distance 公尺）"""
+        cells = self._grid.get(facility_type)
+        if not cells:
+            return []
+        lat, lng = latlng
+        center = self._cell(lat, lng)
+        rings = int(math.ceil(radius_m / self._ring_width_m(lat)))
+        buckets = [bucket for r in range(rings + 1) for bucket in self._ring(cells, center, r)]
+        if not buckets:
+            return []
+        indices = np.concatenate(buckets)
+        distances = self._distances(indices, lat, lng)
+        mask = distances <= radius_m
+        return self._results(indices[mask], distances[mask])
+
+    def nearest(self, latlng, facility_type, k=5, max_radius_m=50000):
+        """回傳最近的 k 個設施（不超過 max_radius_m）"""
+        cells = self._grid.get(facility_type)
+        if not cells:
+            return []
+        lat, lng = latlng
+        center = self._cell(lat, lng)
+        ring_width = self._ring_width_m(lat)
+        max_rings = int(math.ceil(max_radius_m / ring_width))
+        buckets = []
+        for r in range(max_rings + 1):
+            buckets.extend(self._ring(cells, center, r))
+            if not buckets:
+                continue
+            indices = np.concatenate(buckets)
+            distances = self._distances(indices, lat, lng)
+            # 已找到 k 個，且第 k 近的距離不超過已完整搜尋的範圍，即可停止
+            if len(indices) >= k and np.partition(distances, k - 1)[k - 1] <= r * ring_width:
+                break
+        if not buckets:
+            return []
+        mask = distances <= max_radius_m
+        return self._results(indices[mask], distances[mask])[:k]
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_facility_index():
+    """載入 MEDICAL_FACILITIES_PATH 指定的設施資料；未設定或載入失敗時回傳 None"""
+    global _index, _index_loaded
+    with _index_lock:
+        if not _index_loaded:
+            _index_loaded = True
+            path = os.getenv("MEDICAL_FACILITIES_PATH")
+            if path:
+                try:
+                    _index = FacilityIndex(load_facilities(path))
+                    logger.info(f"已載入 {len(_index)} 筆醫療設施資料：{path}")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"無法載入醫療設施資料 {path}：{e}")
+        return _index
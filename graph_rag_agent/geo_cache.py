@@ -0,0 +1,197 @@
+"""Google Maps 查詢結果快取：地名→座標、(geohash, 類別, 半徑)→附近地點"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from cachetools import TTLCache
+
+from .embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# 預設值：醫院位置很少變動，座標可長期保存；附近地點保存一天
+GEOCODE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+PLACES_TTL = int(os.getenv("PLACES_CACHE_TTL", str(24 * 3600)))
+GEO_CACHE_SIZE = int(os.getenv("GEO_CACHE_SIZE", "2048"))
+# 磁碟層每個 namespace 的筆數上限；超過時先刪除過期資料，再依寫入先後刪除最舊的資料
+GEO_CACHE_MAX_DISK_ENTRIES = int(os.getenv("GEO_CACHE_MAX_DISK_ENTRIES", "50000"))
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", "6"))  # 6 碼約 1.2km x 0.6km
+# 設為空字串可停用磁碟持久化
+GEO_CACHE_PATH = os.getenv(
+    "GEO_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "geo.sqlite3"),
+)
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """將經緯度編碼為 geohash，鄰近座標會得到相同的前綴"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+class _TieredTTLCache:
+    """記憶體 TTLCache + 可選的 SQLite 持久層（值以 JSON 儲存，最多 max_disk_entries 筆）"""
+
+    def __init__(self, namespace, ttl, maxsize, conn=None, lock=None, max_disk_entries=GEO_CACHE_MAX_DISK_ENTRIES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._writes_since_evict = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._conn = conn
+        self._lock = lock or threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value FROM geo_cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, time.time()),
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._memory[key] = value
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO geo_cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+                )
+                self._conn.commit()
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= 100:
+                    self._evict()
+
+    def _evict(self):
+        """磁碟層超過上限時刪除過期資料與最早寫入的資料（同一 namespace 的 TTL 相同，expires_at 即寫入順序）"""
+        self._writes_since_evict = 0
+        self._conn.execute(
+            "DELETE FROM geo_cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+        )
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM geo_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM geo_cache WHERE namespace = ? AND key IN "
+                "(SELECT key FROM geo_cache WHERE namespace = ? ORDER BY expires_at ASC LIMIT ?)",
+                (self.namespace, self.namespace, overflow),
+            )
+            logger.info(f"地圖快取 {self.namespace} 淘汰 {overflow} 筆舊資料")
+        self._conn.commit()
+
+
+class GeoCache:
+    """Google_Map 的兩層快取"""
+
+    def __init__(self, path=GEO_CACHE_PATH, geocode_ttl=GEOCODE_TTL, places_ttl=PLACES_TTL,
+                 maxsize=GEO_CACHE_SIZE, precision=GEOHASH_PRECISION, max_disk_entries=GEO_CACHE_MAX_DISK_ENTRIES):
+        self.precision = precision
+        conn = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geo_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            # 啟動時清除過期資料，控制檔案大小
+            conn.execute("DELETE FROM geo_cache WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+        lock = threading.Lock()
+        self._geocode = _TieredTTLCache("geocode", geocode_ttl, maxsize, conn, lock, max_disk_entries)
+        self._places = _TieredTTLCache("places", places_ttl, maxsize, conn, lock, max_disk_entries)
+        if conn is not None:
+            # 啟動時也套用上限（例如調低 GEO_CACHE_MAX_DISK_ENTRIES 之後）
+            with lock:
+                self._geocode._evict()
+                self._places._evict()
+
+    def get_latlng(self, keyword: str):
+        value = self._geocode.get(normalize_text(keyword))
+        return tuple(value) if value is not None else None
+
+    def set_latlng(self, keyword: str, latlng) -> None:
+        self._geocode.set(normalize_text(keyword), list(latlng))
+
+    def _places_key(self, latlng, search_type, radius) -> str:
+        return f"{geohash_encode(latlng[0], latlng[1], self.precision)}:{search_type}:{radius}"
+
+    def get_places(self, latlng, search_type: str, radius: int):
+        return self._places.get(self._places_key(latlng, search_type, radius))
+
+    def set_places(self, latlng, search_type: str, radius: int, places) -> None:
+        self._places.set(self._places_key(latlng, search_type, radius), places)
+
+    def stats(self) -> dict:
+        return {
+            "geocode": {"hits": self._geocode.hits, "misses": self._geocode.misses},
+            "places": {"hits": self._places.hits, "misses": self._places.misses},
+        }
+
+
+_geo_cache = None
+_geo_cache_lock = threading.Lock()
+
+
+def get_geo_cache() -> GeoCache:
+    """取得行程內共用的地圖快取"""
+    global _geo_cache
+    with _geo_cache_lock:
+        if _geo_cache is None:
+            _geo_cache = GeoCache()
+        return _geo_cache
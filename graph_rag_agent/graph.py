@@ -1,14 +1,154 @@
 """初始化neo4j"""
 from dotenv import load_dotenv
+import hashlib
+import json
+import logging
 import os
-from langchain_neo4j import Neo4jGraph
+import threading
+import time
+from pathlib import Path
+from .components import lazy_component
+from .neo4j_pool import driver_config, get_driver
 # Connect to Neo4j
 load_dotenv()
-graph = Neo4jGraph(
-    url=os.getenv("NEO4J_URI"),
-    username=os.getenv("NEO4J_USERNAME"),
-    password=os.getenv("NEO4J_PASSWORD"),
-    database=os.getenv("NEO4J_DATABASE"),
-    enhanced_schema=True,
-    timeout=10
-)
\ No newline at end of file
+
+logger = logging.getLogger(__name__)
+
+# enhanced_schema 的取樣結果快取檔
+SCHEMA_CACHE_PATH = os.getenv(
+    "NEO4J_SCHEMA_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "neo4j_schema.json"),
+)
+# fingerprint 不符時的處理方式：sync（立即重新取樣）或 background（先用舊快取，背景更新）
+SCHEMA_REFRESH_MODE = os.getenv("NEO4J_SCHEMA_REFRESH", "sync")
+# 快取的有效秒數：超過後即使 fingerprint 相符也重新取樣（0 表示只依 fingerprint 判斷）
+SCHEMA_CACHE_TTL = int(os.getenv("NEO4J_SCHEMA_CACHE_TTL", str(24 * 3600)))
+
+FINGERPRINT_QUERY = """
+CALL db.labels() YIELD label WITH collect(label) AS labels
+CALL db.relationshipTypes() YIELD relationshipType WITH labels, collect(relationshipType) AS types
+CALL db.propertyKeys() YIELD propertyKey WITH labels, types, collect(propertyKey) AS keys
+OPTIONAL MATCH (v:SchemaVersion)
+RETURN labels, types, keys, max(v.version) AS version
+"""
+
+
+def schema_fingerprint(graph):
+    """
+    以標籤、關係類型、屬性鍵與 (:SchemaVersion {version}) 節點計算 schema 指紋（皆為 O(1) 的系統查詢）。
+    只匯入資料、沒有新增標籤或屬性鍵時指紋不變，但 enhanced_schema 取樣的屬性值與範圍可能已過時：
+    匯入資料後請遞增 SchemaVersion（MERGE (v:SchemaVersion) SET v.version = coalesce(v.version, 0) + 1），
+    否則要等到 NEO4J_SCHEMA_CACHE_TTL 到期才會重新取樣。
+    """
+    row = graph.query(FINGERPRINT_QUERY)[0]
+    payload = {
+        "labels": sorted(row["labels"]),
+        "types": sorted(row["types"]),
+        "keys": sorted(row["keys"]),
+        "version": row["version"],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _load_schema_cache():
+    try:
+        with open(SCHEMA_CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_is_fresh(cached, fingerprint):
+    """快取的 fingerprint 相符且尚未超過 SCHEMA_CACHE_TTL（舊格式沒有 saved_at 時視為過期）"""
+    if not cached or cached.get("fingerprint") != fingerprint:
+        return False
+    return not SCHEMA_CACHE_TTL or time.time() - cached.get("saved_at", 0) < SCHEMA_CACHE_TTL
+
+
+def _save_schema_cache(fingerprint, graph):
+    os.makedirs(os.path.dirname(SCHEMA_CACHE_PATH), exist_ok=True)
+    tmp_path = f"{SCHEMA_CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"fingerprint": fingerprint, "saved_at": time.time(),
+             "schema": graph.schema, "structured_schema": graph.structured_schema},
+            f, ensure_ascii=False, default=str,
+        )
+    # 原子替換，避免其他 worker 讀到寫到一半的檔案
+    os.replace(tmp_path, SCHEMA_CACHE_PATH)
+
+
+def refresh_schema_cache(graph=None, force=False):
+    """
+    重新計算 fingerprint，若與快取不同、快取已過期（或 force=True）則重新取樣 schema 並寫回快取。
+    回傳是否有重新取樣。
+    """
+    graph = graph or get_graph()
+    fingerprint = schema_fingerprint(graph)
+    cached = _load_schema_cache()
+    if not force and _cache_is_fresh(cached, fingerprint):
+        return False
+    graph.refresh_schema()
+    _save_schema_cache(fingerprint, graph)
+    logger.info("Neo4j schema 已重新取樣並寫入快取")
+    return True
+
+
+@lazy_component("neo4j_graph")
+def get_graph():
+    """建立 Neo4jGraph，schema 優先從本地快取載入（fingerprint 相符且未過期時不必重新取樣）"""
+    from langchain_neo4j import Neo4jGraph
+
+    class SharedDriverNeo4jGraph(Neo4jGraph):
+        """
+        改用 neo4j_pool 的共用 driver，讓聊天歷史與 GraphRAG 共用同一個連線池。
+        Neo4jGraph 沒有傳入既有 driver 的參數，建構時一定會自建 driver，因此建構後換掉；
+        共用 driver 由 neo4j_pool 管理，close()/__del__ 不可關閉它。
+        """
+
+        def __init__(self, driver, **kwargs):
+            super().__init__(**kwargs)
+            self._driver.close()  # 關閉建構時自建的 driver
+            self._driver = driver
+
+        def close(self):
+            pass
+
+        def __del__(self):
+            pass
+
+    graph = SharedDriverNeo4jGraph(
+        get_driver(),
+        url=os.getenv("NEO4J_URI"),
+        username=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD"),
+        database=os.getenv("NEO4J_DATABASE"),
+        enhanced_schema=True,
+        refresh_schema=False,
+        timeout=10,
+        driver_config=driver_config(),
+    )
+
+    fingerprint = schema_fingerprint(graph)
+    cached = _load_schema_cache()
+    if cached:
+        graph.schema = cached["schema"]
+        graph.structured_schema = cached["structured_schema"]
+        if _cache_is_fresh(cached, fingerprint):
+            return graph
+        if SCHEMA_REFRESH_MODE == "background":
+            # 先使用舊的 schema，背景重新取樣
+            threading.Thread(
+                target=refresh_schema_cache, args=(graph,), name="neo4j-schema-refresh", daemon=True
+            ).start()
+            return graph
+
+    graph.refresh_schema()
+    _save_schema_cache(fingerprint, graph)
+    return graph
+
+def __getattr__(name):
+    # 相容舊的 `from .graph import graph` 寫法
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
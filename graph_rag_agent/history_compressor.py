@@ -0,0 +1,194 @@
+"""對話歷史壓縮：較舊的對話合併為滾動摘要，最近的對話在 token 預算內原文保留"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import LRUCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage
+
+from .llm import get_llm_GPT
+from .tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))  # 原文保留的最近對話 token 上限
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))  # 保留摘要的 session 數
+
+SUMMARY_PROMPT = """以下是使用者與醫療助理的對話。請以繁體中文更新對話摘要，
+保留使用者的症狀、病史、關心的疾病與藥物、已給過的重要建議，省略寒暄與重複內容，不超過 300 字。
+
+目前的摘要：
+{summary}
+
+新增的對話：
+{lines}
+
+更新後的摘要："""
+
+
+def _message_tokens(message) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + 4  # 每則訊息的角色與分隔符號
+
+
+def _indexed(messages):
+    """
+    (序號, 訊息) 列表。底層 history 以 message.id 提供序號（如 BatchedNeo4jChatMessageHistory）時使用該序號，
+    否則視為回傳完整歷史，以列表位置為序號。回傳的訊息不帶 id，避免序號出現在 prompt 中。
+    """
+    ids = [m.id for m in messages]
+    if messages and all(isinstance(i, str) and i.lstrip("-").isdigit() for i in ids):
+        indexes = [int(i) for i in ids]
+    else:
+        indexes = list(range(len(messages)))
+    return [(index, m.model_copy(update={"id": None}) if m.id is not None else m) for index, m in zip(indexes, messages)]
+
+
+def _format_lines(messages) -> str:
+    names = {"human": "使用者", "ai": "助理"}
+    return "\n".join(f"{names.get(m.type, m.type)}：{m.content}" for m in messages)
+
+
+class _SummaryStore:
+    """每個 session 的滾動摘要：summary 涵蓋到序號 last_index 的訊息為止"""
+
+    def __init__(self, maxsize=HISTORY_SUMMARY_CACHE_SIZE):
+        self._data = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._session_locks = LRUCache(maxsize=maxsize)
+
+    def get(self, session_id):
+        with self._lock:
+            return self._data.get(session_id)
+
+    def set(self, session_id, summary, last_index):
+        with self._lock:
+            self._data[session_id] = {"summary": summary, "last_index": last_index}
+
+    def pop(self, session_id):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def session_lock(self, session_id):
+        with self._lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = threading.Lock()
+            return lock
+
+
+_summaries = _SummaryStore()
+# 寫入後在背景更新摘要，不佔用回應時間
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+
+class CompressedChatMessageHistory(BaseChatMessageHistory):
+    """
+    包裝既有的 ChatMessageHistory：
+    - 讀取時回傳 [摘要 SystemMessage] + 在 token_budget 內的最近訊息，不在讀取路徑上呼叫 LLM
+    - 超出預算的舊訊息在背景增量併入摘要（只摘要上次之後新增的部分，以訊息序號判斷）
+    - 寫入直接交給底層 history，並在背景預先更新摘要
+    """
+
+    def __init__(self, base: BaseChatMessageHistory, session_id: str, token_budget=HISTORY_TOKEN_BUDGET,
+                 summaries=None):
+        self.base = base
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self._summaries = summaries or _summaries
+
+    def _split(self, messages):
+        """
+        由新到舊累計 token，超出預算之前的訊息原文保留，其餘為待摘要的舊訊息。
+        回傳 (舊訊息的 (序號, 訊息) 列表, 最近訊息列表)。
+        """
+        indexed = _indexed(messages)
+        used = 0
+        start = len(indexed)
+        for i in range(len(indexed) - 1, -1, -1):
+            used += _message_tokens(indexed[i][1])
+            if used > self.token_budget:
+                break
+            start = i
+        return indexed[:start], [m for _, m in indexed[start:]]
+
+    @staticmethod
+    def _pending(older, entry):
+        """找出尚未併入摘要的舊訊息（序號大於摘要涵蓋的最後一則）"""
+        if entry is None:
+            return older
+        return [(index, m) for index, m in older if index > entry["last_index"]]
+
+    def _summarize(self, older):
+        """將尚未摘要的舊訊息併入摘要並回傳最新摘要"""
+        with self._summaries.session_lock(self.session_id):
+            entry = self._summaries.get(self.session_id)
+            pending = self._pending(older, entry)
+            if not pending:
+                return entry["summary"] if entry else ""
+            previous = entry["summary"] if entry else "（尚無）"
+            lines = _format_lines([m for _, m in pending])
+            response = get_llm_GPT().invoke(SUMMARY_PROMPT.format(summary=previous, lines=lines))
+            summary = response.content.strip()
+            self._summaries.set(self.session_id, summary, pending[-1][0])
+            logger.info(
+                f"session {self.session_id} 摘要已更新：併入 {len(pending)} 則訊息，摘要 {count_tokens(summary)} tokens"
+            )
+            return summary
+
+    @property
+    def messages(self):
+        older, recent = self._split(self.base.messages)
+        if not older:
+            return recent
+        entry = self._summaries.get(self.session_id)
+        if self._pending(older, entry):
+            # 摘要落後時先用上一版摘要回應，由背景執行緒補上
+            _executor.submit(self._refresh_summary)
+        summary = entry["summary"] if entry else ""
+        if not summary:
+            return recent
+        return [SystemMessage(content=f"先前對話摘要：{summary}")] + recent
+
+    def _refresh_summary(self):
+        try:
+            older, _ = self._split(self.base.messages)
+            if older:
+                self._summarize(older)
+        except Exception:
+            logger.exception(f"session {self.session_id} 背景摘要更新失敗")
+
+    def add_messages(self, messages) -> None:
+        self.base.add_messages(messages)
+        _executor.submit(self._refresh_summary)
+
+    def clear(self) -> None:
+        self.base.clear()
+        self._summaries.pop(self.session_id)
+
+
+class PromptTokenCounter(BaseCallbackHandler):
+    """記錄每次 LLM 呼叫的 prompt token 數，request 結束後可由 total 取得總量"""
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.calls = []
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._record(sum(count_tokens(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._record(sum(_message_tokens(m) for batch in messages for m in batch))
+
+    def _record(self, tokens):
+        self.calls.append(tokens)
+        logger.info(
+            f"session {self.session_id} 第 {len(self.calls)} 次 LLM 呼叫 prompt：{tokens} tokens（本次請求累計 {self.total}）"
+        )
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls)
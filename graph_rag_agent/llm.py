@@ -1,42 +1,69 @@
-
 from dotenv import load_dotenv
 import os
-from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
+try:
+    from .components import lazy_component
+except ImportError:
+    from components import lazy_component
 
 # 確保環境變數已載入
 load_dotenv()
 
 # 檢查並設定默認環境變數值
-if not os.getenv("OPENAI_API_KEY"):
-    raise ValueError("OPENAI_API_KEY 環境變數未設定！")
-
 if not os.getenv("OPENAI_MODEL"):
     os.environ["OPENAI_MODEL"] = "gpt-4.1-mini"
 
 if not os.getenv("OPENAI_EMBEDDING_MODEL"):
     os.environ["OPENAI_EMBEDDING_MODEL"] = "text-embedding-ada-002"
 
+
+def _require_openai_key():
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY 環境變數未設定！")
+
+
 # 建立 LLM 模型實例
-llm_GPT = ChatOpenAI(
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    model=os.getenv("OPENAI_MODEL"),
-    max_retries=2,
-    temperature=0
-)
+@lazy_component("llm_gpt")
+def get_llm_GPT():
+    from langchain_openai import ChatOpenAI
+    _require_openai_key()
+    return ChatOpenAI(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        model=os.getenv("OPENAI_MODEL"),
+        max_retries=2,
+        temperature=0
+    )
 
 # 建立 Google 的 LLM 模型實例
-llm_gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-preview-04-17",
-    temperature=0,
-    max_retries=2,
-    cache=False,
-    google_api_key=os.getenv("GOOGLE_API_KEY")  
-)
+@lazy_component("llm_gemini")
+def get_llm_gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash-preview-04-17",
+        temperature=0,
+        max_retries=2,
+        cache=False,
+        google_api_key=os.getenv("GOOGLE_API_KEY")  
+    )
 
 # 建立 Embedding 模型
-embeddings = OpenAIEmbeddings(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model=os.getenv("OPENAI_EMBEDDING_MODEL")
-)
\ No newline at end of file
+@lazy_component("embeddings")
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    _require_openai_key()
+    return OpenAIEmbeddings(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model=os.getenv("OPENAI_EMBEDDING_MODEL")
+    )
+
+
+_LEGACY_NAMES = {
+    "llm_GPT": get_llm_GPT,
+    "llm_gemini": get_llm_gemini,
+    "embeddings": get_embeddings,
+}
+
+def __getattr__(name):
+    # 相容舊的 `from llm import llm_GPT, llm_gemini` 寫法（存取時才建立）
+    if name in _LEGACY_NAMES:
+        return _LEGACY_NAMES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,17 +1,27 @@
+"""多代理（GraphRAG + 事實查核）流程：每個行程只編譯一次，提供 invoke / ainvoke / batch 入口"""
+import os
 from langgraph.prebuilt import create_react_agent
-from langgraph_supervisor import create_supervisor
+from langgraph.graph import StateGraph, START, END
 from langchain_core.tools import tool
-from research import graph_rag
-from fact_check import search_fact_checks
-from cofacts_check import search_cofacts
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableLambda
+from .research import graph_rag
+from .fact_check import search_fact_checks
 from langgraph.graph import MessagesState
-from langchain_core.messages import SystemMessage, HumanMessage
-from llm import llm_GPT, llm_gemini
-from typing import Literal
-memory=MemorySaver()
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, RemoveMessage, ToolMessage
+from .llm import get_llm_gemini
+from .components import lazy_component
+from .checkpointer import get_checkpointer
+
+# 每個 thread 在 checkpoint 中保留的訊息數上限，較舊的訊息會被移除
+THREAD_MESSAGE_WINDOW = int(os.getenv("THREAD_MESSAGE_WINDOW", "20"))
+NO_FACT_CHECK_RESULT = "查無相關審查結果"
+# 查無審查結果時取代 fact_check_agent 的文字，避免 supervisor 依代理人的臆測回答查核結論
+NO_FACT_CHECK_NOTE = "（Google Fact Check 查無與此問題相關的審查結果，請勿提及或推測查核結論）"
+
 class AgentState(MessagesState):
-    FactChecked: bool=False
+    FactChecked: bool
+    graphrag_result: str
+    fact_check_result: str
 
 @tool
 def graphrag_tool(query: str) -> str:
@@ -31,7 +41,7 @@ def graphrag_tool(query: str) -> str:
     return result
 
 @tool
-def google_fact_check_tool(query: str,state: AgentState) -> str:
+def google_fact_check_tool(query: str) -> str:
     """
     You must use this tool when supervisor asks you to fact-check a claim.
 
@@ -54,29 +64,13 @@ def google_fact_check_tool(query: str,state: AgentState) -> str:
                         result += f"  審查結果: {review.get('textualRating')}\n"
                         result += f"  來源連結: {review.get('url')}\n"
                 result += "-" * 20 + "\n"
-            state["FactChecked"]=True
         else:
-            result += "查無相關審查結果\n"
+            result += f"{NO_FACT_CHECK_RESULT}\n"
     
     return result
 
 
-@tool
-def should_continue(state: AgentState) -> Literal["GraphRAG","__end__"]:
-    """
-    Defined the condition to continue the workflow.
-    """
-    if state['FactChecked'] == True:
-        return "__end__"
-    else:
-        return "GraphRAG"
-    
-graphrag_agent = create_react_agent(
-    model=llm_gemini,  
-    tools=[graphrag_tool], 
-    name="graphrag_agent",
-    prompt=
-    """
+GRAPHRAG_AGENT_PROMPT = """
     Role:
         You are a medical expert providing information about medical knowledge.
     Task:
@@ -86,15 +80,8 @@ graphrag_agent = create_react_agent(
             1.Languages other than Traditional Chinese are not allowed
             2. Do not use pre-trained knowledge, only use the information provided in the context.
     """
-    
-)
 
-fact_check_agent = create_react_agent(
-    model=llm_gemini,
-    tools=[google_fact_check_tool], 
-    name="fact_check_agent",
-    prompt=
-    """
+FACT_CHECK_AGENT_PROMPT = """
     Role:
         You are a fact-checking expert.
     Task:
@@ -105,30 +92,159 @@ fact_check_agent = create_react_agent(
             2. Do not use pre-trained knowledge, only use the information provided in the context.
             3. Only use the provided tool to fact-check claims, do not use any other methods.
     """
+
+SUPERVISOR_PROMPT = """
+You are a supervisor who manages multiple agents.
+The `graphrag_agent` answered the user's medical question, and the `fact_check_agent` checked the user query for factual accuracy.
+Combine the results of `fact_check_agent` and `graphrag_agent` to respond to user.
+Languages other than Traditional Chinese are not allowed.
+"""
+
+
+@lazy_component("graphrag_agent")
+def get_graphrag_agent():
+    return create_react_agent(
+        model=get_llm_gemini(),
+        tools=[graphrag_tool],
+        name="graphrag_agent",
+        prompt=GRAPHRAG_AGENT_PROMPT,
     )
-    
 
 
-supervisor = create_supervisor(
-    agents=[graphrag_agent, fact_check_agent],
-    tools=[should_continue],
-    model=llm_gemini,
-    prompt=(
-        """
-        You are a supervisor who manages multiple agents.
-        First,you need to use the `graphrag_agent` to answer medical questions.
-        Second, you need to use the `fact_check_agent` to check the user query for factual accuracy.
-        Last,you need to `fact_check_agent` and `graphrag_agent` respond to user.
-        """
+@lazy_component("fact_check_agent")
+def get_fact_check_agent():
+    return create_react_agent(
+        model=get_llm_gemini(),
+        tools=[google_fact_check_tool],
+        name="fact_check_agent",
+        prompt=FACT_CHECK_AGENT_PROMPT,
     )
-)
 
 
-# Compile and run
-app = supervisor.compile(checkpointer=memory)
-config = {"configurable": {"thread_id": "1"}}
-while True:
-    message=HumanMessage(content=input("輸入你的問題: "))
-    result = app.invoke(input={'messages':message},config=config)
-    for m in result["messages"]:
-        m.pretty_print()
\ No newline at end of file
+def _latest_question(state: AgentState) -> str:
+    """取出最新一則使用者訊息"""
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+def _last_content(result) -> str:
+    return result["messages"][-1].content
+
+
+def _fact_check_update(result):
+    """
+    FactChecked 依 google_fact_check_tool 的實際輸出判斷，不解析代理人改寫後的最終文字：
+    至少一次呼叫找到審查結果才為 True（查無結果、API 失敗或未設定金鑰時工具回傳的內容不符合）
+    """
+    fact_checked = any(
+        isinstance(message, ToolMessage) and message.name == google_fact_check_tool.name
+        and message.content.strip() and NO_FACT_CHECK_RESULT not in message.content
+        for message in result["messages"]
+    )
+    return {"fact_check_result": _last_content(result), "FactChecked": fact_checked}
+
+
+def _supervisor_messages(state: AgentState):
+    fact_check = state.get('fact_check_result', '') if state.get('FactChecked') else NO_FACT_CHECK_NOTE
+    context = (
+        f"[graphrag_agent]\n{state.get('graphrag_result', '')}\n\n"
+        f"[fact_check_agent]\n{fact_check}"
+    )
+    return [SystemMessage(content=SUPERVISOR_PROMPT)] + state["messages"] + [SystemMessage(content=context)]
+
+
+def _supervisor_update(state: AgentState, content: str):
+    """加入最終回答，並移除超出 THREAD_MESSAGE_WINDOW 的舊訊息，讓 checkpoint 大小固定"""
+    excess = len(state["messages"]) + 1 - THREAD_MESSAGE_WINDOW
+    removed = [RemoveMessage(id=m.id) for m in state["messages"][:max(excess, 0)]]
+    return {"messages": removed + [AIMessage(content=content, name="supervisor")]}
+
+
+# 每個節點同時提供同步與非同步實作，讓 invoke 與 ainvoke 都能使用
+def graphrag_node(state: AgentState):
+    """分支一：醫療知識圖譜 RAG"""
+    result = get_graphrag_agent().invoke({"messages": [HumanMessage(content=_latest_question(state))]})
+    return {"graphrag_result": _last_content(result)}
+
+
+async def agraphrag_node(state: AgentState):
+    result = await get_graphrag_agent().ainvoke({"messages": [HumanMessage(content=_latest_question(state))]})
+    return {"graphrag_result": _last_content(result)}
+
+
+def fact_check_node(state: AgentState):
+    """分支二：Google Fact Check 查核"""
+    result = get_fact_check_agent().invoke({"messages": [HumanMessage(content=_latest_question(state))]})
+    return _fact_check_update(result)
+
+
+async def afact_check_node(state: AgentState):
+    result = await get_fact_check_agent().ainvoke({"messages": [HumanMessage(content=_latest_question(state))]})
+    return _fact_check_update(result)
+
+
+def supervisor_node(state: AgentState):
+    """匯整兩個分支的結果並產生最終回答"""
+    response = get_llm_gemini().invoke(_supervisor_messages(state))
+    return _supervisor_update(state, response.content)
+
+
+async def asupervisor_node(state: AgentState):
+    response = await get_llm_gemini().ainvoke(_supervisor_messages(state))
+    return _supervisor_update(state, response.content)
+
+
+def build_supervisor_graph() -> StateGraph:
+    """
+    fan-out / fan-in：兩個 agent 在同一個 superstep 中並行執行，延遲為 max(a, b) 而非 a + b
+    """
+    workflow = StateGraph(AgentState)
+    workflow.add_node("graphrag_agent", RunnableLambda(graphrag_node, afunc=agraphrag_node))
+    workflow.add_node("fact_check_agent", RunnableLambda(fact_check_node, afunc=afact_check_node))
+    workflow.add_node("supervisor", RunnableLambda(supervisor_node, afunc=asupervisor_node))
+    workflow.add_edge(START, "graphrag_agent")
+    workflow.add_edge(START, "fact_check_agent")
+    workflow.add_edge(["graphrag_agent", "fact_check_agent"], "supervisor")
+    workflow.add_edge("supervisor", END)
+    return workflow
+
+
+@lazy_component("multi_agent_app")
+def get_app():
+    """編譯後的多代理流程（每個行程只編譯一次），對話狀態存於 SQLite checkpointer"""
+    return build_supervisor_graph().compile(checkpointer=get_checkpointer())
+
+
+def _config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _input(question: str):
+    return {"messages": [HumanMessage(content=question)]}
+
+
+def invoke(question: str, thread_id: str) -> dict:
+    """同步執行一輪對話，thread_id 區分不同會話的記憶"""
+    return get_app().invoke(_input(question), _config(thread_id))
+
+
+async def ainvoke(question: str, thread_id: str) -> dict:
+    """非同步執行一輪對話"""
+    return await get_app().ainvoke(_input(question), _config(thread_id))
+
+
+def batch(requests) -> list:
+    """批次執行多個 (question, thread_id)，各請求並行處理"""
+    return get_app().batch([_input(q) for q, _ in requests], [_config(t) for _, t in requests])
+
+
+async def abatch(requests) -> list:
+    """batch 的非同步版本"""
+    return await get_app().abatch([_input(q) for q, _ in requests], [_config(t) for _, t in requests])
+
+
+def final_answer(result: dict) -> str:
+    """取出 supervisor 的最終回答文字"""
+    return result["messages"][-1].content
@@ -0,0 +1,228 @@
+"""
+Neo4j 對話歷史後端（與 Neo4jChatMessageHistory 相同的資料模型：
+(:Session)-[:LAST_MESSAGE]->(:Message)，訊息之間以 [:NEXT] 串接）
+- 讀取視窗只需一次查詢，並以 Session.id 唯一約束（索引）定位
+- 一輪對話的多則訊息以單一 UNWIND 寫入交易完成
+- 可選擇在背景批次寫入，讀取時會合併尚未寫入的訊息
+- Session.message_count 記錄已寫入的訊息數，讀出的訊息以其在 session 中的序號作為 message.id
+"""
+import atexit
+import logging
+import os
+import threading
+import zlib
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+# 設為 true 時訊息先放入記憶體佇列，由背景執行緒批次寫入 Neo4j
+ASYNC_WRITES = os.getenv("NEO4J_HISTORY_ASYNC_WRITES", "false").lower() == "true"
+FLUSH_INTERVAL = float(os.getenv("NEO4J_HISTORY_FLUSH_INTERVAL", "0.5"))  # 背景寫入間隔（秒）
+
+SESSION_LABEL = "Session"
+
+SCHEMA_QUERY = f"CREATE CONSTRAINT session_id_unique IF NOT EXISTS FOR (s:`{SESSION_LABEL}`) REQUIRE s.id IS UNIQUE"
+
+# 只有一條路徑符合：長度剛好為視窗大小，或已到達第一則訊息
+GET_WINDOW_QUERY = (
+    "MATCH (s:`{label}` {{id: $session_id}})-[:LAST_MESSAGE]->(last) "
+    "MATCH p = (last)<-[:NEXT*0..{window}]-(first) "
+    "WHERE length(p) = {window} OR NOT (first)<-[:NEXT]-() "
+    "WITH s, p LIMIT 1 "
+    "UNWIND reverse(nodes(p)) AS node "
+    "RETURN node.type AS type, node.content AS content, coalesce(s.message_count, 0) AS count"
+)
+
+# 新訊息依序串在原本的最後一則之後，LAST_MESSAGE 移到新的最後一則
+APPEND_QUERY = (
+    f"MERGE (s:`{SESSION_LABEL}` {{id: $session_id}}) "
+    "WITH s "
+    "OPTIONAL MATCH (s)-[lm:LAST_MESSAGE]->(last) "
+    "DELETE lm "
+    "WITH s, last "
+    "UNWIND $messages AS message "
+    "CREATE (m:Message {type: message.type, content: message.content}) "
+    "WITH s, last, collect(m) AS nodes "
+    "FOREACH (i IN range(0, size(nodes) - 2) | "
+    "  FOREACH (a IN [nodes[i]] | FOREACH (b IN [nodes[i + 1]] | CREATE (a)-[:NEXT]->(b)))) "
+    "FOREACH (a IN CASE WHEN last IS NULL THEN [] ELSE [last] END | "
+    "  FOREACH (b IN [nodes[0]] | CREATE (a)-[:NEXT]->(b))) "
+    "WITH s, nodes[size(nodes) - 1] AS tail, size(nodes) AS added "
+    "CREATE (s)-[:LAST_MESSAGE]->(tail) "
+    "SET s.message_count = coalesce(s.message_count, 0) + added"
+)
+
+CLEAR_QUERY = (
+    f"MATCH (s:`{SESSION_LABEL}` {{id: $session_id}})-[:LAST_MESSAGE]->(last) "
+    "MATCH p = (last)<-[:NEXT*0..]-(first) WHERE NOT (first)<-[:NEXT]-() "
+    "UNWIND nodes(p) AS node DETACH DELETE node"
+)
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def ensure_schema(driver, database=None):
+    """每個行程、每個資料庫只建立一次 Session.id 唯一約束"""
+    key = (id(driver), database)
+    if key in _schema_ready:
+        return
+    with _schema_lock:
+        if key not in _schema_ready:
+            try:
+                driver.execute_query(SCHEMA_QUERY, database_=database)
+            except Exception as e:
+                # 例如既有資料中已有重複的 Session.id；不影響讀寫，只是少了索引
+                logger.warning(f"無法建立 Session.id 唯一約束：{e}")
+            _schema_ready.add(key)
+
+
+def _serialize(messages):
+    return [{"type": m.type, "content": m.content} for m in messages]
+
+
+def _deserialize(rows, count=None):
+    """count 為 session 的訊息總數時，依序給每則訊息序號（最後一則為 count - 1）"""
+    first = None if count is None else count - len(rows)
+    return messages_from_dict([
+        {"type": row["type"], "data": {"content": row["content"], "id": None if first is None else str(first + i)}}
+        for i, row in enumerate(rows)
+    ])
+
+
+class _WriteBuffer:
+    """
+    背景批次寫入佇列。
+    每個 session 的讀取與寫入以分段鎖（依 session_id 雜湊）互斥，
+    確保讀取時同一批訊息不會同時出現在資料庫與佇列中。
+    """
+
+    STRIPES = 64
+
+    def __init__(self, driver, database=None, interval=FLUSH_INTERVAL):
+        self.driver = driver
+        self.database = database
+        self.interval = interval
+        self._pending = {}  # session_id -> [serialized message, ...]
+        self._pending_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.STRIPES)]
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="neo4j-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def stripe(self, session_id):
+        return self._stripes[zlib.crc32(str(session_id).encode()) % self.STRIPES]
+
+    def append(self, session_id, rows):
+        with self._pending_lock:
+            self._pending.setdefault(session_id, []).extend(rows)
+        self._wake.set()
+
+    def pending(self, session_id):
+        with self._pending_lock:
+            return list(self._pending.get(session_id, ()))
+
+    def discard(self, session_id):
+        with self._pending_lock:
+            self._pending.pop(session_id, None)
+
+    def flush(self):
+        with self._pending_lock:
+            session_ids = list(self._pending)
+        for session_id in session_ids:
+            with self.stripe(session_id):
+                rows = self.pending(session_id)
+                if not rows:
+                    continue
+                try:
+                    self.driver.execute_query(
+                        APPEND_QUERY, {"session_id": session_id, "messages": rows}, database_=self.database
+                    )
+                except Exception:
+                    logger.exception(f"session {session_id} 對話歷史寫入失敗，稍後重試")
+                    continue
+                with self._pending_lock:
+                    remaining = self._pending.get(session_id, [])[len(rows):]
+                    if remaining:
+                        self._pending[session_id] = remaining
+                    else:
+                        self._pending.pop(session_id, None)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+            # 累積一段時間再寫，把多輪對話合併成較少的交易
+            self._wake.wait(self.interval)
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(driver, database=None) -> _WriteBuffer:
+    key = (id(driver), database)
+    with _buffers_lock:
+        if key not in _buffers:
+            _buffers[key] = _WriteBuffer(driver, database)
+        return _buffers[key]
+
+
+class BatchedNeo4jChatMessageHistory(BaseChatMessageHistory):
+    """
+    取代 Neo4jChatMessageHistory：建立時不再執行 MERGE，也不會在回收時關閉共用的 driver。
+    window 為對話輪數，與原本相同讀取最近 window * 2 則訊息（含起點）。
+    """
+
+    def __init__(self, session_id, driver, database=None, window=3, async_writes=ASYNC_WRITES):
+        if not session_id:
+            raise ValueError("Please ensure that the session_id parameter is provided")
+        self.session_id = session_id
+        self.driver = driver
+        self.database = database
+        self.window = window
+        self._buffer = get_write_buffer(driver, database) if async_writes else None
+        ensure_schema(driver, database)
+
+    def _read(self):
+        records, _, _ = self.driver.execute_query(
+            GET_WINDOW_QUERY.format(label=SESSION_LABEL, window=self.window * 2),
+            {"session_id": self.session_id},
+            database_=self.database,
+            routing_="r",
+        )
+        return [record.data() for record in records]
+
+    @property
+    def messages(self):
+        if self._buffer is None:
+            rows = self._read()
+            return _deserialize(rows, rows[0]["count"] if rows else 0)
+        with self._buffer.stripe(self.session_id):
+            stored = self._read()
+            pending = self._buffer.pending(self.session_id)
+        count = (stored[0]["count"] if stored else 0) + len(pending)
+        return _deserialize((stored + pending)[-(self.window * 2 + 1):], count)
+
+    def add_messages(self, messages) -> None:
+        rows = _serialize(messages)
+        if not rows:
+            return
+        if self._buffer is not None:
+            self._buffer.append(self.session_id, rows)
+            return
+        self.driver.execute_query(
+            APPEND_QUERY, {"session_id": self.session_id, "messages": rows}, database_=self.database
+        )
+
+    def clear(self) -> None:
+        if self._buffer is not None:
+            with self._buffer.stripe(self.session_id):
+                self._buffer.discard(self.session_id)
+                self.driver.execute_query(CLEAR_QUERY, {"session_id": self.session_id}, database_=self.database)
+            return
+        self.driver.execute_query(CLEAR_QUERY, {"session_id": self.session_id}, database_=self.database)
@@ -0,0 +1,142 @@
+"""共用的 Neo4j driver：聊天歷史（Neo4jGraph）與 GraphRAG 檢索器共用同一個可調整的連線池"""
+import logging
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+
+try:
+    from .components import lazy_component
+except ImportError:
+    from components import lazy_component
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NEO4J_URI = os.getenv("NEO4J_URI")
+NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE")
+
+# 連線池設定：pool 大小建議為 (每個 worker 的並行請求數) x (每個請求同時使用的連線數)
+POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))  # 秒，超過後連線會被汰換
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "30"))  # 等待可用連線的上限（秒）
+CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "15"))  # 建立 TCP 連線的上限（秒）
+# 閒置超過此秒數的連線在取用前先確認仍可用；未設定時不檢查
+LIVENESS_CHECK_TIMEOUT = os.getenv("NEO4J_LIVENESS_CHECK_TIMEOUT")
+
+
+def driver_config() -> dict:
+    """GraphDatabase.driver 的連線池參數"""
+    config = {
+        "max_connection_pool_size": POOL_SIZE,
+        "max_connection_lifetime": CONNECTION_LIFETIME,
+        "connection_acquisition_timeout": ACQUISITION_TIMEOUT,
+        "connection_timeout": CONNECTION_TIMEOUT,
+        "keep_alive": True,
+    }
+    if LIVENESS_CHECK_TIMEOUT:
+        config["liveness_check_timeout"] = float(LIVENESS_CHECK_TIMEOUT)
+    return config
+
+
+class PoolStats:
+    """連線取得次數、等待時間與失敗（逾時）次數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, failed=False):
+        with self._lock:
+            if failed:
+                self.failures += 1
+                return
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "acquisition_failures": self.failures,
+                "avg_wait_ms": round(self.total_wait / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+            }
+
+
+_stats = PoolStats()
+
+
+def _instrument_pool(driver):
+    """
+    包裝 driver 內部連線池的 acquire 以量測等待時間。
+    neo4j driver 沒有公開的連線池指標，內部結構改變時只記錄警告，不影響查詢。
+    """
+    pool = getattr(driver, "_pool", None)
+    acquire = getattr(pool, "acquire", None)
+    if acquire is None:
+        logger.warning("無法取得 Neo4j 連線池，不提供等待時間指標")
+        return
+
+    def timed_acquire(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            connection = acquire(*args, **kwargs)
+        except Exception:
+            _stats.record(time.perf_counter() - started, failed=True)
+            raise
+        _stats.record(time.perf_counter() - started)
+        return connection
+
+    pool.acquire = timed_acquire
+
+
+@lazy_component("neo4j_driver")
+def get_driver():
+    """行程內共用的 Neo4j driver"""
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD), **driver_config())
+    _instrument_pool(driver)
+    return driver
+
+
+def pool_metrics() -> dict:
+    """目前的連線池狀態：上限、使用中與閒置連線數，以及連線取得的等待時間"""
+    metrics = {"max_size": POOL_SIZE, "in_use": None, "idle": None}
+    if get_driver.built:
+        pool = getattr(get_driver(), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None and hasattr(pool, "lock"):
+            with pool.lock:
+                all_connections = [c for per_address in connections.values() for c in per_address]
+            in_use = sum(1 for c in all_connections if getattr(c, "in_use", False))
+            metrics.update(in_use=in_use, idle=len(all_connections) - in_use)
+    metrics.update(_stats.snapshot())
+    return metrics
+
+
+def health_check() -> dict:
+    """確認 Neo4j 可連線並回傳延遲與連線池狀態"""
+    started = time.perf_counter()
+    try:
+        get_driver().execute_query("RETURN 1", database_=NEO4J_DATABASE)
+    except Exception as e:
+        return {"ok": False, "error": str(e), "pool": pool_metrics()}
+    return {
+        "ok": True,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "pool": pool_metrics(),
+    }
+
+
+if __name__ == "__main__":
+    # python -m graph_rag_agent.neo4j_pool：檢查連線並輸出連線池狀態
+    print(health_check())
@@ -1,20 +1,32 @@
-
-from neo4j import GraphDatabase
 from neo4j_graphrag.embeddings import OpenAIEmbeddings
-from vertexai.generative_models import GenerationConfig
-from neo4j_graphrag.llm.vertexai_llm import VertexAILLM
 from neo4j_graphrag.indexes import create_vector_index
-from neo4j_graphrag.retrievers import VectorRetriever
 from neo4j_graphrag.retrievers import VectorCypherRetriever
 from neo4j_graphrag.generation import RagTemplate
-from neo4j_graphrag.generation.graphrag import GraphRAG
 from neo4j_graphrag.llm import OpenAILLM
+import asyncio
+import logging
 import os
+import time
 from dotenv import load_dotenv
+try:
+    from .embedding_cache import CachedEmbedder
+    from .components import lazy_component
+    from .neo4j_pool import get_driver as get_shared_driver
+    from .retrieval_query import (build_retrieval_query, resolve_rank_by_relevance, retrieval_params,
+                                  format_structured, EXPANSION_MODE, STRUCTURED_CONTEXT, KG_RELS_SEPARATOR)
+    from .context_budget import pack_context
+except ImportError:
+    from embedding_cache import CachedEmbedder
+    from components import lazy_component
+    from neo4j_pool import get_driver as get_shared_driver
+    from retrieval_query import (build_retrieval_query, resolve_rank_by_relevance, retrieval_params,
+                                 format_structured, EXPANSION_MODE, STRUCTURED_CONTEXT, KG_RELS_SEPARATOR)
+    from context_budget import pack_context
 
 
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
@@ -23,36 +35,36 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY")
 
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD),database=NEO4J_DATABASE)
-embedder = OpenAIEmbeddings(model="text-embedding-ada-002", api_key=OPENAI_API_KEY)
-gen_config=GenerationConfig(temperature=0,response_mime_type="application/json")
-llm = OpenAILLM(model_name='gpt-4.1-mini',model_params={'temperature':0,"response_format": {"type": "json_object"}})
-
-
-create_vector_index(driver, name="text_embeddings", label="Chunk",
-                   embedding_property="embedding", dimensions=1536, similarity_fn="cosine")
-
-
-vc_retriever = VectorCypherRetriever(
-   driver,
-   index_name="text_embeddings",
-   embedder=embedder,
-   
-   retrieval_query="""
-//1) Go out 2-3 hops in the entity graph and get relationships
-WITH node AS chunk
-MATCH (chunk)<-[:FROM_CHUNK]-()-[relList:!FROM_CHUNK]-{1,2}()
-UNWIND relList AS rel
-
-//2) collect relationships and text chunks
-WITH collect(DISTINCT chunk) AS chunks,
- collect(DISTINCT rel) AS rels
-
-//3) format and return context
-RETURN '=== text ===n' + apoc.text.join([c in chunks | c.text], 'n---n') + 'nn=== kg_rels ===n' +
- apoc.text.join([r in rels | startNode(r).name + ' - ' + type(r) + '(' + coalesce(r.details, '') + ')' +  ' -> ' + endNode(r).name ], 'n---n') AS info
-"""
-)
+@lazy_component("rag_driver")
+def get_driver():
+   """取得共用的 Neo4j driver 並確認向量索引存在"""
+   driver = get_shared_driver()
+   create_vector_index(driver, name="text_embeddings", label="Chunk",
+                      embedding_property="embedding", dimensions=1536, similarity_fn="cosine",
+                      neo4j_database=NEO4J_DATABASE)
+   return driver
+
+@lazy_component("rag_llm")
+def get_llm():
+   return OpenAILLM(model_name='gpt-4.1-mini',model_params={'temperature':0,"response_format": {"type": "json_object"}})
+
+@lazy_component("rag_retriever")
+def get_retriever():
+   # 重複的問題直接從快取取得向量，不再呼叫 OpenAI embedding API
+   embedder = CachedEmbedder(
+      OpenAIEmbeddings(model="text-embedding-ada-002", api_key=OPENAI_API_KEY),
+      model="text-embedding-ada-002",
+   )
+   driver = get_driver()
+   # 依伺服器版本決定是否以 vector.similarity.cosine 排序關係（只在建立檢索器時查詢一次）
+   retrieval_query = build_retrieval_query(rank_by_relevance=resolve_rank_by_relevance(driver, NEO4J_DATABASE))
+   return VectorCypherRetriever(
+      driver,
+      index_name="text_embeddings",
+      embedder=embedder,
+      retrieval_query=retrieval_query,
+      neo4j_database=NEO4J_DATABASE,
+   )
 
 rag_template = RagTemplate(template=
 '''
@@ -77,24 +89,74 @@ If you are not sure about the answer, just say "I do not know the answer, please
 # Answer:
 ''', system_instructions="You are an expert in medcial field, your goal is provide imformation for elders using Neo4j.",expected_inputs=['query_text', 'context'])
 
-rag  = GraphRAG(llm=llm, retriever=vc_retriever, prompt_template=rag_template)
+NO_ANSWER = "I do not know the answer, please use another tool."
+
+def _split_sources(records):
+   """拆出資料來源：文字片段與知識圖譜關係"""
+   info = records[0]['info']
+   kg_rel_pos = info.find(KG_RELS_SEPARATOR)
+   return info[:kg_rel_pos], info[kg_rel_pos+len(KG_RELS_SEPARATOR):]
+
+def _retrieve(input:str):
+   """執行向量檢索 + 圖擴展，記錄查詢時間與 context 大小；回傳含 info 欄位的 records"""
+   started = time.perf_counter()
+   params = retrieval_params() if EXPANSION_MODE != "legacy" else None
+   vc_res = get_retriever().get_search_results(query_text=input, top_k=5, query_params=params)
+   records = vc_res.records
+   if records and EXPANSION_MODE != "legacy" and STRUCTURED_CONTEXT:
+      records = [{"info": format_structured(records)}]
+   context_size = sum(len(record["info"] or "") for record in records)
+   logger.info(f"GraphRAG 檢索耗時 {time.perf_counter() - started:.2f}s，context {context_size} 字")
+   return records
+
+def _build_prompt(input:str, records):
+   """以檢索結果組成 RagTemplate prompt（去重、依相關度排序並限制在 token 預算內）"""
+   context, _ = pack_context(input, [record['info'] for record in records])
+   return rag_template.format(query_text=input, context=context, examples="")
 
 def graph_rag(input:str):
-   
-   vc_res = vc_retriever.get_search_results(query_text=input, top_k=3)
-   kg_rel_pos = vc_res.records[0]['info'].find('nn=== kg_rels ===n')
-    
-    
-   kg_result_chunk = vc_res.records[0]['info'][:kg_rel_pos]
-   kg_result_relationships = vc_res.records[0]['info'][kg_rel_pos+len('nn=== kg_rels ===n'):]  
-    
-    # RAG answer
-   result = rag.search(input, retriever_config={'top_k':5})
-    
+   """
+   單次檢索的 GraphRAG：問題只做一次 embedding 與一次 Cypher 擴展，
+   同一份 context 同時用於來源拆分與 RagTemplate 生成。
+   """
+   # 檢索（embedding + 向量查詢 + 1~2 hop 擴展只執行一次）
+   records = _retrieve(input)
+   if not records:
+      return NO_ANSWER
+
+   kg_result_chunk, kg_result_relationships = _split_sources(records)
+
+   # RAG answer（直接使用上面的檢索結果，不再經過 rag.search 重新檢索）
+   prompt = _build_prompt(input, records)
+   result = get_llm().invoke(prompt, system_instruction=rag_template.system_instructions)
+
     # 整理輸出
-   #answer_with_source = f"{result.answer}\n資料來源:\n{kg_result_chunk}{kg_result_relationships}"
-   answer_with_source = result.answer
+   #answer_with_source = f"{result.content}\n資料來源:\n{kg_result_chunk}{kg_result_relationships}"
+   answer_with_source = result.content
    return answer_with_source
+
+async def agraph_rag(input:str):
+   """graph_rag 的非同步版本：同步的 Neo4j 檢索放到執行緒，LLM 使用非同步 OpenAI client"""
+   records = await asyncio.to_thread(_retrieve, input)
+   if not records:
+      return NO_ANSWER
+
+   prompt = _build_prompt(input, records)
+   result = await get_llm().ainvoke(prompt, system_instruction=rag_template.system_instructions)
+   return result.content
+
+_LEGACY_NAMES = {
+   "driver": get_driver,
+   "llm": get_llm,
+   "vc_retriever": get_retriever,
+}
+
+def __getattr__(name):
+   # 相容舊的模組層級名稱（存取時才建立）
+   if name in _LEGACY_NAMES:
+      return _LEGACY_NAMES[name]()
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
       # 測試輸入
       test_input = "糖尿病可以吃甜食嗎?"
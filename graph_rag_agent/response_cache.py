@@ -0,0 +1,164 @@
+"""語意回應快取：相近的醫療問題直接回傳先前的答案，不再跑完整的 Agent 流程"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from .embedding_cache import get_embedding_cache, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 與地點相關的問題答案因人而異，不可快取
+LOCATION_KEYWORDS = ['位置', '附近', '醫院', '診所', '藥局', '地點', '地圖', '怎麼去', '路線']
+# 指涉先前對話內容的問題，答案取決於會話歷史，不可快取
+SESSION_KEYWORDS = ['剛剛', '剛才', '上面', '之前', '前面', '你說', '繼續', '還有呢', '那個', '這個', '它', '我的']
+
+# 向量相似度分不出只差在疾病、藥名或劑量的問題（「糖尿病可以吃甜食嗎」/「高血壓可以吃甜食嗎」），
+# 命中前另外比對兩個問題的字面內容：數字需完全相同，去除虛詞後的內容字元 Jaccard 需達 MIN_TERM_OVERLAP
+MIN_TERM_OVERLAP = float(os.getenv("RESPONSE_CACHE_MIN_OVERLAP", "0.8"))
+FUNCTION_WORDS = ['請問', '可以', '可不可以', '能不能', '是不是', '會不會', '有沒有', '什麼', '怎麼', '為什麼', '如何',
+                  '嗎', '呢', '吧', '啊', '呀', '的', '了', '是', '能', '會', '要', '該', '我', '你', '嗯']
+_ALNUM_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CHINESE_NUMBER_PATTERN = re.compile(r"[零〇一二兩三四五六七八九十百千萬]+")
+_FUNCTION_PATTERN = re.compile("|".join(sorted(FUNCTION_WORDS, key=len, reverse=True)))
+
+
+def is_cacheable(question: str, location_info=None) -> bool:
+    """判斷問題是否與地點、會話無關，可以共用答案"""
+    if location_info:
+        return False
+    text = normalize_text(question)
+    if len(text) < 4:
+        return False
+    return not any(k in text for k in LOCATION_KEYWORDS + SESSION_KEYWORDS)
+
+
+def question_terms(question: str):
+    """比對用的 (數字集合, 內容詞集合)：英數詞（如 hba1c）整個算一個詞，中文為去除虛詞與標點後的單一字元"""
+    text = normalize_text(question).lower()
+    tokens = _ALNUM_PATTERN.findall(text)
+    text = _ALNUM_PATTERN.sub(" ", text)
+    numbers = {token for token in tokens if token.replace(".", "").isdigit()}
+    numbers.update(_CHINESE_NUMBER_PATTERN.findall(text))
+    text = _FUNCTION_PATTERN.sub("", _CHINESE_NUMBER_PATTERN.sub(" ", text))
+    chars = (ch for ch in text if not ch.isspace() and unicodedata.category(ch)[0] not in "PS")
+    return frozenset(numbers), frozenset(token for token in tokens if token not in numbers).union(chars)
+
+
+def terms_match(a, b, min_overlap=MIN_TERM_OVERLAP) -> bool:
+    """兩個問題的數字完全相同，且內容詞的 Jaccard 相似度達 min_overlap"""
+    (numbers_a, content_a), (numbers_b, content_b) = a, b
+    if numbers_a != numbers_b:
+        return False
+    union = content_a | content_b
+    return not union or len(content_a & content_b) / len(union) >= min_overlap
+
+
+class SemanticResponseCache:
+    """
+    以問題向量的餘弦相似度查找已回答過的問題。
+    - 相似度需高於 threshold，且字面內容一致（terms_match）才算命中
+    - 每筆資料在 ttl 秒後失效
+    - 超過 max_entries 時淘汰最早寫入的資料
+    """
+
+    def __init__(self, embeddings, model: str, threshold=0.97, ttl=24 * 3600, max_entries=5000,
+                 min_overlap=MIN_TERM_OVERLAP, embedding_cache=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.embedding_cache = embedding_cache
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._entries = []  # 與 _vectors 同順序：{"question", "terms", "response", "expires_at"}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        cache = self.embedding_cache or get_embedding_cache()
+        vector = cache.get(self.model, question)
+        if vector is None:
+            vector = self.embeddings.embed_query(normalize_text(question))
+            cache.put(self.model, question, vector)
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        keep = [i for i, entry in enumerate(self._entries) if entry["expires_at"] > now]
+        if len(keep) != len(self._entries):
+            self._entries = [self._entries[i] for i in keep]
+            self._vectors = self._vectors[keep]
+
+    def lookup(self, question: str):
+        """回傳命中的快取回應，未命中回傳 None"""
+        vector = self._embed(question)
+        terms = question_terms(question)
+        with self._lock:
+            self._purge_expired()
+            if not self._entries:
+                self._misses += 1
+                return None
+            similarities = self._vectors @ vector
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            # 相似度由高到低，取第一筆字面內容也一致的資料
+            for index in candidates[np.argsort(-similarities[candidates])]:
+                entry = self._entries[index]
+                if terms_match(terms, entry["terms"], self.min_overlap):
+                    self._hits += 1
+                    break
+                logger.debug(f"語意快取略過字面不符的候選 (相似度 {similarities[index]:.3f}): {entry['question']}")
+            else:
+                self._misses += 1
+                return None
+        logger.info(f"語意快取命中 (相似度 {similarities[index]:.3f}): {entry['question']}")
+        return entry["response"]
+
+    def store(self, question: str, response: dict) -> None:
+        """寫入一筆回應"""
+        vector = self._embed(question)
+        with self._lock:
+            entry = {"question": question, "terms": question_terms(question), "response": response,
+                     "expires_at": time.time() + self.ttl}
+            if self._vectors.size == 0:
+                self._vectors = vector[np.newaxis, :]
+            else:
+                self._vectors = np.vstack([self._vectors, vector])
+            self._entries.append(entry)
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._entries = self._entries[overflow:]
+                self._vectors = self._vectors[overflow:]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = np.empty((0, 0), dtype=np.float32)
+            self._entries = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def create_response_cache(embeddings) -> SemanticResponseCache:
+    """依環境變數建立語意快取"""
+    return SemanticResponseCache(
+        embeddings,
+        model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002"),
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.97")),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600))),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+    )
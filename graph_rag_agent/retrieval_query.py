@@ -0,0 +1,181 @@
+"""
+VectorCypherRetriever 的擴展查詢產生器。
+原本的查詢對每個 chunk 的實體做不設限的 1~2 hop 擴展，遇到「糖尿病」這類 hub 實體時
+會展開成上千條關係；這裡改成有上限、可調整的版本：
+- 每個 chunk 最多保留 rels_per_chunk 條關係
+- 可限制關係類型（allow-list）
+- 不經由度數超過 max_degree 的 hub 節點繼續擴展
+- 依與問題向量的相似度（$query_vector）、距離與度數排序
+"""
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# 相容原本格式的分隔字串（research._split_sources 依此拆分）
+TEXT_HEADER = '=== text ===n'
+KG_RELS_SEPARATOR = 'nn=== kg_rels ===n'
+ITEM_SEPARATOR = 'n---n'
+
+# legacy：原本不設限的查詢；bounded：有上限的擴展
+EXPANSION_MODE = os.getenv("RAG_EXPANSION_MODE", "bounded")
+EXPANSION_HOPS = int(os.getenv("RAG_EXPANSION_HOPS", "2"))
+RELS_PER_CHUNK = int(os.getenv("RAG_RELS_PER_CHUNK", "30"))
+REL_TYPES = [t.strip() for t in os.getenv("RAG_REL_TYPES", "").split(",") if t.strip()]  # 空白表示不限制
+MAX_DEGREE = int(os.getenv("RAG_MAX_DEGREE", "200"))  # 0 表示不做度數剪枝
+# 以實體節點的 embedding 屬性與問題向量計算相似度（需 Neo4j 5.18+ 的 vector.similarity.cosine）
+# auto：建立檢索器時查詢一次伺服器版本，較舊的版本改以距離與度數排序
+RANK_BY_RELEVANCE = os.getenv("RAG_RANK_BY_RELEVANCE", "auto").lower()
+VECTOR_SIMILARITY_MIN_VERSION = (5, 18)
+ENTITY_EMBEDDING_PROPERTY = os.getenv("RAG_ENTITY_EMBEDDING_PROPERTY", "embedding")
+# true 時每個 chunk 回傳一列結構化資料，由 Python 組成 context，不再於資料庫中串接大字串
+STRUCTURED_CONTEXT = os.getenv("RAG_STRUCTURED_CONTEXT", "false").lower() == "true"
+
+LEGACY_RETRIEVAL_QUERY = """
+//1) Go out 2-3 hops in the entity graph and get relationships
+WITH node AS chunk
+MATCH (chunk)<-[:FROM_CHUNK]-()-[relList:!FROM_CHUNK]-{1,2}()
+UNWIND relList AS rel
+
+//2) collect relationships and text chunks
+WITH collect(DISTINCT chunk) AS chunks,
+ collect(DISTINCT rel) AS rels
+
+//3) format and return context
+RETURN '=== text ===n' + apoc.text.join([c in chunks | c.text], 'n---n') + 'nn=== kg_rels ===n' +
+ apoc.text.join([r in rels | startNode(r).name + ' - ' + type(r) + '(' + coalesce(r.details, '') + ')' +  ' -> ' + endNode(r).name ], 'n---n') AS info
+"""
+
+_ONE_HOP = """
+    WITH chunk
+    MATCH (chunk)<-[:FROM_CHUNK]-(entity)-[rel:!FROM_CHUNK]-(other)
+    WHERE {rel_filter}
+    RETURN rel, other, 1 AS distance"""
+
+_TWO_HOP = """
+    UNION
+    WITH chunk
+    MATCH (chunk)<-[:FROM_CHUNK]-(entity)-[r1:!FROM_CHUNK]-(mid)
+    WHERE {r1_filter}{degree_filter}
+    MATCH (mid)-[rel:!FROM_CHUNK]-(other)
+    WHERE rel <> r1 AND other <> entity AND {rel_filter}
+    RETURN rel, other, 2 AS distance"""
+
+_BOUNDED_QUERY = """
+//1) 每個 chunk 各自擴展並排序，只保留前 $rels_per_chunk 條關係
+WITH node AS chunk, score
+CALL {{
+  WITH chunk
+  CALL {{{one_hop}{two_hop}
+  }}
+  WITH rel, min(distance) AS distance, collect(other)[0] AS other
+  WITH rel, distance, {relevance} AS relevance, COUNT {{ (other)--() }} AS degree
+  ORDER BY relevance DESC, distance ASC, degree ASC
+  LIMIT $rels_per_chunk
+  RETURN collect({{
+    start: coalesce(startNode(rel).name, ''), type: type(rel),
+    details: coalesce(rel.details, ''), end: coalesce(endNode(rel).name, ''), relevance: relevance
+  }}) AS rels
+}}
+"""
+
+_STRUCTURED_RETURN = """
+//2) 每個 chunk 一列
+RETURN chunk.text AS text, score, rels
+"""
+
+_STRING_RETURN = """
+//2) 合併所有 chunk，去除重複關係後輸出與原本相同格式的字串
+WITH collect(chunk.text) AS texts, collect(rels) AS rel_lists
+WITH texts, reduce(acc = [], l IN rel_lists | acc + [r IN l WHERE NOT r IN acc]) AS rels
+RETURN '=== text ===n' + apoc.text.join(texts, 'n---n') + 'nn=== kg_rels ===n' +
+ apoc.text.join([r IN rels | r.start + ' - ' + r.type + '(' + r.details + ')' + ' -> ' + r.end], 'n---n') AS info
+"""
+
+
+def _parse_version(version):
+    """'5.26.0'、'5.18-aura'、'2025.01.0' -> (5, 26)、(5, 18)、(2025, 1)"""
+    numbers = [int(n) for n in re.findall(r"\d+", version or "")[:2]]
+    return tuple(numbers + [0] * (2 - len(numbers)))
+
+
+def supports_vector_similarity(driver, database=None) -> bool:
+    """伺服器是否提供 vector.similarity.cosine（Neo4j 5.18+）；查詢失敗時視為不支援"""
+    try:
+        records, _, _ = driver.execute_query(
+            "CALL dbms.components() YIELD name, versions WHERE name = 'Neo4j Kernel' RETURN versions[0] AS version",
+            database_=database,
+        )
+        version = records[0]["version"] if records else None
+    except Exception as e:
+        logger.warning(f"無法取得 Neo4j 版本，不以相似度排序關係：{e}")
+        return False
+    supported = _parse_version(version) >= VECTOR_SIMILARITY_MIN_VERSION
+    if not supported:
+        logger.info(f"Neo4j {version} 不支援 vector.similarity.cosine，關係改以距離與度數排序")
+    return supported
+
+
+def resolve_rank_by_relevance(driver, database=None, setting=RANK_BY_RELEVANCE) -> bool:
+    """將 RAG_RANK_BY_RELEVANCE（true / false / auto）轉為是否以相似度排序"""
+    if setting == "auto":
+        return supports_vector_similarity(driver, database)
+    return setting == "true"
+
+
+def build_retrieval_query(mode=EXPANSION_MODE, hops=EXPANSION_HOPS, rel_types=REL_TYPES, max_degree=MAX_DEGREE,
+                          rank_by_relevance=False, structured=STRUCTURED_CONTEXT):
+    """
+    產生 retrieval_query。
+    上限、關係類型與度數門檻以查詢參數傳入（見 retrieval_params），只有結構性選項會改變查詢字串。
+    rank_by_relevance 需先以 resolve_rank_by_relevance 確認伺服器支援。
+    """
+    if mode == "legacy":
+        return LEGACY_RETRIEVAL_QUERY
+    if hops not in (1, 2):
+        raise ValueError("RAG_EXPANSION_HOPS 只支援 1 或 2")
+
+    rel_filter = "type(rel) IN $allowed_types" if rel_types else "true"
+    r1_filter = "type(r1) IN $allowed_types" if rel_types else "true"
+    # 度數剪枝只套用在第二跳經過的中間節點：chunk 自己的實體（常是問題的主題，如「糖尿病」）
+    # 即使度數很高也保留，其第一跳的關係數已由每個 chunk 的 LIMIT $rels_per_chunk 限制
+    degree_filter = " AND COUNT { (mid)--() } <= $max_degree" if max_degree else ""
+    if rank_by_relevance:
+        relevance = f"coalesce(vector.similarity.cosine($query_vector, other.`{ENTITY_EMBEDDING_PROPERTY}`), 0.0)"
+    else:
+        relevance = "0.0"
+
+    two_hop = ""
+    if hops == 2:
+        two_hop = _TWO_HOP.format(r1_filter=r1_filter, degree_filter=degree_filter, rel_filter=rel_filter)
+    query = _BOUNDED_QUERY.format(
+        one_hop=_ONE_HOP.format(rel_filter=rel_filter),
+        two_hop=two_hop,
+        relevance=relevance,
+    )
+    return query + (_STRUCTURED_RETURN if structured else _STRING_RETURN)
+
+
+def retrieval_params(rels_per_chunk=RELS_PER_CHUNK, rel_types=REL_TYPES, max_degree=MAX_DEGREE) -> dict:
+    """bounded 查詢所需的參數，傳給 get_search_results(query_params=...)"""
+    return {
+        "rels_per_chunk": rels_per_chunk,
+        "allowed_types": list(rel_types),
+        "max_degree": max_degree,
+    }
+
+
+def format_structured(records) -> str:
+    """將結構化結果組成與原本相同格式的 context 字串（關係依出現順序去重）"""
+    texts = []
+    rels = []
+    seen = set()
+    for record in records:
+        texts.append(record["text"] or "")
+        for rel in record["rels"]:
+            key = (rel["start"], rel["type"], rel["details"], rel["end"])
+            if key not in seen:
+                seen.add(key)
+                rels.append(f"{rel['start']} - {rel['type']}({rel['details']}) -> {rel['end']}")
+    return TEXT_HEADER + ITEM_SEPARATOR.join(texts) + KG_RELS_SEPARATOR + ITEM_SEPARATOR.join(rels)
@@ -0,0 +1,212 @@
+"""
+Cofacts 文章相似度服務：
+- SentenceTransformer 模型每個行程只載入一次（或在預先啟動的 process pool 中各載入一次）
+- 同時進來的查詢由背景執行緒合併成一次批次 encode
+- 文章向量依 Cofacts article id 快取，不再重複 encode
+- 以 numpy 矩陣運算計算餘弦相似度並取 top-k
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from cachetools import LRUCache
+
+try:
+    from .components import lazy_component
+    from .embedding_cache import cached_encode
+except ImportError:
+    from components import lazy_component
+    from embedding_cache import cached_encode
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = os.getenv("SIMILARITY_MODEL", "multi-qa-mpnet-base-dot-v1")
+BATCH_WINDOW = float(os.getenv("SIMILARITY_BATCH_WINDOW_MS", "10")) / 1000  # 等待其他查詢加入同一批的時間
+MAX_BATCH = int(os.getenv("SIMILARITY_MAX_BATCH", "64"))
+ARTICLE_CACHE_SIZE = int(os.getenv("SIMILARITY_ARTICLE_CACHE_SIZE", "20000"))
+# 大於 0 時以多個行程平行 encode（每個行程各自載入模型），避免佔住主行程的 GIL
+PROCESS_POOL_SIZE = int(os.getenv("SIMILARITY_PROCESS_POOL", "0"))
+
+
+_worker_model = None
+
+
+def _init_worker(model_name):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+    _worker_model.encode(["warm up"])
+
+
+def _worker_encode(sentences):
+    return _worker_model.encode(sentences)
+
+
+class _PooledModel:
+    """與 SentenceTransformer.encode 相同介面，實際在 process pool 中執行"""
+
+    def __init__(self, model_name, processes):
+        self._executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(model_name,))
+        # 先送出一個工作，讓每個行程在第一個請求之前就載入模型
+        for future in [self._executor.submit(_worker_encode, ["warm up"]) for _ in range(processes)]:
+            future.result()
+
+    def encode(self, sentences):
+        return self._executor.submit(_worker_encode, list(sentences)).result()
+
+
+@lazy_component("sentence_transformer", budget=30)
+def get_model():
+    if PROCESS_POOL_SIZE > 0:
+        return _PooledModel(MODEL_NAME, PROCESS_POOL_SIZE)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class _MicroBatcher:
+    """收集 window 秒內（最多 max_batch 筆）的查詢，一次批次 encode"""
+
+    def __init__(self, encode, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.encode = encode
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="similarity-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self.encode([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+class SimilarityService:
+    def __init__(self, model_name=MODEL_NAME, article_cache_size=ARTICLE_CACHE_SIZE):
+        self.model_name = model_name
+        self._articles = LRUCache(maxsize=article_cache_size)  # article id -> 正規化後的向量
+        self._lock = threading.Lock()
+        self._batcher = _MicroBatcher(self._encode)
+        self.article_hits = 0
+        self.article_misses = 0
+
+    def _encode(self, sentences):
+        # 經過文字層級的 embedding 快取，只有未命中的句子會送進模型
+        return _normalize(cached_encode(get_model(), self.model_name, sentences))
+
+    def encode_query(self, text):
+        """單一查詢：與其他執行緒同時送出的查詢合併成一批"""
+        return self._batcher.submit(text).result()
+
+    def encode_queries(self, texts):
+        """多個查詢：直接一次批次 encode"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._encode(list(texts))
+
+    def article_vectors(self, nodes):
+        """取得文章向量（依 article id 快取），回傳 (len(nodes), dim) 矩陣"""
+        vectors = [None] * len(nodes)
+        missing = []
+        with self._lock:
+            for i, node in enumerate(nodes):
+                vector = self._articles.get(node["id"]) if node.get("id") else None
+                if vector is None:
+                    missing.append(i)
+                else:
+                    vectors[i] = vector
+            self.article_hits += len(nodes) - len(missing)
+            self.article_misses += len(missing)
+        if missing:
+            encoded = self._encode([nodes[i]["text"] for i in missing])
+            with self._lock:
+                for i, vector in zip(missing, encoded):
+                    vectors[i] = vector
+                    if nodes[i].get("id"):
+                        self._articles[nodes[i]["id"]] = vector
+        return np.stack(vectors)
+
+    @staticmethod
+    def top_k(query_vectors, article_vectors, k=1):
+        """
+        query_vectors (q, dim) 與 article_vectors (n, dim) 皆已正規化。
+        回傳 (indices, scores)，形狀皆為 (q, min(k, n))，依相似度由高到低。
+        """
+        scores = query_vectors @ article_vectors.T
+        k = min(k, scores.shape[1])
+        if k < scores.shape[1]:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def rank(self, query, nodes, k=1):
+        """回傳與 query 最相似的 k 篇文章：[(node, score), ...]"""
+        if not nodes:
+            return []
+        query_vector = self.encode_query(query)[None, :]
+        indices, scores = self.top_k(query_vector, self.article_vectors(nodes), k)
+        return [(nodes[i], float(s)) for i, s in zip(indices[0], scores[0])]
+
+    def rank_many(self, queries, nodes_per_query, k=1):
+        """批次版本：所有查詢一次 encode，所有文章一次取得向量"""
+        query_vectors = self.encode_queries(queries)
+        all_nodes = [node for nodes in nodes_per_query for node in nodes]
+        article_vectors = self.article_vectors(all_nodes) if all_nodes else None
+        results = []
+        offset = 0
+        for i, nodes in enumerate(nodes_per_query):
+            if not nodes:
+                results.append([])
+                continue
+            indices, scores = self.top_k(query_vectors[i:i + 1], article_vectors[offset:offset + len(nodes)], k)
+            results.append([(nodes[j], float(s)) for j, s in zip(indices[0], scores[0])])
+            offset += len(nodes)
+        return results
+
+    def stats(self):
+        with self._lock:
+            total = self.article_hits + self.article_misses
+            return {
+                "article_hits": self.article_hits,
+                "article_misses": self.article_misses,
+                "article_hit_rate": self.article_hits / total if total else 0.0,
+                "cached_articles": len(self._articles),
+            }
+
+
+@lazy_component("similarity_service")
+def get_similarity_service() -> SimilarityService:
+    return SimilarityService()
@@ -0,0 +1,68 @@
+import unittest
+
+from graph_rag_agent.claim_normalizer import ClaimRegistry, normalize_claim, unique_claims
+
+
+class NormalizeClaimTest(unittest.TestCase):
+    def test_strips_whitespace_punctuation_and_width(self):
+        self.assertEqual(normalize_claim("老人宜多吃豬腳，常吃可長壽！"), normalize_claim(" 老人宜多吃豬腳 常吃可長壽!! "))
+        self.assertEqual(normalize_claim("ＡＢＣ"), "abc")
+
+
+class ClaimRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = ClaimRegistry(maxsize=100)
+
+    def test_exact_normalized_match_reuses_claim(self):
+        first = self.registry.match("老人宜多吃豬腳，常吃可長壽")
+        second = self.registry.match("老人宜多吃豬腳 常吃可長壽!!")
+        self.assertEqual(first.claim_id, second.claim_id)
+        self.assertEqual(second.text, "老人宜多吃豬腳，常吃可長壽")
+        self.assertEqual(second.similarity, 1.0)
+
+    def test_near_duplicate_shares_key_but_keeps_user_text(self):
+        first = self.registry.match("老人宜多吃豬腳，常吃可長壽")
+        second = self.registry.match("老人宜多吃豬腳，常吃可以長壽")
+        self.assertEqual(first.claim_id, second.claim_id)
+        self.assertEqual(second.text, "老人宜多吃豬腳，常吃可以長壽")
+        self.assertLess(second.similarity, 1.0)
+
+    def test_negated_claim_is_not_merged(self):
+        positive = self.registry.match("疫苗會導致自閉症")
+        negative = self.registry.match("疫苗不會導致自閉症")
+        self.assertNotEqual(positive.claim_id, negative.claim_id)
+        self.assertEqual(negative.text, "疫苗不會導致自閉症")
+
+    def test_different_negations_are_not_merged(self):
+        first = self.registry.match("喝鹼性水沒有辦法治癌症")
+        second = self.registry.match("喝鹼性水無法治療癌症")
+        self.assertNotEqual(first.claim_id, second.claim_id)
+
+    def test_unrelated_claims_are_not_merged(self):
+        first = self.registry.match("吃香蕉可以預防中風")
+        second = self.registry.match("吃芭樂可以預防中風")
+        self.assertNotEqual(first.claim_id, second.claim_id)
+
+    def test_sent_text_does_not_depend_on_history(self):
+        query = "疫苗不會導致自閉症"
+        fresh = ClaimRegistry().match(query)
+        for earlier in ["疫苗會導致自閉症", "疫苗不會導致自閉症喔", "疫苗不會造成自閉症"]:
+            self.registry.match(earlier)
+        self.assertEqual(self.registry.match(query).text, fresh.text)
+
+    def test_registry_is_bounded(self):
+        registry = ClaimRegistry(maxsize=3)
+        for i in range(10):
+            registry.match(f"第{i}則完全不同的謠言{'甲乙丙丁戊己庚辛壬癸'[i] * 6}")
+        self.assertEqual(registry.stats()["claims"], 3)
+        self.assertLessEqual(len(registry._exact), 3)
+
+    def test_unique_claims_keeps_first_occurrence(self):
+        claims = [self.registry.match(text) for text in ["老人宜多吃豬腳，常吃可長壽", "吃香蕉可以預防中風",
+                                                          "老人宜多吃豬腳，常吃可以長壽"]]
+        unique = unique_claims(claims)
+        self.assertEqual([claim.text for claim in unique], ["老人宜多吃豬腳，常吃可長壽", "吃香蕉可以預防中風"])
+
+
+if __name__ == "__main__":
+    unittest.main()
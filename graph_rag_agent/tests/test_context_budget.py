@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+
+from graph_rag_agent import tokenizer
+from graph_rag_agent.context_budget import pack_context, parse_context
+from graph_rag_agent.retrieval_query import ITEM_SEPARATOR, KG_RELS_SEPARATOR, TEXT_HEADER
+from graph_rag_agent.tokenizer import count_tokens, truncate_tokens
+
+
+class ByteEncoding:
+    """一個 UTF-8 位元組一個 token，中文字會被切成多個 token"""
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode(self, tokens):
+        return bytes(tokens).decode("utf-8", errors="replace")
+
+
+def make_info(chunks, rels):
+    return TEXT_HEADER + ITEM_SEPARATOR.join(chunks) + KG_RELS_SEPARATOR + ITEM_SEPARATOR.join(rels)
+
+
+INFOS = [
+    make_info(
+        ["糖尿病患者應控制甜食攝取，水果也要注意份量。", "高血壓患者應減少鈉的攝取。"],
+        ["糖尿病 - AVOID(甜食) -> 蛋糕", "高血壓 - AVOID(鹽) -> 醃漬物"],
+    ),
+    make_info(["糖尿病患者應控制甜食攝取，水果也要注意份量。", "運動有助於控制血糖。"], ["糖尿病 - AVOID(甜食) -> 蛋糕"]),
+]
+
+
+class PackContextTest(unittest.TestCase):
+    def test_duplicates_are_removed(self):
+        context, report = pack_context("糖尿病可以吃甜食嗎", INFOS, token_budget=10_000)
+        chunks, rels = parse_context(context)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(rels), 2)
+        self.assertEqual(report["duplicates_removed"], 2)
+
+    def test_output_never_exceeds_budget(self):
+        for budget in range(0, 200):
+            context, report = pack_context("糖尿病可以吃甜食嗎", INFOS, token_budget=budget)
+            self.assertLessEqual(count_tokens(context), budget, budget)
+            self.assertLessEqual(report["tokens"], budget, budget)
+
+    def test_budget_smaller_than_headers_returns_empty_context(self):
+        budget = count_tokens(TEXT_HEADER + KG_RELS_SEPARATOR) - 1
+        context, report = pack_context("糖尿病可以吃甜食嗎", INFOS, token_budget=budget)
+        self.assertEqual(context, "")
+        self.assertEqual(report["chunks_kept"], 0)
+        self.assertEqual(report["chunks_dropped"], 3)
+
+    def test_most_relevant_chunk_is_truncated_when_nothing_fits(self):
+        budget = count_tokens(TEXT_HEADER + KG_RELS_SEPARATOR) + count_tokens(ITEM_SEPARATOR) + 5
+        context, report = pack_context("糖尿病可以吃甜食嗎", INFOS, token_budget=budget)
+        self.assertEqual(parse_context(context)[0], ["糖尿病患者"])
+        self.assertEqual(report["chunks_kept"], 1)
+        self.assertLessEqual(report["tokens"], budget)
+
+    def test_multibyte_tokens_stay_within_budget(self):
+        with mock.patch.object(tokenizer, "_encoding", ByteEncoding()):
+            for budget in range(0, 120):
+                context, report = pack_context("糖尿病可以吃甜食嗎", INFOS, token_budget=budget)
+                self.assertLessEqual(count_tokens(context), budget, budget)
+                self.assertNotIn("�", context)
+
+
+class TruncateTokensTest(unittest.TestCase):
+    def test_character_fallback(self):
+        with mock.patch.object(tokenizer, "_encoding", False):
+            self.assertEqual(truncate_tokens("糖尿病患者", 3), "糖尿病")
+            self.assertEqual(truncate_tokens("糖尿病", 10), "糖尿病")
+            self.assertEqual(truncate_tokens("糖尿病", 0), "")
+
+    def test_does_not_split_multibyte_characters(self):
+        with mock.patch.object(tokenizer, "_encoding", ByteEncoding()):
+            # 每個中文字 3 個位元組：7 個 token 只放得下 2 個字
+            self.assertEqual(truncate_tokens("糖尿病", 7), "糖尿")
+            self.assertEqual(truncate_tokens("糖尿病", 2), "")
+            self.assertEqual(truncate_tokens("糖尿病", 9), "糖尿病")
+
+
+if __name__ == "__main__":
+    unittest.main()
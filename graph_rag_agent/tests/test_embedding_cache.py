@@ -0,0 +1,90 @@
+import itertools
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from graph_rag_agent.embedding_cache import EmbeddingCache, cached_encode
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, sentences):
+        self.encoded.append(list(sentences))
+        return np.array([[float(len(s)), 1.0] for s in sentences], dtype=np.float32)
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / "embeddings.sqlite3")
+        # 遞增的假時間，讓 last_used 的先後不受時鐘解析度影響
+        clock = itertools.count(1000)
+        patcher = mock.patch("graph_rag_agent.embedding_cache.time.time", side_effect=lambda: float(next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def last_used(self, cache, model, text):
+        return cache._conn.execute(
+            "SELECT last_used FROM embeddings WHERE key = ?", (cache.make_key(model, text),)
+        ).fetchone()[0]
+
+    def test_hit_and_miss(self):
+        cache = EmbeddingCache(path=self.path)
+        self.assertIsNone(cache.get("m", "糖尿病"))
+        cache.put("m", "糖尿病", [0.5, 0.25])
+        self.assertEqual(cache.get("m", "糖尿病"), [0.5, 0.25])
+        # 全形空白與前後空白正規化後為同一個鍵
+        self.assertEqual(cache.get("m", "　糖尿病 "), [0.5, 0.25])
+        self.assertIsNone(cache.get("other-model", "糖尿病"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+
+    def test_vectors_persist_across_instances(self):
+        EmbeddingCache(path=self.path).put("m", "高血壓", [1.0, 2.0])
+        cache = EmbeddingCache(path=self.path)
+        self.assertEqual(cache.stats()["memory_entries"], 0)
+        self.assertEqual(cache.get("m", "高血壓"), [1.0, 2.0])
+        self.assertEqual(cache.stats()["memory_entries"], 1)
+
+    def test_memory_hits_refresh_last_used_in_batches(self):
+        cache = EmbeddingCache(path=self.path)
+        cache.put("m", "糖尿病", [1.0])
+        before = self.last_used(cache, "m", "糖尿病")
+        cache.get("m", "糖尿病")
+        self.assertEqual(self.last_used(cache, "m", "糖尿病"), before)
+        cache.flush_touches()
+        self.assertGreater(self.last_used(cache, "m", "糖尿病"), before)
+
+    def test_disk_tier_is_bounded_by_least_recently_used(self):
+        cache = EmbeddingCache(path=self.path, max_disk_entries=60)
+        for i in range(50):
+            cache.put("m", f"問題{i}", [float(i)])
+        cache.get("m", "問題0")  # 命中後 last_used 晚於問題 1~49
+        for i in range(50, 100):
+            cache.put("m", f"問題{i}", [float(i)])
+        self.assertEqual(cache.stats()["disk_entries"], 60)
+        reopened = EmbeddingCache(path=self.path)
+        self.assertEqual(reopened.get("m", "問題0"), [0.0])
+        self.assertIsNone(reopened.get("m", "問題1"))
+        self.assertEqual(reopened.get("m", "問題99"), [99.0])
+
+
+class CachedEncodeTest(unittest.TestCase):
+    def test_only_missing_sentences_are_encoded(self):
+        cache = EmbeddingCache(path=":memory:")
+        model = FakeModel()
+        first = cached_encode(model, "st", ["糖尿病", "高血壓"], cache=cache)
+        second = cached_encode(model, "st", ["高血壓", "痛風", "糖尿病"], cache=cache)
+        self.assertEqual(model.encoded, [["糖尿病", "高血壓"], ["痛風"]])
+        np.testing.assert_array_equal(second[0], first[1])
+        np.testing.assert_array_equal(second[2], first[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
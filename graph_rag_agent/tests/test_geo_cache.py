@@ -0,0 +1,74 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from graph_rag_agent.geo_cache import GeoCache, geohash_encode
+
+
+class GeohashTest(unittest.TestCase):
+    def test_known_value(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, precision=11), "u4pruydqqvj")
+
+    def test_nearby_points_share_prefix(self):
+        # 台北車站附近相距約 100 公尺的兩點
+        self.assertEqual(geohash_encode(25.0478, 121.5170, 6), geohash_encode(25.0485, 121.5175, 6))
+        self.assertNotEqual(geohash_encode(25.0478, 121.5170, 6), geohash_encode(22.6273, 120.3014, 6))
+
+
+class GeoCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / "geo.sqlite3")
+
+    def disk_count(self, cache, namespace):
+        return cache._geocode._conn.execute(
+            "SELECT COUNT(*) FROM geo_cache WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
+
+    def test_hit_and_miss(self):
+        cache = GeoCache(path=self.path)
+        self.assertIsNone(cache.get_latlng("台大醫院"))
+        cache.set_latlng("台大醫院", (25.0408, 121.5187))
+        self.assertEqual(cache.get_latlng(" 台大醫院 "), (25.0408, 121.5187))
+        self.assertEqual(cache.stats()["geocode"], {"hits": 1, "misses": 1})
+
+    def test_places_keyed_by_geohash_cell(self):
+        cache = GeoCache(path="")
+        cache.set_places((25.0478, 121.5170), "hospital", 1000, [{"name": "台大醫院"}])
+        self.assertEqual(cache.get_places((25.0485, 121.5175), "hospital", 1000), [{"name": "台大醫院"}])
+        self.assertIsNone(cache.get_places((25.0478, 121.5170), "pharmacy", 1000))
+        self.assertIsNone(cache.get_places((25.0478, 121.5170), "hospital", 2000))
+
+    def test_values_persist_across_instances(self):
+        GeoCache(path=self.path).set_places((25.0478, 121.5170), "hospital", 1000, [{"name": "台大醫院"}])
+        self.assertEqual(GeoCache(path=self.path).get_places((25.0478, 121.5170), "hospital", 1000),
+                         [{"name": "台大醫院"}])
+
+    def test_disk_entries_expire(self):
+        GeoCache(path=self.path, places_ttl=60).set_places((25.0, 121.5), "hospital", 1000, [])
+        with mock.patch("graph_rag_agent.geo_cache.time.time", return_value=time.time() + 120):
+            cache = GeoCache(path=self.path, places_ttl=60)
+            self.assertIsNone(cache.get_places((25.0, 121.5), "hospital", 1000))
+            self.assertEqual(self.disk_count(cache, "places"), 0)
+
+    def test_disk_tier_is_bounded(self):
+        cache = GeoCache(path=self.path, max_disk_entries=10)
+        for i in range(100):
+            cache.set_latlng(f"醫院{i}", (25.0, 121.0 + i / 1000))
+        self.assertEqual(self.disk_count(cache, "geocode"), 10)
+        reopened = GeoCache(path=self.path)
+        self.assertIsNone(reopened.get_latlng("醫院0"))
+        self.assertEqual(reopened.get_latlng("醫院99"), (25.0, 121.099))
+
+    def test_lower_limit_applies_on_startup(self):
+        cache = GeoCache(path=self.path)
+        for i in range(20):
+            cache.set_latlng(f"醫院{i}", (25.0, 121.0))
+        self.assertEqual(self.disk_count(GeoCache(path=self.path, max_disk_entries=5), "geocode"), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from graph_rag_agent.embedding_cache import EmbeddingCache
+from graph_rag_agent.response_cache import SemanticResponseCache, is_cacheable, question_terms, terms_match
+
+
+class FakeEmbeddings:
+    """預設所有問題得到相同的向量，模擬 embedding 分不出只差一個疾病名稱的問題"""
+
+    def __init__(self, vectors=None):
+        self.vectors = vectors or {}
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.vectors.get(text, [1.0, 0.0, 0.0])
+
+
+class SemanticResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.embedding_cache = EmbeddingCache(path=Path(tmp.name) / "embeddings.sqlite3")
+        self.embeddings = FakeEmbeddings({"感冒要多喝水嗎": [0.0, 1.0, 0.0]})
+        self.cache = self.make_cache()
+
+    def make_cache(self, **kwargs):
+        return SemanticResponseCache(self.embeddings, model="fake", embedding_cache=self.embedding_cache, **kwargs)
+
+    def test_same_question_hits(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "少量"})
+        self.assertEqual(self.cache.lookup("糖尿病可以吃甜食嗎？"), {"output": "少量"})
+        self.assertEqual(self.cache.lookup("糖尿病能吃甜食嗎"), {"output": "少量"})
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_different_entity_misses_despite_identical_vectors(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "少量"})
+        self.assertIsNone(self.cache.lookup("高血壓可以吃甜食嗎"))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_different_number_misses(self):
+        self.cache.store("普拿疼一天吃2顆可以嗎", {"output": "可以"})
+        self.assertIsNone(self.cache.lookup("普拿疼一天吃20顆可以嗎"))
+
+    def test_falls_back_to_next_candidate_with_matching_terms(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "糖尿病"})
+        self.cache.store("高血壓可以吃甜食嗎", {"output": "高血壓"})
+        self.assertEqual(self.cache.lookup("高血壓能吃甜食嗎"), {"output": "高血壓"})
+
+    def test_dissimilar_vector_misses(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "少量"})
+        self.assertIsNone(self.cache.lookup("感冒要多喝水嗎"))
+
+    def test_entries_expire(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "少量"})
+        with mock.patch("graph_rag_agent.response_cache.time.time", return_value=10 ** 12):
+            self.assertIsNone(self.cache.lookup("糖尿病可以吃甜食嗎"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_oldest_entries_are_evicted(self):
+        cache = self.make_cache(max_entries=2)
+        for question in ["糖尿病可以吃甜食嗎", "高血壓可以吃甜食嗎", "痛風可以吃甜食嗎"]:
+            cache.store(question, {"output": question})
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertIsNone(cache.lookup("糖尿病可以吃甜食嗎"))
+        self.assertEqual(cache.lookup("痛風可以吃甜食嗎"), {"output": "痛風可以吃甜食嗎"})
+
+    def test_question_vectors_are_reused(self):
+        self.cache.store("糖尿病可以吃甜食嗎", {"output": "少量"})
+        self.cache.lookup("糖尿病可以吃甜食嗎")
+        self.assertEqual(self.embeddings.calls, 1)
+
+
+class QuestionTermsTest(unittest.TestCase):
+    def test_function_words_and_punctuation_are_ignored(self):
+        self.assertEqual(question_terms("請問糖尿病可以吃甜食嗎？"), question_terms("糖尿病能吃甜食嗎"))
+
+    def test_alphanumeric_terms_are_kept_whole(self):
+        numbers, content = question_terms("HbA1c 要控制在 7 以下嗎")
+        self.assertEqual(numbers, frozenset({"7"}))
+        self.assertIn("hba1c", content)
+
+    def test_chinese_numbers_must_match(self):
+        self.assertFalse(terms_match(question_terms("第一型糖尿病是什麼"), question_terms("第二型糖尿病是什麼")))
+
+    def test_is_cacheable(self):
+        self.assertTrue(is_cacheable("糖尿病可以吃甜食嗎"))
+        self.assertFalse(is_cacheable("附近有哪些醫院"))
+        self.assertFalse(is_cacheable("糖尿病可以吃甜食嗎", location_info={"lat": 25.0}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+
+from graph_rag_agent.retrieval_query import (
+    LEGACY_RETRIEVAL_QUERY,
+    _parse_version,
+    build_retrieval_query,
+    format_structured,
+    resolve_rank_by_relevance,
+    retrieval_params,
+)
+
+
+class FakeDriver:
+    def __init__(self, version=None, error=None):
+        self.version = version
+        self.error = error
+
+    def execute_query(self, query, database_=None):
+        if self.error:
+            raise self.error
+        return [{"version": self.version}], None, None
+
+
+class BuildRetrievalQueryTest(unittest.TestCase):
+    def test_legacy_mode_returns_original_query(self):
+        self.assertEqual(build_retrieval_query(mode="legacy"), LEGACY_RETRIEVAL_QUERY)
+
+    def test_rejects_unsupported_hops(self):
+        with self.assertRaises(ValueError):
+            build_retrieval_query(mode="bounded", hops=3)
+
+    def test_results_are_limited_per_chunk(self):
+        query = build_retrieval_query(mode="bounded", hops=2, rel_types=[], max_degree=0)
+        self.assertIn("LIMIT $rels_per_chunk", query)
+
+    def test_type_filter_only_with_allow_list(self):
+        self.assertNotIn("$allowed_types", build_retrieval_query(mode="bounded", rel_types=[]))
+        query = build_retrieval_query(mode="bounded", hops=2, rel_types=["TREATS"])
+        self.assertIn("type(rel) IN $allowed_types", query)
+        self.assertIn("type(r1) IN $allowed_types", query)
+
+    def test_degree_pruning_only_on_intermediate_node(self):
+        query = build_retrieval_query(mode="bounded", hops=2, rel_types=[], max_degree=200)
+        self.assertIn("COUNT { (mid)--() } <= $max_degree", query)
+        # chunk 自己的實體即使是 hub 也要保留第一跳的關係
+        self.assertNotIn("COUNT { (entity)--() }", query)
+        self.assertNotIn("$max_degree", build_retrieval_query(mode="bounded", hops=2, rel_types=[], max_degree=0))
+
+    def test_one_hop_has_no_second_hop(self):
+        query = build_retrieval_query(mode="bounded", hops=1, rel_types=[], max_degree=200)
+        self.assertNotIn("UNION", query)
+        self.assertNotIn("(mid)", query)
+
+    def test_vector_similarity_only_when_requested(self):
+        self.assertNotIn("vector.similarity.cosine", build_retrieval_query(mode="bounded", rank_by_relevance=False))
+        query = build_retrieval_query(mode="bounded", rank_by_relevance=True)
+        self.assertIn("vector.similarity.cosine($query_vector", query)
+
+    def test_structured_and_string_returns(self):
+        self.assertIn("AS info", build_retrieval_query(mode="bounded", structured=False))
+        structured = build_retrieval_query(mode="bounded", structured=True)
+        self.assertNotIn("apoc.text.join", structured)
+        self.assertIn("AS rels", structured)
+
+    def test_retrieval_params(self):
+        self.assertEqual(retrieval_params(rels_per_chunk=5, rel_types=("TREATS",), max_degree=10),
+                         {"rels_per_chunk": 5, "allowed_types": ["TREATS"], "max_degree": 10})
+
+
+class RankByRelevanceTest(unittest.TestCase):
+    def test_parse_version(self):
+        self.assertEqual(_parse_version("5.26.0"), (5, 26))
+        self.assertEqual(_parse_version("5.18-aura"), (5, 18))
+        self.assertEqual(_parse_version("2025.01.0"), (2025, 1))
+        self.assertEqual(_parse_version(None), (0, 0))
+
+    def test_auto_follows_server_version(self):
+        self.assertTrue(resolve_rank_by_relevance(FakeDriver("5.18.0"), setting="auto"))
+        self.assertFalse(resolve_rank_by_relevance(FakeDriver("5.11.0"), setting="auto"))
+        self.assertFalse(resolve_rank_by_relevance(FakeDriver(error=RuntimeError("down")), setting="auto"))
+
+    def test_explicit_setting_skips_probe(self):
+        self.assertTrue(resolve_rank_by_relevance(FakeDriver(error=RuntimeError("down")), setting="true"))
+        self.assertFalse(resolve_rank_by_relevance(FakeDriver("5.26.0"), setting="false"))
+
+
+class FormatStructuredTest(unittest.TestCase):
+    def test_dedupes_relationships_across_chunks(self):
+        rel = {"start": "二甲雙胍", "type": "TREATS", "details": "", "end": "糖尿病"}
+        records = [
+            {"text": "第一段", "rels": [rel]},
+            {"text": None, "rels": [dict(rel), {"start": "a", "type": "R", "details": "d", "end": "b"}]},
+        ]
+        self.assertEqual(
+            format_structured(records),
+            "=== text ===n第一段n---nnn=== kg_rels ===n二甲雙胍 - TREATS() -> 糖尿病n---na - R(d) -> b",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""token 計數（tiktoken），供對話歷史壓縮與 RAG context 預算共用"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """tiktoken 編碼表；無法載入時為 False"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e:
+                    logger.warning(f"無法載入 tiktoken 編碼 {TOKENIZER_ENCODING}，改用字元數估算：{e}")
+                    _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """以 tiktoken 計算 token 數；無法載入編碼表時以字元數估算（中文約一字一 token）"""
+    encoding = _get_encoding()
+    if encoding is False:
+        return len(text)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """截斷為最多 max_tokens 個 token（encode、切片後 decode）；無法載入編碼表時截斷字元"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is False:
+        return text[:max_tokens]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    # 切點落在多位元組字元中間時 decode 會產生替代字元，去掉後重新計算，確保不超過上限
+    for end in range(max_tokens, 0, -1):
+        truncated = encoding.decode(tokens[:end]).rstrip("\ufffd")
+        if len(encoding.encode(truncated)) <= max_tokens:
+            return truncated
+    return ""
@@ -1,28 +1,40 @@
-from sentence_transformers import SentenceTransformer, util
-from cofacts_check import search_cofacts
+try:
+    from .cofacts_check import search_cofacts, search_cofacts_many
+    from .cofacts_mirror import get_cofacts_mirror
+    from .embedding_cache import get_embedding_cache
+    from .similarity_service import MODEL_NAME, get_similarity_service
+except ImportError:
+    from cofacts_check import search_cofacts, search_cofacts_many
+    from cofacts_mirror import get_cofacts_mirror
+    from embedding_cache import get_embedding_cache
+    from similarity_service import MODEL_NAME, get_similarity_service
 
-model = SentenceTransformer("multi-qa-mpnet-base-dot-v1")
+
+def _article_nodes(cofacts_result):
+    return [edge['node'] for edge in cofacts_result['data']['ListArticles']['edges']]
 
 def find_most_similar_cofacts_article(query_text):
-    cofacts_result = search_cofacts(query_text)
-    articles = []
-    nodes = []
-    edges = cofacts_result['data']['ListArticles']['edges']
-    for edge in edges:
-        articles.append(edge['node']['text'])
-        nodes.append(edge['node'])
-    if not articles:
+    # 已建立本地鏡像時直接在全部文章中查詢，不呼叫遠端 API
+    mirror = get_cofacts_mirror()
+    if mirror is not None:
+        results = mirror.search(query_text, k=1)
+        return results[0] if results else (None, None)
+    nodes = _article_nodes(search_cofacts(query_text))
+    if not nodes:
         return None, None
-    sentences = [query_text] + articles
-    embeddings = model.encode(sentences)
-    query_embedding = embeddings[0]
-    article_embeddings = embeddings[1:]
-    similarities = util.cos_sim(query_embedding, article_embeddings)[0]
-    max_idx = similarities.argmax()
-    most_similar_node = nodes[max_idx]
-    similarity_score = similarities[max_idx].item()
+    ranked = get_similarity_service().rank(query_text, nodes, k=1)
+    most_similar_node, similarity_score = ranked[0]
     return most_similar_node, similarity_score
 
+def find_most_similar_cofacts_articles(query_texts, k=1):
+    """多個查詢一起計算：查詢與文章各只做一次批次 encode，回傳每個查詢的 [(node, score), ...]"""
+    mirror = get_cofacts_mirror()
+    if mirror is not None:
+        return mirror.search_many(query_texts, k=k)
+    # 所有查詢合併成少數幾個 GraphQL 請求
+    nodes_per_query = [_article_nodes(result) for result in search_cofacts_many(query_texts)]
+    return get_similarity_service().rank_many(query_texts, nodes_per_query, k=k)
+
 # 範例呼叫
 if __name__ == "__main__":
     query = "台灣加入聯合國"
@@ -33,4 +45,6 @@ if __name__ == "__main__":
         print("人工回覆：", node.get('articleReplies', []))
         print("相似度：", score)
     else:
-        print("查無相關文章")
\ No newline at end of file
+        print("查無相關文章")
+    print("向量快取統計：", get_embedding_cache().stats())
+    print("文章向量快取統計：", get_similarity_service().stats())
@@ -0,0 +1,31 @@
+import logging
+import os
+import threading
+
+from django.apps import AppConfig
+
+logger = logging.getLogger(__name__)
+
+
+class MyappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'myapp'
+
+    def ready(self):
+        # 設定 AGENT_WARMUP=true 時，於背景預先建立 Neo4j/LLM 等元件，不阻塞 worker 啟動
+        if os.getenv("AGENT_WARMUP", "false").lower() != "true":
+            return
+
+        def warm_up():
+            try:
+                from graph_rag_agent import ai_agent  # noqa: F401  註冊所有元件
+                from graph_rag_agent.components import warm_up as warm_up_components
+            except ImportError:
+                logger.warning("無法載入 graph_rag_agent，略過預熱")
+                return
+            report = warm_up_components()
+            logger.info("元件啟動時間報告：" + ", ".join(
+                f"{name}={item['seconds'] or 0:.2f}s" for name, item in report.items()
+            ))
+
+        threading.Thread(target=warm_up, name="agent-warmup", daemon=True).start()
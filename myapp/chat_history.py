@@ -0,0 +1,302 @@
+"""聊天歷史儲存後端：可透過 settings.CHAT_HISTORY_BACKEND 切換"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils.module_loading import import_string
+
+
+def _make_message(chat_id, content, sender, metadata=None):
+    message = {
+        'chat_id': chat_id,
+        'content': content,
+        'sender': sender,
+        'timestamp': time.time()
+    }
+    # 添加元數據（如位置信息）
+    if metadata:
+        message['metadata'] = metadata
+    return message
+
+
+def _make_summary(chat_id, title, last_message, timestamp):
+    title = title or "無標題對話"
+    return {
+        'id': chat_id,
+        'title': title[:20] + '...' if len(title) > 20 else title,
+        'last_message': last_message,
+        'timestamp': timestamp
+    }
+
+
+class ChatHistoryBackend:
+    """聊天歷史後端介面"""
+
+    def add_message(self, chat_id, content, sender, metadata=None):
+        raise NotImplementedError
+
+    def get_chat_history(self, chat_id, offset=0, limit=None):
+        """依時間順序取得對話訊息，可用 offset/limit 分頁"""
+        raise NotImplementedError
+
+    def get_all_chats(self, before=None, limit=None):
+        """
+        取得對話摘要（依最後訊息時間降序）。
+        before 為游標：只回傳最後訊息時間早於 before 的對話。
+        """
+        raise NotImplementedError
+
+    def delete_chat(self, chat_id):
+        raise NotImplementedError
+
+
+class _ChatCache:
+    """
+    有上限的對話快取：超過 max_chats 時淘汰最久未使用的對話，
+    閒置超過 idle_seconds 的對話也會被移除。
+    """
+
+    def __init__(self, max_chats, idle_seconds, on_evict=None):
+        self.max_chats = max_chats
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # chat_id -> (last_access, messages)
+        self._lock = threading.Lock()
+
+    def get(self, chat_id):
+        with self._lock:
+            entry = self._data.get(chat_id)
+            if entry is None:
+                return None
+            self._data.move_to_end(chat_id)
+            self._data[chat_id] = (time.monotonic(), entry[1])
+            return entry[1]
+
+    def set(self, chat_id, messages):
+        with self._lock:
+            self._data[chat_id] = (time.monotonic(), messages)
+            self._data.move_to_end(chat_id)
+            self._evict()
+
+    def pop(self, chat_id):
+        with self._lock:
+            entry = self._data.pop(chat_id, None)
+            return entry[1] if entry else None
+
+    def items(self):
+        with self._lock:
+            self._evict()
+            return [(chat_id, messages) for chat_id, (_, messages) in self._data.items()]
+
+    def _evict(self):
+        deadline = time.monotonic() - self.idle_seconds
+        # OrderedDict 依存取順序排列，最舊的在前
+        while self._data:
+            chat_id, (last_access, _) = next(iter(self._data.items()))
+            if len(self._data) > self.max_chats or last_access < deadline:
+                self._data.popitem(last=False)
+                if self.on_evict:
+                    self.on_evict(chat_id)
+            else:
+                break
+
+
+class MemoryChatHistoryBackend(ChatHistoryBackend):
+    """行程內記憶體後端（開發用）：有容量上限並淘汰閒置對話，重啟後資料會消失"""
+
+    def __init__(self, max_chats=1000, idle_seconds=24 * 3600):
+        self._cache = _ChatCache(max_chats, idle_seconds, on_evict=self._drop_summary)
+        # 對話摘要索引：chat_id -> 摘要，以及依 (-timestamp, chat_id) 排序的鍵
+        self._summaries = {}
+        self._order = []
+        self._summary_lock = threading.Lock()
+
+    def _drop_summary(self, chat_id):
+        with self._summary_lock:
+            summary = self._summaries.pop(chat_id, None)
+            if summary is not None:
+                key = (-summary['timestamp'], chat_id)
+                index = bisect.bisect_left(self._order, key)
+                if index < len(self._order) and self._order[index] == key:
+                    del self._order[index]
+
+    def _update_summary(self, chat_id, message):
+        previous = self._summaries.get(chat_id)
+        title = previous['title'] if previous else None
+        if not title and message['sender'] == 'user':
+            title = message['content']
+        self._drop_summary(chat_id)
+        with self._summary_lock:
+            self._summaries[chat_id] = {
+                'title': title,
+                'last_message': message['content'],
+                'timestamp': message['timestamp'],
+            }
+            bisect.insort(self._order, (-message['timestamp'], chat_id))
+
+    def add_message(self, chat_id, content, sender, metadata=None):
+        messages = self._cache.get(chat_id)
+        if messages is None:
+            messages = []
+        message = _make_message(chat_id, content, sender, metadata)
+        messages.append(message)
+        self._cache.set(chat_id, messages)
+        self._update_summary(chat_id, message)
+
+    def get_chat_history(self, chat_id, offset=0, limit=None):
+        messages = self._cache.get(chat_id) or []
+        end = None if limit is None else offset + limit
+        return messages[offset:end]
+
+    def get_all_chats(self, before=None, limit=None):
+        with self._summary_lock:
+            # 跳過所有時間不早於 before 的項目
+            start = 0 if before is None else bisect.bisect_right(self._order, (-before, chr(0x10FFFF)))
+            end = None if limit is None else start + limit
+            return [
+                _make_summary(chat_id, self._summaries[chat_id]['title'],
+                              self._summaries[chat_id]['last_message'], -neg_timestamp)
+                for neg_timestamp, chat_id in self._order[start:end]
+            ]
+
+    def delete_chat(self, chat_id):
+        self._drop_summary(chat_id)
+        return self._cache.pop(chat_id) is not None
+
+
+class DatabaseChatHistoryBackend(ChatHistoryBackend):
+    """
+    Django 資料庫後端，多個 worker 共用同一份資料。
+    最近使用的對話會快取在記憶體中；讀取時只查詢 id 大於快取中最後一筆的訊息，
+    因此其他 worker 寫入的訊息也能讀到。補查後的筆數需與 ChatSummary.message_count 相符，
+    不符（或摘要已不存在，即對話被其他 worker 刪除）時捨棄快取重新載入。
+    本 worker 寫入的訊息不直接放進快取，一律在讀取時由資料庫補上，
+    避免快取尾端越過其他 worker 在中間寫入的訊息。
+    """
+
+    def __init__(self, max_chats=256, idle_seconds=1800):
+        self._cache = _ChatCache(max_chats, idle_seconds)
+
+    def add_message(self, chat_id, content, sender, metadata=None):
+        from .models import ChatMessage, ChatSummary
+
+        message = _make_message(chat_id, content, sender, metadata)
+        with transaction.atomic():
+            ChatMessage.objects.create(
+                chat_id=chat_id,
+                content=content,
+                sender=sender,
+                timestamp=message['timestamp'],
+                metadata=metadata,
+            )
+            # 增量更新摘要索引
+            try:
+                # savepoint：兩個 worker 同時寫入第一則訊息時，較晚的一方改走下方的 update
+                with transaction.atomic():
+                    _, created = ChatSummary.objects.get_or_create(
+                        chat_id=chat_id,
+                        defaults={
+                            'title': content[:255] if sender == 'user' else '',
+                            'last_message': content,
+                            'last_timestamp': message['timestamp'],
+                            'message_count': 1,
+                        },
+                    )
+            except IntegrityError:
+                created = False
+            if not created:
+                updates = {
+                    'last_message': content,
+                    'last_timestamp': message['timestamp'],
+                    'message_count': F('message_count') + 1,
+                }
+                if sender == 'user':
+                    updates['title'] = Case(When(title='', then=Value(content[:255])), default=F('title'))
+                ChatSummary.objects.filter(chat_id=chat_id).update(**updates)
+
+    def _load(self, chat_id):
+        """讀取整段對話：快取命中時只補查 id 大於快取最後一筆的新訊息"""
+        from .models import ChatMessage, ChatSummary
+
+        cached = self._cache.get(chat_id)  # (最後一筆的 id, 訊息列表)
+        queryset = ChatMessage.objects.filter(chat_id=chat_id)
+        if cached is not None:
+            # message_count 與訊息在同一個交易中寫入，先讀取筆數再補查，其間的新訊息只會讓筆數偏多
+            expected = ChatSummary.objects.filter(chat_id=chat_id).values_list('message_count', flat=True).first()
+            if expected is None:
+                cached = None
+            else:
+                # SQLite 的自動遞增 id 依提交順序遞增；PostgreSQL/MySQL 在插入時配號，
+                # id 較小的訊息可能較晚提交而被 id__gt 略過，此時筆數對不上，改為重新載入
+                rows = list(queryset.filter(id__gt=cached[0]).order_by('id'))
+                if len(cached[1]) + len(rows) != expected:
+                    cached = None
+            if cached is None:
+                self._cache.pop(chat_id)
+        if cached is None:
+            rows = list(queryset)
+            last_id, messages = 0, []
+        else:
+            last_id, messages = cached
+        if rows:
+            last_id = max(last_id, max(m.id for m in rows))
+            # 建立新的列表而非修改快取中的列表，其他執行緒可能正在讀取
+            messages = messages + [m.to_dict() for m in rows]
+        if messages:
+            self._cache.set(chat_id, (last_id, messages))
+        return messages
+
+    def get_chat_history(self, chat_id, offset=0, limit=None):
+        from .models import ChatMessage
+
+        if limit is None:
+            return self._load(chat_id)[offset:]
+        # 分頁讀取直接使用 (chat_id, timestamp) 索引
+        queryset = ChatMessage.objects.filter(chat_id=chat_id)[offset:offset + limit]
+        return [m.to_dict() for m in queryset]
+
+    def get_all_chats(self, before=None, limit=None):
+        from .models import ChatSummary
+
+        # 直接讀取摘要索引（last_timestamp 已建立索引）
+        queryset = ChatSummary.objects.order_by('-last_timestamp')
+        if before is not None:
+            queryset = queryset.filter(last_timestamp__lt=before)
+        if limit is not None:
+            queryset = queryset[:limit]
+        return [
+            _make_summary(row.chat_id, row.title, row.last_message, row.last_timestamp)
+            for row in queryset
+        ]
+
+    def delete_chat(self, chat_id):
+        from .models import ChatMessage, ChatSummary
+
+        self._cache.pop(chat_id)
+        with transaction.atomic():
+            ChatSummary.objects.filter(chat_id=chat_id).delete()
+            deleted, _ = ChatMessage.objects.filter(chat_id=chat_id).delete()
+        return deleted > 0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """依設定建立（並快取）聊天歷史後端"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_class = import_string(getattr(
+                settings, 'CHAT_HISTORY_BACKEND', 'myapp.chat_history.DatabaseChatHistoryBackend'
+            ))
+            _backend = backend_class(
+                max_chats=getattr(settings, 'CHAT_HISTORY_CACHE_SIZE', 256),
+                idle_seconds=getattr(settings, 'CHAT_HISTORY_IDLE_SECONDS', 1800),
+            )
+        return _backend
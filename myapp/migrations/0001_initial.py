@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=64)),
+                ('content', models.TextField()),
+                ('sender', models.CharField(max_length=16)),
+                ('timestamp', models.FloatField()),
+                ('metadata', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['timestamp', 'id'],
+                'indexes': [models.Index(fields=['chat_id', 'timestamp'], name='chat_message_chat_ts_idx')],
+            },
+        ),
+    ]
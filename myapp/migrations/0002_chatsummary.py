@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+def build_summaries(apps, schema_editor):
+    """由既有訊息建立對話摘要"""
+    ChatMessage = apps.get_model('myapp', 'ChatMessage')
+    ChatSummary = apps.get_model('myapp', 'ChatSummary')
+    summaries = {}
+    for message in ChatMessage.objects.order_by('timestamp', 'id').iterator():
+        summary = summaries.get(message.chat_id)
+        if summary is None:
+            summary = summaries[message.chat_id] = ChatSummary(chat_id=message.chat_id, message_count=0)
+        if not summary.title and message.sender == 'user':
+            summary.title = message.content[:255]
+        summary.last_message = message.content
+        summary.last_timestamp = message.timestamp
+        summary.message_count += 1
+    ChatSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=64, unique=True)),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('last_message', models.TextField(blank=True, default='')),
+                ('last_timestamp', models.FloatField(db_index=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-last_timestamp'],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
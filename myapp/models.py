@@ -0,0 +1,47 @@
+from django.db import models
+
+
+class ChatMessage(models.Model):
+    """聊天訊息，依 (chat_id, timestamp) 建立索引以支援分頁讀取"""
+
+    chat_id = models.CharField(max_length=64)
+    content = models.TextField()
+    sender = models.CharField(max_length=16)
+    timestamp = models.FloatField()
+    metadata = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['timestamp', 'id']
+        indexes = [
+            models.Index(fields=['chat_id', 'timestamp'], name='chat_message_chat_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id} [{self.sender}] {self.content[:20]}"
+
+    def to_dict(self):
+        message = {
+            'chat_id': self.chat_id,
+            'content': self.content,
+            'sender': self.sender,
+            'timestamp': self.timestamp,
+        }
+        if self.metadata:
+            message['metadata'] = self.metadata
+        return message
+
+
+class ChatSummary(models.Model):
+    """對話摘要索引，於新增訊息時增量更新，歷史列表不必掃描所有訊息"""
+
+    chat_id = models.CharField(max_length=64, unique=True)
+    title = models.CharField(max_length=255, blank=True, default='')
+    last_message = models.TextField(blank=True, default='')
+    last_timestamp = models.FloatField(db_index=True)
+    message_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_timestamp']
+
+    def __str__(self):
+        return f"{self.chat_id} {self.title[:20]}"
@@ -0,0 +1,103 @@
+import itertools
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from .chat_history import DatabaseChatHistoryBackend, MemoryChatHistoryBackend
+from .models import ChatMessage, ChatSummary
+
+
+class _ClockMixin:
+    """以遞增的假時間寫入訊息，讓排序與游標不受執行速度影響"""
+
+    def setUp(self):
+        super().setUp()
+        clock = itertools.count(1000)
+        patcher = mock.patch('myapp.chat_history.time.time', side_effect=lambda: float(next(clock)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fill(self, backend):
+        backend.add_message('a', '糖尿病可以吃甜食嗎', 'user')
+        backend.add_message('a', '建議少量', 'bot')
+        backend.add_message('b', '高血壓要注意什麼', 'user')
+        backend.add_message('a', '那水果呢', 'user')
+
+
+class MemoryChatHistoryBackendTest(_ClockMixin, SimpleTestCase):
+    def test_history_pagination(self):
+        backend = MemoryChatHistoryBackend()
+        self.fill(backend)
+        contents = [m['content'] for m in backend.get_chat_history('a')]
+        self.assertEqual(contents, ['糖尿病可以吃甜食嗎', '建議少量', '那水果呢'])
+        self.assertEqual([m['content'] for m in backend.get_chat_history('a', offset=1, limit=1)], ['建議少量'])
+
+    def test_all_chats_cursor(self):
+        backend = MemoryChatHistoryBackend()
+        self.fill(backend)
+        chats = backend.get_all_chats()
+        self.assertEqual([c['id'] for c in chats], ['a', 'b'])
+        self.assertEqual(chats[0]['title'], '糖尿病可以吃甜食嗎')
+        self.assertEqual(chats[0]['last_message'], '那水果呢')
+        self.assertEqual([c['id'] for c in backend.get_all_chats(limit=1)], ['a'])
+        self.assertEqual([c['id'] for c in backend.get_all_chats(before=chats[0]['timestamp'])], ['b'])
+
+    def test_evicted_chat_leaves_summary_index(self):
+        backend = MemoryChatHistoryBackend(max_chats=1)
+        self.fill(backend)
+        self.assertEqual(backend.get_chat_history('b'), [])
+        self.assertEqual([c['id'] for c in backend.get_all_chats()], ['a'])
+
+    def test_delete_chat(self):
+        backend = MemoryChatHistoryBackend()
+        self.fill(backend)
+        self.assertTrue(backend.delete_chat('a'))
+        self.assertFalse(backend.delete_chat('a'))
+        self.assertEqual(backend.get_chat_history('a'), [])
+        self.assertEqual([c['id'] for c in backend.get_all_chats()], ['b'])
+
+
+class DatabaseChatHistoryBackendTest(_ClockMixin, TestCase):
+    def test_history_pagination(self):
+        backend = DatabaseChatHistoryBackend()
+        self.fill(backend)
+        contents = [m['content'] for m in backend.get_chat_history('a')]
+        self.assertEqual(contents, ['糖尿病可以吃甜食嗎', '建議少量', '那水果呢'])
+        self.assertEqual([m['content'] for m in backend.get_chat_history('a', offset=1, limit=1)], ['建議少量'])
+        self.assertEqual(ChatSummary.objects.get(chat_id='a').message_count, 3)
+
+    def test_all_chats_cursor(self):
+        backend = DatabaseChatHistoryBackend()
+        self.fill(backend)
+        chats = backend.get_all_chats()
+        self.assertEqual([c['id'] for c in chats], ['a', 'b'])
+        self.assertEqual(chats[0]['title'], '糖尿病可以吃甜食嗎')
+        self.assertEqual([c['id'] for c in backend.get_all_chats(limit=1)], ['a'])
+        self.assertEqual([c['id'] for c in backend.get_all_chats(before=chats[0]['timestamp'])], ['b'])
+
+    def test_reads_messages_written_by_other_worker(self):
+        worker, other = DatabaseChatHistoryBackend(), DatabaseChatHistoryBackend()
+        self.fill(worker)
+        self.assertEqual(len(worker.get_chat_history('a')), 3)
+        other.add_message('a', '香蕉可以嗎', 'user')
+        self.assertEqual(worker.get_chat_history('a')[-1]['content'], '香蕉可以嗎')
+
+    def test_deleted_chat_is_not_served_from_other_worker_cache(self):
+        worker, other = DatabaseChatHistoryBackend(), DatabaseChatHistoryBackend()
+        self.fill(worker)
+        self.assertEqual(len(worker.get_chat_history('a')), 3)
+        self.assertTrue(other.delete_chat('a'))
+        self.assertEqual(worker.get_chat_history('a'), [])
+        # 刪除後以相同 id 重新開始的對話不會帶出舊訊息
+        other.add_message('a', '新的問題', 'user')
+        self.assertEqual([m['content'] for m in worker.get_chat_history('a')], ['新的問題'])
+
+    def test_reloads_when_count_mismatches(self):
+        backend = DatabaseChatHistoryBackend()
+        self.fill(backend)
+        backend.get_chat_history('a')
+        last_id, messages = backend._cache.get('a')
+        # 模擬 id 較小、較晚提交而被 id__gt 略過的訊息
+        backend._cache.set('a', (last_id, messages[:-1]))
+        self.assertEqual(len(backend.get_chat_history('a')), 3)
+        self.assertEqual(ChatMessage.objects.filter(chat_id='a').count(), 3)
@@ -84,6 +84,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
 
+# 聊天 API 為 async view，建議以 ASGI 伺服器執行，例如：
+# uvicorn myproject.asgi:application --workers 2
+ASGI_APPLICATION = 'myproject.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -156,6 +160,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # 使用數據庫存儲會話
 SESSION_COOKIE_AGE = 1209600  # 2週，以秒為單位
 
+# 聊天歷史設置
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", 'myapp.chat_history.DatabaseChatHistoryBackend')
+CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "256"))  # 記憶體中最多快取的對話數
+CHAT_HISTORY_IDLE_SECONDS = int(os.getenv("CHAT_HISTORY_IDLE_SECONDS", "1800"))  # 閒置超過此秒數的對話移出快取
+
 # 日誌設置
 LOGGING = {
     'version': 1,
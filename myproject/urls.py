@@ -4,11 +4,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import RedirectView
-from myproject.views import ChatView, NewChatView, FileUploadView, ChatHistoryView
+from myproject.views import ChatView, ChatStreamView, NewChatView, FileUploadView, ChatHistoryView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("chat/", ChatView.as_view(), name="chat"),
+    path("chat/stream/", ChatStreamView.as_view(), name="chat_stream"),
     path("chat/new/", NewChatView.as_view(), name="new_chat"),
     path("chat/upload/", FileUploadView.as_view(), name="file_upload"),
     path("chat/history/", ChatHistoryView.as_view(), name="chat_history_all"),
@@ -1,6 +1,6 @@
 # 修正 views.py 文件的語法錯誤
 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -9,79 +9,45 @@ from django.conf import settings
 import logging
 import os
 import uuid
-from django.db import models
+from asgiref.sync import sync_to_async
+from myapp.chat_history import get_backend as get_history_backend
 
 # 設置日誌記錄
 logger = logging.getLogger(__name__)
 
-# 簡單的聊天歷史模型 (可替代為實際的數據庫模型)
+# 聊天歷史：委派給 settings.CHAT_HISTORY_BACKEND 指定的儲存後端
 class ChatHistory:
-    _chat_history = {}  # 用於內存儲存聊天記錄
     
     @classmethod
     def add_message(cls, chat_id, content, sender, metadata=None):
         """添加新消息到聊天歷史，支援額外元數據"""
-        import time
-        
-        if chat_id not in cls._chat_history:
-            cls._chat_history[chat_id] = []
-            
-        message = {
-            'chat_id': chat_id,
-            'content': content,
-            'sender': sender,
-            'timestamp': time.time()
-        }
-        
-        # 添加元數據（如位置信息）
-        if metadata:
-            message['metadata'] = metadata
-            
-        cls._chat_history[chat_id].append(message)
+        get_history_backend().add_message(chat_id, content, sender, metadata)
     
     @classmethod
-    def get_chat_history(cls, chat_id):
-        """獲取特定對話的歷史記錄"""
-        return cls._chat_history.get(chat_id, [])
+    async def aadd_message(cls, chat_id, content, sender, metadata=None):
+        """add_message 的非同步版本（資料庫存取需在同步執行緒中進行）"""
+        await sync_to_async(cls.add_message)(chat_id, content, sender, metadata)
     
     @classmethod
-    def get_all_chats(cls):
-        """獲取所有對話的摘要"""
-        chat_summaries = []
-        
-        for chat_id, messages in cls._chat_history.items():
-            if messages:
-                # 獲取第一條消息作為標題
-                first_message = next((m for m in messages if m['sender'] == 'user'), None)
-                title = first_message['content'] if first_message else "無標題對話"
-                
-                # 獲取最後一條消息時間作為排序依據
-                timestamp = messages[-1]['timestamp']
-                
-                chat_summaries.append({
-                    'id': chat_id,
-                    'title': title[:20] + '...' if len(title) > 20 else title,
-                    'last_message': messages[-1]['content'],
-                    'timestamp': timestamp
-                })
-        
-        # 按時間降序排序
-        chat_summaries.sort(key=lambda x: x['timestamp'], reverse=True)
-        return chat_summaries
+    def get_chat_history(cls, chat_id, offset=0, limit=None):
+        """獲取特定對話的歷史記錄，支援分頁"""
+        return get_history_backend().get_chat_history(chat_id, offset, limit)
+    
+    @classmethod
+    def get_all_chats(cls, before=None, limit=None):
+        """獲取對話摘要，依最後訊息時間降序，before 為分頁游標"""
+        return get_history_backend().get_all_chats(before, limit)
     
     @classmethod
     def delete_chat(cls, chat_id):
         """刪除對話記錄"""
-        if chat_id in cls._chat_history:
-            del cls._chat_history[chat_id]
-            return True
-        return False
+        return get_history_backend().delete_chat(chat_id)
 
 # 這裡導入您的 Neo4j 連接和 RAG 系統
 try:
     from neo4j import GraphDatabase
     # 修正導入路徑
-    from graph_rag_agent.ai_agent import generate_response
+    from graph_rag_agent.ai_agent import generate_response, agenerate_response, astream_response
 except ImportError:
     logger.error("Neo4j driver 或 ai_agent 模組未安裝或路徑不正確")
     
@@ -92,19 +58,63 @@ except ImportError:
             response += f"\n您查詢的位置是：{location_info.get('name', '未知地點')}，位於 {location_info.get('address', '未知地址')}。"
         return response
 
+    async def agenerate_response(message, session_id="default", location_info=None):
+        return {"output": generate_response(message, session_id, location_info)}
+
+    async def astream_response(message, session_id="default", location_info=None):
+        output = generate_response(message, session_id, location_info)
+        yield {"type": "token", "content": output}
+        yield {"type": "done", "output": output, "location": location_info, "data": {}}
+
+def normalize_location_info(location_info):
+    """處理位置信息 - 確保座標格式正確"""
+    if location_info and isinstance(location_info, dict):
+        # 提取並標準化座標
+        coords = location_info.get('coordinates')
+        if coords and isinstance(coords, str):
+            # 如果座標是字符串，確保格式正確
+            coords_parts = coords.replace(' ', '').split(',')
+            if len(coords_parts) == 2:
+                try:
+                    latitude = float(coords_parts[0])
+                    longitude = float(coords_parts[1])
+                    # 更新位置信息中的座標
+                    location_info['coordinates'] = f"{latitude},{longitude}"
+                    # 確保有經緯度屬性用於 AI 模型
+                    location_info['latitude'] = latitude
+                    location_info['longitude'] = longitude
+                    logger.info(f"位置座標已格式化: {latitude}, {longitude}")
+                except (ValueError, TypeError):
+                    logger.warning(f"無法解析座標: {coords}")
+    return location_info
+
+def build_context_prefix(user_message, location_info):
+    """建立傳給 Agent 的位置提示前綴"""
+    # 若是位置相關問題，可將提示一併傳入
+    is_location_query = any(k in user_message.lower() for k in ['位置', '附近', '醫院', '診所', '地點', '地圖'])
+
+    # 建立 prompt context
+    context_prefix = ""
+    if is_location_query and location_info:
+        context_prefix += f"使用者正在詢問與地點有關的問題，其目前的位置資訊如下：\n" \
+                        f"名稱：{location_info.get('name', '')}\n" \
+                        f"地址：{location_info.get('address', '')}\n" \
+                        f"座標：{location_info.get('coordinates', '')}\n\n"
+    return context_prefix
+
 class ChatView(View):
-    """處理聊天請求的視圖類"""
+    """處理聊天請求的視圖類（async view，在 ASGI 下等待 LLM 時不佔用 worker）"""
     
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
     
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         """處理 GET 請求 - 返回聊天頁面"""
         from django.shortcuts import render
         return render(request, 'myapp/index.html')
     
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         """處理 POST 請求 - 處理用戶訊息並返回回應"""
         try:
             # 解析 JSON 請求
@@ -124,52 +134,26 @@ class ChatView(View):
             # 獲取或創建會話 ID (同時支持 chat_id 和 session)
             session_id = chat_id or request.session.session_key
             if not session_id:
-                request.session.create()
+                await request.session.acreate()
                 session_id = request.session.session_key
             
             # 處理位置信息 - 確保座標格式正確
-            if location_info and isinstance(location_info, dict):
-                # 提取並標準化座標
-                coords = location_info.get('coordinates')
-                if coords and isinstance(coords, str):
-                    # 如果座標是字符串，確保格式正確
-                    coords_parts = coords.replace(' ', '').split(',')
-                    if len(coords_parts) == 2:
-                        try:
-                            latitude = float(coords_parts[0])
-                            longitude = float(coords_parts[1])
-                            # 更新位置信息中的座標
-                            location_info['coordinates'] = f"{latitude},{longitude}"
-                            # 確保有經緯度屬性用於 AI 模型
-                            location_info['latitude'] = latitude
-                            location_info['longitude'] = longitude
-                            logger.info(f"位置座標已格式化: {latitude}, {longitude}")
-                        except (ValueError, TypeError):
-                            logger.warning(f"無法解析座標: {coords}")
+            location_info = normalize_location_info(location_info)
             
             # 將用戶消息添加到歷史記錄，包含位置元數據
             metadata = {"location": location_info} if location_info else None
-            ChatHistory.add_message(session_id, user_message, 'user', metadata)
+            await ChatHistory.aadd_message(session_id, user_message, 'user', metadata)
             
             # 呼叫 RAG Agent 模型，傳入會話 ID 和位置信息
-            # 若是位置相關問題，可將提示一併傳入
-            is_location_query = any(k in user_message.lower() for k in ['位置', '附近', '醫院', '診所', '地點', '地圖'])
-
-            # 建立 prompt context
-            context_prefix = ""
-            if is_location_query and location_info:
-                context_prefix += f"使用者正在詢問與地點有關的問題，其目前的位置資訊如下：\n" \
-                                f"名稱：{location_info.get('name', '')}\n" \
-                                f"地址：{location_info.get('address', '')}\n" \
-                                f"座標：{location_info.get('coordinates', '')}\n\n"
+            context_prefix = build_context_prefix(user_message, location_info)
 
-            response_data = generate_response(context_prefix + user_message, session_id, location_info)
+            response_data = await agenerate_response(context_prefix + user_message, session_id, location_info)
 
             # 獲取輸出內容
             output_text = response_data.get('output', '')
 
             # 確保 Markdown 格式不會被轉義
-            ChatHistory.add_message(session_id, output_text, 'bot')
+            await ChatHistory.aadd_message(session_id, output_text, 'bot')
 
             return JsonResponse({
                 "output": output_text,
@@ -185,6 +169,57 @@ class ChatView(View):
             logger.exception("處理聊天請求時發生錯誤")
             return JsonResponse({"error": f"處理請求時發生錯誤: {str(e)}"}, status=500)
 
+class ChatStreamView(View):
+    """串流聊天回應（Server-Sent Events），邊產生邊送出工具狀態與回答文字"""
+    
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+    
+    @staticmethod
+    def _sse(event):
+        """將事件編碼為 SSE 格式"""
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    async def post(self, request, *args, **kwargs):
+        """處理 POST 請求 - 以 text/event-stream 回傳回應"""
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({"error": "無效的JSON格式"}, status=400)
+        
+        user_message = data.get("message")
+        chat_id = data.get("chat_id")
+        location_info = normalize_location_info(data.get("location_info"))
+        if not user_message:
+            return JsonResponse({"error": "請提供訊息"}, status=400)
+        
+        logger.info(f"收到串流訊息: {user_message}, 對話ID: {chat_id}")
+        
+        session_id = chat_id or request.session.session_key
+        if not session_id:
+            await request.session.acreate()
+            session_id = request.session.session_key
+        
+        metadata = {"location": location_info} if location_info else None
+        await ChatHistory.aadd_message(session_id, user_message, 'user', metadata)
+        context_prefix = build_context_prefix(user_message, location_info)
+        
+        async def event_stream():
+            try:
+                async for event in astream_response(context_prefix + user_message, session_id, location_info):
+                    if event["type"] in ("done", "error"):
+                        await ChatHistory.aadd_message(session_id, event.get("output", ""), 'bot')
+                    yield self._sse(event)
+            except Exception as e:
+                logger.exception("串流聊天回應時發生錯誤")
+                yield self._sse({"type": "error", "output": f"處理請求時發生錯誤: {str(e)}"})
+        
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream; charset=utf-8")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # 關閉 nginx 緩衝，確保即時送出
+        return response
+
 class NewChatView(View):
     """處理新對話請求的視圖類"""
     
@@ -223,12 +258,22 @@ class ChatHistoryView(View):
         """獲取特定對話的歷史記錄"""
         try:
             if not chat_id:
-                # 如果沒有提供 chat_id，返回所有對話摘要
-                chats = ChatHistory.get_all_chats()
-                return JsonResponse({"chats": chats})
+                # 如果沒有提供 chat_id，返回對話摘要（?before=&limit= 游標分頁）
+                before = request.GET.get('before')
+                before = float(before) if before else None
+                limit = request.GET.get('limit')
+                limit = min(max(int(limit), 1), 200) if limit else None
+                chats = ChatHistory.get_all_chats(before, limit)
+                response = {"chats": chats}
+                if limit is not None and len(chats) == limit:
+                    response["next_before"] = chats[-1]['timestamp']
+                return JsonResponse(response)
             
-            # 獲取特定對話的歷史記錄
-            messages = ChatHistory.get_chat_history(chat_id)
+            # 獲取特定對話的歷史記錄（?offset=&limit= 分頁）
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            limit = request.GET.get('limit')
+            limit = min(max(int(limit), 1), 500) if limit else None
+            messages = ChatHistory.get_chat_history(chat_id, offset, limit)
             
             # 格式化為前端需要的格式
             formatted_messages = []
@@ -245,8 +290,13 @@ class ChatHistoryView(View):
                 
                 formatted_messages.append(message_data)
             
-            return JsonResponse({"chat_id": chat_id, "messages": formatted_messages})
+            response = {"chat_id": chat_id, "messages": formatted_messages}
+            if limit is not None and len(formatted_messages) == limit:
+                response["next_offset"] = offset + limit
+            return JsonResponse(response)
             
+        except ValueError:
+            return JsonResponse({"error": "無效的分頁參數"}, status=400)
         except Exception as e:
             logger.exception("獲取聊天歷史時發生錯誤")
             return JsonResponse({"error": f"獲取聊天歷史時發生錯誤: {str(e)}"}, status=500)
@@ -10,6 +10,7 @@ window.MedApp = {
     apiRoot: window.appConfig?.apiRoot || '/',
     mapApiKey: window.appConfig?.mapApiKey || '',
     csrfToken: document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '',
+    streaming: window.appConfig?.streaming ?? true,  // 使用串流端點逐步顯示回應
     debug: true  // 啟用調試模式以便更容易追蹤問題
   },
   
@@ -103,36 +103,45 @@ MedApp.chat.core = {
     this.showLoading(true);
     
     try {
-      // 發送請求到服務器
-      const response = await fetch(MedApp.config.apiRoot || '/chat/', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': MedApp.config.csrfToken
-        },
-        body: JSON.stringify({
-          message: message,
-          chat_id: MedApp.state.currentChatId,
-          location_info: location
-        })
-      });
-      
-      // 隱藏載入中
-      this.showLoading(false);
+      let data;
+      let reply;
       
-      if (!response.ok) {
-        throw new Error(`伺服器回應錯誤: ${response.status}`);
+      if (MedApp.config.streaming !== false && window.ReadableStream && window.TextDecoder) {
+        // 串流模式：邊接收邊顯示回應
+        data = await this.streamMessage(message, location);
+        reply = data.output;
+      } else {
+        // 發送請求到服務器
+        const response = await fetch(MedApp.config.apiRoot || '/chat/', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': MedApp.config.csrfToken
+          },
+          body: JSON.stringify({
+            message: message,
+            chat_id: MedApp.state.currentChatId,
+            location_info: location
+          })
+        });
+        
+        // 隱藏載入中
+        this.showLoading(false);
+        
+        if (!response.ok) {
+          throw new Error(`伺服器回應錯誤: ${response.status}`);
+        }
+        
+        // 解析回應資料
+        data = await response.json();
+        
+        // 取得回應文本
+        reply = typeof data === 'string' ? data : (data.output || '（伺服器沒有回傳內容）');
+        
+        // 顯示回應
+        MedApp.chat.display.appendMessage(reply, 'bot');
       }
       
-      // 解析回應資料
-      const data = await response.json();
-      
-      // 取得回應文本
-      const reply = typeof data === 'string' ? data : (data.output || '（伺服器沒有回傳內容）');
-      
-      // 顯示回應
-      MedApp.chat.display.appendMessage(reply, 'bot');
-      
       // 儲存到聊天歷史
       MedApp.chat.history.saveMessageToStorage(MedApp.state.currentChatId, reply, 'bot');
       
@@ -161,6 +170,64 @@ MedApp.chat.core = {
     }
   },
   
+  // 以串流方式送出訊息（Server-Sent Events），逐步顯示工具狀態與回答文字
+  streamMessage: async function(message, location) {
+    const response = await fetch(`${MedApp.config.apiRoot || '/'}chat/stream/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+        'X-CSRFToken': MedApp.config.csrfToken
+      },
+      body: JSON.stringify({
+        message: message,
+        chat_id: MedApp.state.currentChatId,
+        location_info: location
+      })
+    });
+    
+    // 收到回應標頭即隱藏載入中，之後由串流訊息顯示進度
+    this.showLoading(false);
+    
+    if (!response.ok || !response.body) {
+      throw new Error(`伺服器回應錯誤: ${response.status}`);
+    }
+    
+    const bubble = MedApp.chat.display.createStreamingMessage();
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let result = {};
+    
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      
+      // SSE 事件以空行分隔
+      let separator;
+      while ((separator = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, separator);
+        buffer = buffer.slice(separator + 2);
+        
+        const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+        if (!dataLine) continue;
+        
+        const event = JSON.parse(dataLine.slice(6));
+        if (event.type === 'status') {
+          bubble && bubble.setStatus(event.message);
+        } else if (event.type === 'token') {
+          bubble && bubble.appendToken(event.content);
+        } else if (event.type === 'done' || event.type === 'error') {
+          result = event;
+        }
+      }
+    }
+    
+    const output = bubble ? bubble.finish(result.output) : result.output;
+    return Object.assign({}, result, { output: output || '（伺服器沒有回傳內容）' });
+  },
+  
   // 嘗試重新連接
   retryConnection: function() {
     fetch(MedApp.config.apiRoot || '/chat/', { method: 'GET' })
@@ -96,36 +96,7 @@ MedApp.chat.display = {
   
   // 當發送者是 bot 時，使用 Markdown 解析
   if (sender === 'bot' && typeof window.marked !== 'undefined') {
-    try {
-      // 檢查是否包含Markdown標記
-      const hasMarkdownSyntax = /(\*\*|__|\*|_|##|###|```|---|>|!\[|\[|\|-)/.test(content);
-      
-      // 預處理 Markdown 內容
-      content = this.preprocessMarkdown(content);
-      
-      // 使用 marked.js 將 Markdown 轉換為 HTML
-      contentWrapper.innerHTML = window.marked.parse(content);
-      
-      // 處理可能的特殊元素
-      this.postProcessMarkdown(contentWrapper);
-      
-      // 如果沒有明顯的Markdown語法但有HTML實體，可能需要解碼
-      if (!hasMarkdownSyntax && content.includes('&lt;')) {
-        // 嘗試解碼HTML實體
-        try {
-          const decoded = this.decodeHtmlEntities(content);
-          if (decoded !== content) {
-            contentWrapper.innerHTML = decoded;
-          }
-        } catch (e) {
-          console.warn('HTML實體解碼失敗:', e);
-        }
-      }
-    } catch (error) {
-      console.error('Markdown解析錯誤:', error);
-      // 如果解析失敗，退回到純文本顯示
-      contentWrapper.textContent = content;
-    }
+    this.renderBotContent(contentWrapper, content);
   } else {
     // 用戶消息使用純文本處理
     contentWrapper.textContent = content;
@@ -147,6 +118,113 @@ MedApp.chat.display = {
   this.scrollToBottom();
     },
 
+    // 以 Markdown 渲染機器人訊息內容
+    renderBotContent: function(contentWrapper, content) {
+      try {
+        // 檢查是否包含Markdown標記
+        const hasMarkdownSyntax = /(\*\*|__|\*|_|##|###|```|---|>|!\[|\[|\|-)/.test(content);
+
+        // 預處理 Markdown 內容
+        content = this.preprocessMarkdown(content);
+
+        // 使用 marked.js 將 Markdown 轉換為 HTML
+        contentWrapper.innerHTML = window.marked.parse(content);
+
+        // 處理可能的特殊元素
+        this.postProcessMarkdown(contentWrapper);
+
+        // 如果沒有明顯的Markdown語法但有HTML實體，可能需要解碼
+        if (!hasMarkdownSyntax && content.includes('&lt;')) {
+          // 嘗試解碼HTML實體
+          try {
+            const decoded = this.decodeHtmlEntities(content);
+            if (decoded !== content) {
+              contentWrapper.innerHTML = decoded;
+            }
+          } catch (e) {
+            console.warn('HTML實體解碼失敗:', e);
+          }
+        }
+      } catch (error) {
+        console.error('Markdown解析錯誤:', error);
+        // 如果解析失敗，退回到純文本顯示
+        contentWrapper.textContent = content;
+      }
+    },
+
+    // 建立串流中的機器人訊息，回傳可逐步更新內容的控制物件
+    createStreamingMessage: function() {
+      if (!this.elements.chatContainer) return null;
+
+      const messageDiv = document.createElement('div');
+      messageDiv.classList.add('message', 'bot', 'streaming');
+
+      const statusDiv = document.createElement('div');
+      statusDiv.className = 'message-status';
+      messageDiv.appendChild(statusDiv);
+
+      const contentWrapper = document.createElement('div');
+      contentWrapper.className = 'message-content';
+      messageDiv.appendChild(contentWrapper);
+
+      this.elements.chatContainer.appendChild(messageDiv);
+      this.scrollToBottom();
+
+      const display = this;
+      let text = '';
+      let renderPending = false;
+
+      // 以 requestAnimationFrame 節流，避免每個 token 都重新解析整段 Markdown
+      const scheduleRender = () => {
+        if (renderPending) return;
+        renderPending = true;
+        window.requestAnimationFrame(() => {
+          renderPending = false;
+          if (typeof window.marked !== 'undefined') {
+            display.renderBotContent(contentWrapper, text);
+          } else {
+            contentWrapper.textContent = text;
+          }
+          display.scrollToBottom();
+        });
+      };
+
+      return {
+        // 顯示工具執行狀態
+        setStatus: function(message) {
+          statusDiv.textContent = message || '';
+          statusDiv.style.display = message ? 'block' : 'none';
+        },
+        // 追加回答文字片段
+        appendToken: function(token) {
+          text += token;
+          statusDiv.style.display = 'none';
+          scheduleRender();
+        },
+        // 以完整回應結束串流
+        finish: function(finalText) {
+          if (typeof finalText === 'string' && finalText) {
+            text = finalText;
+          }
+          statusDiv.remove();
+          messageDiv.classList.remove('streaming');
+          if (typeof window.marked !== 'undefined') {
+            display.renderBotContent(contentWrapper, text);
+          } else {
+            contentWrapper.textContent = text;
+          }
+
+          const timeSpan = document.createElement('span');
+          timeSpan.classList.add('message-time');
+          const now = new Date();
+          timeSpan.textContent = `${now.getHours().toString().padStart(2, '0')}:${now.getMinutes().toString().padStart(2, '0')}`;
+          messageDiv.appendChild(timeSpan);
+          display.scrollToBottom();
+          return text;
+        }
+      };
+    },
+
     // 添加一個HTML實體解碼函數
     decodeHtmlEntities: function(str) {
       if (!str) return '';